@@ -164,13 +164,64 @@ DATABASES = {
 if 'DATABASE_URL' in os.environ:
     DATABASES['default'] = dj_database_url.config(conn_max_age=600, ssl_require=True)
 
+# One cache table shared by every process (web workers, daemons, backfill workers), so cached
+# market data and "only one refresh" claims hold across gunicorn workers. See core/cache.py.
 CACHES = {
     'default':{
-        'BACKEND':'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION':'unique-snowflake',
+        'BACKEND':'core.cache.InstrumentedDatabaseCache',
+        'LOCATION':'pandaledger_cache',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 50000))},
     }
 }
 
+# Backfill job queue (see `python manage.py run_backfill_worker`).
+# Web processes only enqueue; worker processes claim jobs with SELECT ... FOR UPDATE SKIP LOCKED.
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 1)) # pool size
+BACKFILL_MAX_TASKS_PER_CHILD = int(os.getenv('BACKFILL_MAX_TASKS_PER_CHILD', 50)) # recycle after N jobs
+BACKFILL_MAX_RSS_MB = int(os.getenv('BACKFILL_MAX_RSS_MB', 768)) # per-job ceiling (job aborted + retried)
+BACKFILL_ADDRESS_SPACE_MB = int(os.getenv('BACKFILL_ADDRESS_SPACE_MB', 2048)) # hard RLIMIT_AS cap per process, above its startup size (0 = off)
+BACKFILL_RECYCLE_RSS_MB = int(os.getenv('BACKFILL_RECYCLE_RSS_MB', 384)) # recycle a process that stays above this
+BACKFILL_MAX_ATTEMPTS = int(os.getenv('BACKFILL_MAX_ATTEMPTS', 3))
+BACKFILL_RETRY_DELAY_SECONDS = int(os.getenv('BACKFILL_RETRY_DELAY_SECONDS', 30)) # doubles per attempt
+# Coalescing: submissions for the same user within the debounce window merge into one job
+BACKFILL_DEBOUNCE_SECONDS = int(os.getenv('BACKFILL_DEBOUNCE_SECONDS', 5))
+BACKFILL_MAX_DELAY_SECONDS = int(os.getenv('BACKFILL_MAX_DELAY_SECONDS', 60))
+# Histories longer than this are rebuilt one calendar year at a time (flat peak memory)
+BACKFILL_STREAMING_THRESHOLD_DAYS = int(os.getenv('BACKFILL_STREAMING_THRESHOLD_DAYS', 5 * 365))
+
+# Where daily portfolio snapshots live:
+# 'rows'     -> one PortfolioSnapshot row per user per day
+# 'columnar' -> one compressed SnapshotBlock per user per year (see `compact_snapshots`)
+ANALYTICS_SNAPSHOT_STORAGE = os.getenv('ANALYTICS_SNAPSHOT_STORAGE', 'rows')
+
+# Market data source (see core/providers):
+# 'live' -> Yahoo + MFAPI, 'fixture' -> recorded responses on disk (offline), 'record' -> live + save fixtures
+PRICE_PROVIDER = os.getenv('PRICE_PROVIDER', 'live')
+PRICE_FIXTURE_DIR = os.getenv('PRICE_FIXTURE_DIR', str(BASE_DIR/'fixtures'/'prices'))
+PRICE_FIXTURE_LATENCY_MS = int(os.getenv('PRICE_FIXTURE_LATENCY_MS', 0)) # injected per call
+PRICE_FIXTURE_JITTER_MS = int(os.getenv('PRICE_FIXTURE_JITTER_MS', 0))
+
+# Live prices are refreshed by `python manage.py refresh_prices` (see Procfile), not by page views.
+# Set PRICE_REFRESH_ON_READ=True to go back to refreshing from the read endpoints (no daemon deployed).
+PRICE_REFRESH_ON_READ = os.getenv('PRICE_REFRESH_ON_READ', 'False') == 'True'
+PRICE_REFRESH_INTERVAL_SECONDS = int(os.getenv('PRICE_REFRESH_INTERVAL_SECONDS', 60)) # daemon tick
+PRICE_REFRESH_BATCH_SIZE = int(os.getenv('PRICE_REFRESH_BATCH_SIZE', 100))
+# Deadline mode for get_portfolio (`?wait_ms=`): wait this long for stale prices before responding (0 = off)
+PRICE_REFRESH_WAIT_MS = int(os.getenv('PRICE_REFRESH_WAIT_MS', 0))
+PRICE_REFRESH_MAX_WAIT_MS = int(os.getenv('PRICE_REFRESH_MAX_WAIT_MS', 2000)) # cap for the query parameter
+MARKET_REFRESH_INTERVAL_SECONDS = int(os.getenv('MARKET_REFRESH_INTERVAL_SECONDS', 60)) # dashboard tickers + news
+# AMFI's daily NAV file for every scheme, loaded by `python manage.py ingest_amfi_nav`
+AMFI_NAV_URL = os.getenv('AMFI_NAV_URL', 'https://www.amfiindia.com/spages/NAVAll.txt')
+
+# Outbound HTTP to MFAPI/Yahoo (see core/providers/http_client.py), limits are per host and per process
+HTTP_RATE_LIMIT_PER_SECOND = float(os.getenv('HTTP_RATE_LIMIT_PER_SECOND', 10)) # 0 = unlimited
+HTTP_RATE_BURST = int(os.getenv('HTTP_RATE_BURST', 20))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_SECONDS = float(os.getenv('HTTP_BACKOFF_SECONDS', 0.5)) # doubles per retry
+HTTP_BREAKER_FAILURES = int(os.getenv('HTTP_BREAKER_FAILURES', 5)) # consecutive failed calls (after retries) before failing fast
+HTTP_BREAKER_RESET_SECONDS = int(os.getenv('HTTP_BREAKER_RESET_SECONDS', 60))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10)) # keep-alive sockets per host
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -1,9 +1,31 @@
 from django.contrib import admin
-from .models import PortfolioSnapshot
+from .models import PortfolioSnapshot, AssetPriceHistory, BackfillJob, SnapshotBlock
 
 @admin.register(PortfolioSnapshot)
 class PortfolioSnapshotAdmin(admin.ModelAdmin):
     list_display = ('user', 'date', 'total_value', 'invested_value')
     list_filter = ('user', 'date')
     date_hierarchy = 'date'  # Adds a nice date navigation bar
-    ordering = ('-date',)    # Shows newest first
\ No newline at end of file
+    ordering = ('-date',)    # Shows newest first
+
+@admin.register(AssetPriceHistory)
+class AssetPriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ('asset', 'date', 'close')
+    search_fields = ('asset__symbol',)
+    date_hierarchy = 'date'
+    ordering = ('-date',)
+
+@admin.register(BackfillJob)
+class BackfillJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'from_date', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('user__username',)
+    ordering = ('-created_at',)
+
+
+@admin.register(SnapshotBlock)
+class SnapshotBlockAdmin(admin.ModelAdmin):
+    list_display = ('user', 'year', 'first_date', 'last_date', 'n_days')
+    search_fields = ('user__username',)
+    exclude = ('data',) # binary payload, not human editable
+    ordering = ('user', 'year')
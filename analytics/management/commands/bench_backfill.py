@@ -0,0 +1,187 @@
+import itertools
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from analytics.models import AssetPriceHistory
+from analytics.services.backfill import backfill_portfolio_history
+from core.providers.fixture import _file_name
+from portfolio.models import Asset, Holding, Transaction
+
+STAGES = ('load', 'fetch', 'timeline', 'valuation', 'write')
+BENCH_PREFIX = 'bench_backfill'
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def write_price_fixtures(root, symbols, years, seed=0):
+    """
+    Synthetic daily closes (weekday-only random walks) in the FixtureProvider layout,
+    so the benchmark never touches the network.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp(date.today()), periods=int(years * 261) + 10)
+    history = Path(root) / 'history'
+    history.mkdir(parents=True, exist_ok=True)
+    for symbol in symbols:
+        closes = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(dates))))
+        pd.Series(closes.round(4), index=dates.rename('date'), name='close').to_csv(history / _file_name(symbol, '.csv'))
+
+
+def create_synthetic_user(assets, n_assets, n_tx, years, rng):
+    """One user holding `n_assets` of the bench assets with `n_tx` trades spread over `years`."""
+    user = get_user_model().objects.create_user(username=f"{BENCH_PREFIX}_{n_assets}_{n_tx}_{years}")
+    holdings = Holding.objects.bulk_create([Holding(user=user, asset=a) for a in assets[:n_assets]])
+
+    start = date.today() - timedelta(days=365 * years)
+    offsets = np.sort(rng.integers(0, 365 * years, n_tx))
+    offsets[0] = 0 # history starts exactly `years` ago
+    cols = rng.integers(0, n_assets, n_tx)
+    sells = rng.random(n_tx) < 0.2
+
+    # bulk_create skips signals: no backfill jobs are queued for the synthetic trades
+    Transaction.objects.bulk_create([
+        Transaction(holding=holdings[col], type='SELL' if sell else 'BUY',
+                    quantity=round(float(qty), 4), price=round(float(price), 2), date=start + timedelta(days=int(off)))
+        for off, col, sell, qty, price in zip(offsets, cols, sells, rng.uniform(1, 50, n_tx), rng.uniform(50, 500, n_tx))
+    ], batch_size=5000)
+    return user
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks backfill_portfolio_history per stage on synthetic portfolios with offline price fixtures. '
+            'Prints JSON (wall time, peak memory, rows written per case).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assets', type=_int_list, default=[1, 20, 200], help='Comma-separated asset counts')
+        parser.add_argument('--transactions', type=_int_list, default=[10, 1000, 10000], help='Comma-separated transaction counts')
+        parser.add_argument('--years', type=_int_list, default=[1, 10, 30], help='Comma-separated history lengths')
+        parser.add_argument('--repeat', type=int, default=3, help='Best-of-N timing per case')
+        parser.add_argument('--warm-prices', action='store_true',
+                            help='Keep the price store between runs (measures the steady state instead of a cold fetch)')
+        parser.add_argument('--latency-ms', type=int, default=0, help='Injected provider latency per call')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--compare', help='Previous JSON report: flag cases whose wall time regressed')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown vs --compare (0.25 = 25%%)')
+        parser.add_argument('--streaming', choices=['auto', 'on', 'off'], default='auto',
+                            help='Year-chunked backfill: forced on/off, or by BACKFILL_STREAMING_THRESHOLD_DAYS')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if get_user_model().objects.filter(username__startswith=BENCH_PREFIX).exists():
+            raise CommandError(f"Leftover '{BENCH_PREFIX}_*' users found; delete them before benchmarking.")
+
+        matrix = list(itertools.product(options['assets'], options['transactions'], options['years']))
+        max_assets, max_years = max(options['assets']), max(options['years'])
+
+        with tempfile.TemporaryDirectory() as fixture_dir:
+            symbols = [f"BENCH{i}.NS" for i in range(max_assets)]
+            write_price_fixtures(fixture_dir, symbols, max_years, seed=options['seed'])
+            assets = [Asset.objects.get_or_create(symbol=s, defaults={'name': f"Bench {s}"})[0] for s in symbols]
+
+            try:
+                with override_settings(PRICE_PROVIDER='fixture', PRICE_FIXTURE_DIR=fixture_dir,
+                                       PRICE_FIXTURE_LATENCY_MS=options['latency_ms'], PRICE_FIXTURE_JITTER_MS=0):
+                    cases = [self.run_case(assets, *case, options) for case in matrix]
+            finally:
+                get_user_model().objects.filter(username__startswith=BENCH_PREFIX).delete()
+                Asset.objects.filter(id__in=[a.id for a in assets]).delete() # cascades to the price store
+
+        report = {
+            "meta": {
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "platform": platform.platform(),
+                "database": connection.vendor,
+                "snapshot_storage": settings.ANALYTICS_SNAPSHOT_STORAGE,
+                "repeat": options['repeat'],
+                "warm_prices": options['warm_prices'],
+                "latency_ms": options['latency_ms'],
+                "streaming": options['streaming'],
+            },
+            "cases": cases,
+        }
+
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(payload)
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(payload)
+
+        if options['compare']:
+            self.compare(report, json.loads(Path(options['compare']).read_text()), options['tolerance'])
+
+    def run_case(self, assets, n_assets, n_tx, years, options):
+        n_assets = min(n_assets, n_tx) # every asset needs at least one trade
+        rng = np.random.default_rng(options['seed'])
+        user = create_synthetic_user(assets, n_assets, n_tx, years, rng)
+        asset_ids = [a.id for a in assets[:n_assets]]
+        streaming = {'auto': None, 'on': True, 'off': False}[options['streaming']]
+
+        def reset_prices():
+            if not options['warm_prices']:
+                AssetPriceHistory.objects.filter(asset_id__in=asset_ids).delete()
+                cache.delete_many([f"price_history_synced_{i}" for i in asset_ids])
+
+        best = None
+        for _ in range(max(options['repeat'], 1)):
+            reset_prices()
+            timings = {}
+            started = time.perf_counter()
+            rows = backfill_portfolio_history(user, timings=timings, streaming=streaming)
+            wall = time.perf_counter() - started
+            if best is None or wall < best[0]:
+                best = (wall, timings, rows)
+
+        # Separate pass for memory: tracemalloc slows allocations down, so it never runs during timing
+        reset_prices()
+        tracemalloc.start()
+        backfill_portfolio_history(user, streaming=streaming)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        wall, timings, rows = best
+        result = {
+            "assets": n_assets,
+            "transactions": n_tx,
+            "years": years,
+            "wall_ms": round(wall * 1000, 2),
+            "stages_ms": {stage: round(timings.get(stage, 0.0) * 1000, 2) for stage in STAGES},
+            "peak_traced_mb": round(peak / (1024 * 1024), 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "rows_written": rows,
+        }
+        self.stderr.write(f"  {n_assets:>4} assets {n_tx:>6} tx {years:>2}y -> {result['wall_ms']:>9.1f} ms, {rows} rows")
+        user.delete()
+        return result
+
+    def compare(self, report, baseline, tolerance):
+        key = lambda c: (c['assets'], c['transactions'], c['years'])
+        previous = {key(c): c for c in baseline.get('cases', [])}
+
+        regressions = []
+        for case in report['cases']:
+            old = previous.get(key(case))
+            if old and case['wall_ms'] > old['wall_ms'] * (1 + tolerance):
+                regressions.append(f"{key(case)}: {old['wall_ms']} ms -> {case['wall_ms']} ms")
+
+        if regressions:
+            raise CommandError("Backfill regressions:\n  " + "\n  ".join(regressions))
+        self.stderr.write(self.style.SUCCESS(f"No regressions beyond {tolerance:.0%} vs {len(previous)} baseline cases."))
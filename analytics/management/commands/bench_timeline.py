@@ -0,0 +1,62 @@
+import time
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from analytics.services.backfill import build_holdings_timeline
+
+
+def legacy_timeline(all_dates, symbols, day_offsets, asset_cols, signed_qty, cash_flows):
+    """The pre-vectorization Step 5: one `.loc` write per transaction (kept as the baseline)."""
+    holdings_df = pd.DataFrame(0.0, index=all_dates, columns=symbols)
+    invested_df = pd.DataFrame(0.0, index=all_dates, columns=['invested_cash'])
+
+    for off, col, qty, cash in zip(day_offsets, asset_cols, signed_qty, cash_flows):
+        tx_date = all_dates[off]
+        holdings_df.loc[tx_date, symbols[col]] += qty
+        invested_df.loc[tx_date, 'invested_cash'] += cash
+
+    return holdings_df.cumsum().to_numpy(), invested_df.cumsum()['invested_cash'].to_numpy()
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the vectorized holdings timeline against the legacy per-transaction loop (no DB/network).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=5000)
+        parser.add_argument('--assets', type=int, default=50)
+        parser.add_argument('--years', type=int, default=15)
+        parser.add_argument('--repeat', type=int, default=3, help='Best-of-N timing for each engine')
+
+    def handle(self, *args, **options):
+        n_tx, n_assets, years = options['transactions'], options['assets'], options['years']
+        rng = np.random.default_rng(42)
+
+        all_dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=365 * years, freq='D')
+        symbols = [f"SYM{i}" for i in range(n_assets)]
+        day_offsets = np.sort(rng.integers(0, len(all_dates), n_tx))
+        asset_cols = rng.integers(0, n_assets, n_tx)
+        signed_qty = rng.uniform(1, 100, n_tx) * np.where(rng.random(n_tx) < 0.8, 1.0, -1.0)
+        cash_flows = signed_qty * rng.uniform(10, 5000, n_tx)
+
+        self.stdout.write(f"Timeline: {len(all_dates)} days x {n_assets} assets, {n_tx} transactions")
+
+        def best_of(fn):
+            timings = []
+            for _ in range(options['repeat']):
+                t0 = time.perf_counter()
+                result = fn()
+                timings.append(time.perf_counter() - t0)
+            return min(timings), result
+
+        legacy_s, (legacy_h, legacy_i) = best_of(lambda: legacy_timeline(
+            all_dates, symbols, day_offsets, asset_cols, signed_qty, cash_flows))
+        vector_s, (vector_h, vector_i) = best_of(lambda: build_holdings_timeline(
+            len(all_dates), day_offsets, asset_cols, signed_qty, cash_flows, opening_qty=np.zeros(n_assets)))
+
+        if not (np.allclose(legacy_h, vector_h) and np.allclose(legacy_i, vector_i)):
+            self.stdout.write(self.style.ERROR("Mismatch between legacy and vectorized timelines!"))
+            return
+
+        self.stdout.write(f"Legacy loop:  {legacy_s * 1000:.1f} ms")
+        self.stdout.write(f"Vectorized:   {vector_s * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {legacy_s / vector_s:.1f}x (results identical)"))
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from analytics.services.snapshot_store import compact_user_rows
+
+
+class Command(BaseCommand):
+    help = 'Converts PortfolioSnapshot rows into columnar SnapshotBlocks (run before switching ANALYTICS_SNAPSHOT_STORAGE to "columnar").'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only compact this username')
+        parser.add_argument('--delete-rows', action='store_true', help='Delete the rows once their blocks are written')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(snapshots__isnull=False).distinct()
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        total_days = 0
+        for user in users.iterator():
+            days = compact_user_rows(user, delete_rows=options['delete_rows'])
+            total_days += days
+            self.stdout.write(f"  {user.username}: {days} days")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Compacted {total_days} snapshots into yearly blocks."))
@@ -0,0 +1,145 @@
+import logging
+import multiprocessing
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from analytics.services.jobs import (
+    claim_next_job, run_job, requeue_stale_jobs, queue_depth, current_rss_mb, limit_address_space,
+)
+
+logger = logging.getLogger(__name__)
+
+# Set from signal handlers. Handlers only flip this flag: touching a multiprocessing.Event
+# from inside a handler can deadlock against a wait() in progress on the same thread.
+_stop_requested = False
+
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+
+
+def work_loop(poll_interval, stale_after, stop_event, max_tasks=0, max_rss_mb=0, recycle_rss_mb=0, address_space_mb=0):
+    """
+    One pool process: claim -> run -> repeat until asked to stop or due for recycling.
+    A job in progress is always finished before the loop exits (graceful deploys).
+
+    Recycling (the supervisor respawns a fresh process):
+    - after `max_tasks` jobs (like multiprocessing's maxtasksperchild)
+    - when RSS after a job is above `recycle_rss_mb`, since pandas rarely hands freed
+      memory back to the OS; exiting the process is the only reliable way to do that.
+    A single job whose RSS crosses `max_rss_mb` is aborted and retried later. That check runs
+    between stages; `address_space_mb` adds a hard cap (see `limit_address_space`) so one
+    oversized allocation fails as a MemoryError inside the job rather than OOM-killing the process.
+    """
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    if address_space_mb:
+        limit = limit_address_space(address_space_mb)
+        if limit:
+            logger.info(f"Backfill worker address space capped at {limit:.0f} MB.")
+    close_old_connections()
+    last_sweep = 0.0
+    jobs_done = 0
+
+    while not (_stop_requested or stop_event.is_set()):
+        try:
+            # Recover jobs orphaned by a crashed/killed worker
+            if time.monotonic() - last_sweep > stale_after / 2:
+                requeue_stale_jobs(stale_after)
+                logger.info(f"Backfill queue depth: {queue_depth()}")
+                last_sweep = time.monotonic()
+
+            job = claim_next_job()
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            run_job(job, max_rss_mb=max_rss_mb)
+            jobs_done += 1
+        except Exception as e:
+            # DB hiccups (dropped connection etc.) should not kill the worker
+            logger.error(f"Backfill worker error: {e}", exc_info=True)
+            time.sleep(poll_interval)
+        finally:
+            close_old_connections()
+
+        if max_tasks and jobs_done >= max_tasks:
+            logger.info(f"Recycling backfill worker after {jobs_done} jobs.")
+            return
+        rss = current_rss_mb()
+        if recycle_rss_mb and rss > recycle_rss_mb:
+            logger.info(f"Recycling backfill worker: RSS {rss:.0f} MB > {recycle_rss_mb} MB.")
+            return
+
+
+class Command(BaseCommand):
+    help = 'Runs a supervised pool of backfill worker processes that drain the durable BackfillJob queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', '--pool-size', dest='workers', type=int, default=settings.BACKFILL_WORKERS,
+                            help='Number of worker processes (default: BACKFILL_WORKERS)')
+        parser.add_argument('--max-tasks-per-child', type=int, default=settings.BACKFILL_MAX_TASKS_PER_CHILD,
+                            help='Recycle a worker process after this many jobs (0 = never)')
+        parser.add_argument('--max-rss-mb', type=int, default=settings.BACKFILL_MAX_RSS_MB,
+                            help='Per-job RSS ceiling; a job crossing it is aborted and retried (0 = off)')
+        parser.add_argument('--address-space-mb', type=int, default=settings.BACKFILL_ADDRESS_SPACE_MB,
+                            help='Hard address-space cap per worker process, above its size at startup (0 = off)')
+        parser.add_argument('--recycle-rss-mb', type=int, default=settings.BACKFILL_RECYCLE_RSS_MB,
+                            help='Recycle a worker process whose RSS stays above this after a job (0 = off)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=900,
+                            help='Re-queue RUNNING jobs without a heartbeat for this many seconds (worker lost)')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue in this process and exit (no polling)')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = 0
+            while (job := claim_next_job()) is not None:
+                run_job(job, max_rss_mb=options['max_rss_mb'])
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"Queue drained. Processed {processed} job(s)."))
+            return
+
+        signal.signal(signal.SIGTERM, _request_stop)
+        signal.signal(signal.SIGINT, _request_stop)
+
+        stop_event = multiprocessing.Event()
+        loop_args = (options['poll_interval'], options['stale_after'], stop_event,
+                     options['max_tasks_per_child'], options['max_rss_mb'], options['recycle_rss_mb'],
+                     options['address_space_mb'])
+        n_workers = max(options['workers'], 1)
+        self.stdout.write(f"Starting {n_workers} backfill worker process(es)...")
+
+        # Forked children must not share the parent's DB connection.
+        # The supervisor itself never runs pandas work, so it stays small.
+        connections.close_all()
+
+        def spawn(i):
+            proc = multiprocessing.Process(target=work_loop, args=loop_args, name=f"backfill-worker-{i}", daemon=False)
+            proc.start()
+            return proc
+
+        procs = [spawn(i) for i in range(n_workers)]
+
+        # Supervisor: keep the pool at full size (recycled or crashed processes are replaced)
+        while not _stop_requested:
+            for i, proc in enumerate(procs):
+                if not proc.is_alive():
+                    if proc.exitcode != 0:
+                        logger.warning(f"{proc.name} died (code {proc.exitcode}). Respawning...")
+                    procs[i] = spawn(i)
+            time.sleep(1.0)
+
+        logger.info("Backfill workers shutting down (finishing current jobs)...")
+        stop_event.set()
+        for proc in procs:
+            proc.join(timeout=60)
+            if proc.is_alive():
+                proc.terminate()
+
+        self.stdout.write(self.style.SUCCESS("Backfill workers stopped."))
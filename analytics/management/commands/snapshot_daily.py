@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from analytics.services.daily_snapshot import snapshot_all_users
+from core.utils import get_logical_date
+
+
+class Command(BaseCommand):
+    help = "Appends today's PortfolioSnapshot for every user in one set-based pass (run nightly after 4am IST)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Logical date to snapshot (YYYY-MM-DD). Defaults to the current IST logical date.')
+        parser.add_argument('--no-sync', action='store_true', help='Use stored prices only (skip the provider tail sync)')
+
+    def handle(self, *args, **options):
+        day = parse_date(options['date']) if options['date'] else get_logical_date()
+        if day is None:
+            raise CommandError(f"Invalid --date: {options['date']}")
+
+        self.stdout.write(f"Snapshotting all portfolios for {day}...")
+        written = snapshot_all_users(day, sync_prices=not options['no_sync'])
+        self.stdout.write(self.style.SUCCESS(f"Done. Wrote {written} snapshots."))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('portfolio', '0003_asset_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Trading date of the bar')),
+                ('close', models.DecimalField(decimal_places=4, help_text='Closing price (or NAV for Mutual Funds)', max_digits=15)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='portfolio.asset')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('asset', 'date')},
+            },
+        ),
+    ]
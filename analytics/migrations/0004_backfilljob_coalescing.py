@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_backfilljob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backfilljob',
+            name='superseded',
+            field=models.BooleanField(default=False, help_text='Set when new edits arrive while the job is running; the job aborts and a fresh one takes over'),
+        ),
+        migrations.AlterField(
+            model_name='backfilljob',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed'), ('SUPERSEDED', 'Superseded')], default='PENDING', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='backfilljob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'PENDING')), fields=('user',), name='one_pending_backfill_per_user'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_backfilljob_coalescing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('n_days', models.PositiveSmallIntegerField(help_text='Number of stored days in the block')),
+                ('data', models.BinaryField(help_text='zlib-compressed, delta-encoded paise arrays')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot_blocks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['year'],
+                'unique_together': {('user', 'year')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_snapshotblock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfoliosnapshot',
+            name='benchmark_value',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Optional: Value of a benchmark index (e.g., Nifty 50) for comparison', max_digits=15, null=True),
+        ),
+        migrations.AlterField(
+            model_name='portfoliosnapshot',
+            name='date',
+            field=models.DateField(help_text='The date of the snapshot recording'),
+        ),
+        migrations.AlterField(
+            model_name='portfoliosnapshot',
+            name='invested_value',
+            field=models.DecimalField(decimal_places=2, help_text='Total capital invested', max_digits=15),
+        ),
+        migrations.AlterField(
+            model_name='portfoliosnapshot',
+            name='total_value',
+            field=models.DecimalField(decimal_places=2, help_text='Total current market value of the portfolio', max_digits=15),
+        ),
+        migrations.AlterField(
+            model_name='portfoliosnapshot',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
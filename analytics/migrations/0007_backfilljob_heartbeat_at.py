@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_portfoliosnapshot_field_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backfilljob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the running worker; jobs whose heartbeat goes stale are re-queued', null=True),
+        ),
+    ]
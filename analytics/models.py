@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class PortfolioSnapshot(models.Model):
     """
@@ -42,3 +43,92 @@ class PortfolioSnapshot(models.Model):
         if self.invested_value == 0:
             return 0
         return round(((self.total_value - self.invested_value) / self.invested_value) * 100, 2)
+
+
+class AssetPriceHistory(models.Model):
+    """
+    Stores one daily closing price per asset, shared by every user holding it.
+
+    Backfills read prices from here instead of downloading the full range from
+    Yahoo/MFAPI on every run. The sync service only asks providers for the
+    dates after the last stored bar, so each asset is paid for once per day.
+    """
+    asset = models.ForeignKey('portfolio.Asset', on_delete=models.CASCADE, related_name="price_history")
+    date = models.DateField(help_text="Trading date of the bar")
+    close = models.DecimalField(max_digits=15, decimal_places=4, help_text="Closing price (or NAV for Mutual Funds)")
+
+    class Meta:
+        unique_together = ('asset', 'date') # One bar per asset per day
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.asset.symbol} | {self.date} | {self.close}"
+
+
+class BackfillJob(models.Model):
+    """
+    A durable unit of backfill work, queued by web processes and executed by
+    the `run_backfill_worker` management command.
+
+    Living in the database (instead of an in-memory executor) means queued work
+    survives restarts/deploys and every worker process shares one queue.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+        ('SUPERSEDED', 'Superseded'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="backfill_jobs")
+    from_date = models.DateField(null=True, blank=True, help_text="Earliest dirty date (empty = full rebuild)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    superseded = models.BooleanField(default=False, help_text="Set when new edits arrive while the job is running; the job aborts and a fresh one takes over")
+
+    # Retry bookkeeping
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Job is not claimed before this time (retry backoff)")
+    last_error = models.TextField(blank=True, default='')
+
+    worker = models.CharField(max_length=100, blank=True, default='', help_text="host:pid of the worker that claimed the job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the running worker; jobs whose heartbeat goes stale are re-queued")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at'] # FIFO
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        constraints = [
+            # Coalescing: a user never has more than one job waiting in the queue
+            models.UniqueConstraint(fields=['user'], condition=models.Q(status='PENDING'), name='one_pending_backfill_per_user'),
+        ]
+
+    def __str__(self):
+        return f"Backfill #{self.id} | {self.user.username} | {self.status}"
+
+
+class SnapshotBlock(models.Model):
+    """
+    Columnar storage for one user's daily snapshots in one calendar year.
+
+    Instead of ~365 `PortfolioSnapshot` rows, a year is a single row holding three
+    compressed integer arrays (day offsets, total value and invested value in paise).
+    Reads return NumPy arrays directly (see `analytics.services.snapshot_store`).
+    Used when `ANALYTICS_SNAPSHOT_STORAGE = 'columnar'`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="snapshot_blocks")
+    year = models.PositiveSmallIntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    n_days = models.PositiveSmallIntegerField(help_text="Number of stored days in the block")
+    data = models.BinaryField(help_text="zlib-compressed, delta-encoded paise arrays")
+
+    class Meta:
+        unique_together = ('user', 'year') # One block per user per year
+        ordering = ['year']
+
+    def __str__(self):
+        return f"{self.user.username} | {self.year} | {self.n_days} days"
@@ -1,190 +1,293 @@
 import logging
-import yfinance as yf
+import time
+import numpy as np
 import pandas as pd
-import requests
-from datetime import date, datetime, timedelta
-from django.db import transaction
-from portfolio.models import Transaction
-from analytics.models import PortfolioSnapshot
-from django.db import close_old_connections
-from analytics.models import PortfolioSnapshot
+from datetime import date, timedelta
+from django.conf import settings
+from django.db.models import Sum, Case, When, F, DecimalField, FloatField
+from django.db.models.functions import Cast
+from portfolio.models import Asset, Transaction
+from analytics.services.price_history import sync_price_history, load_price_frame
+from analytics.services.snapshot_store import last_snapshot_date, write_history
+from analytics.services.fixed_point import (
+    QTY_SCALE, CASH_SCALE, to_qty_units, to_paise, decimal_to_units, cash_to_paise,
+)
+from django.db import close_old_connections, transaction
 
 def get_last_snapshot_date(user):
     """
     Service interface for other apps to safely check analytics state
     without directly importing the models.
     """
-    latest = PortfolioSnapshot.objects.filter(user=user).order_by('-date').first()
-    return latest.date if latest else None
+    return last_snapshot_date(user)
 
 logger = logging.getLogger(__name__)
 
-def backfill_portfolio_history(user):
+
+class BackfillSuperseded(Exception):
+    """Raised when newer edits arrived mid-run and the result would already be stale."""
+
+def signed_by_type(expr):
+    """SQL expression: +expr for BUY, -expr for SELL."""
+    return Case(When(type='SELL', then=-expr), default=expr, output_field=DecimalField(max_digits=30, decimal_places=6))
+
+
+def get_opening_state(user, as_of):
+    """
+    Restores the holdings state as of `as_of` (exclusive) in a single aggregate query.
+
+    Returns:
+        tuple[dict, int]: ({asset_id: quantity in 1e-4 units}, invested cash in 1e-4 paise)
+        accumulated from every transaction dated strictly before `as_of`. Both are exact
+        (converted from the Decimal aggregates), see `fixed_point`.
+    """
+    rows = (Transaction.objects.filter(holding__user=user, date__lt=as_of)
+            .values('holding__asset_id')
+            .annotate(qty=Sum(signed_by_type(F('quantity'))), cash=Sum(signed_by_type(F('quantity') * F('price')))))
+
+    quantities = {r['holding__asset_id']: decimal_to_units(r['qty'], QTY_SCALE) for r in rows if r['qty']}
+    invested = sum(decimal_to_units(r['cash'], CASH_SCALE) for r in rows)
+    return {asset_id: qty for asset_id, qty in quantities.items() if qty}, invested
+
+
+def build_holdings_timeline(n_days, day_offsets, asset_cols, signed_qty, cash_flows,
+                            opening_qty=None, opening_invested=0):
+    """
+    Broadcasts transactions onto a dense (days x assets) timeline and accumulates it.
+
+    Every argument is a columnar array (one entry per transaction); deltas are scattered
+    with `np.add.at` on integer day offsets, then a single `cumsum` turns them into
+    daily positions. Transactions outside [0, n_days) are ignored.
+
+    The output dtype follows the inputs: the backfill passes int64 fixed-point arrays
+    (exact, reproducible sums), plain floats work too.
+
+    Args:
+        n_days (int): Length of the timeline.
+        day_offsets (np.ndarray[int]): Days since the first timeline day.
+        asset_cols (np.ndarray[int]): Column index of each transaction's asset.
+        signed_qty (np.ndarray): +qty for BUY, -qty for SELL.
+        cash_flows (np.ndarray): +qty*price for BUY, -qty*price for SELL.
+        opening_qty (np.ndarray, optional): Position per column before day 0.
+        opening_invested (int | float): Invested cash before day 0.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (daily holdings [n_days x n_assets], daily invested [n_days]).
+    """
+    n_assets = len(opening_qty) if opening_qty is not None else int(asset_cols.max(initial=-1)) + 1
+    in_range = (day_offsets >= 0) & (day_offsets < n_days)
+    day_offsets = day_offsets[in_range]
+
+    holdings = np.zeros((n_days, n_assets), dtype=np.result_type(signed_qty, opening_qty if opening_qty is not None else signed_qty))
+    np.add.at(holdings, (day_offsets, asset_cols[in_range]), signed_qty[in_range])
+    invested = np.zeros(n_days, dtype=np.result_type(cash_flows, opening_invested))
+    np.add.at(invested, day_offsets, cash_flows[in_range])
+
+    if n_days:
+        if opening_qty is not None:
+            holdings[0] += opening_qty
+        invested[0] += opening_invested
+
+    return holdings.cumsum(axis=0), invested.cumsum()
+
+
+def iter_year_chunks(start_date, end_date):
+    """Yields (chunk_start, chunk_end) calendar-year slices covering [start_date, end_date]."""
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(date(chunk_start.year, 12, 31), end_date)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def backfill_portfolio_history(user, from_date=None, should_abort=None, timings=None, streaming=None):
     """
-    Reconstructs the entire historical value of a user's portfolio.
+    Reconstructs the historical value of a user's portfolio.
 
     Strategy (Hybrid Engine):
-    1. Fetches all historical transactions for the user.
+    1. Fetches the historical transactions for the user.
     2. Identifies all unique assets.
+    3. Syncs the shared `AssetPriceHistory` store (missing tail only) and reads prices locally.
         - Stocks/Crypto -> Yahoo Finance
         - Mutual Funds -> MFAPI (India)
-    3. Downloads historical price data for the entire date range.
     4. Replays changes in holdings day-by-day (Cumulative Sum).
     5. Calculates Daily Value = (Daily Holdings * Daily Price).
-    6. Stores the result as daily `PortfolioSnapshot` records.
+    6. Stores the result as daily snapshots (`PortfolioSnapshot` rows or columnar `SnapshotBlock`s).
+
+    Incremental mode:
+    When `from_date` is given (the earliest date touched by an edit), the holdings state
+    as of that date is restored with one aggregate query, only the later days are
+    recomputed, and just those snapshots are upserted. Rows before `from_date`
+    are left untouched. Without it, the whole history is rebuilt from scratch.
+
+    Streaming mode:
+    Long histories are processed one calendar year at a time: the closing holdings,
+    invested cash and last known prices of each chunk seed the next one, and every
+    chunk is written before the next is loaded. Peak memory is then bounded by one
+    year x assets instead of growing with the length of the history. All chunks commit
+    together, so an aborted run leaves the previous history intact.
 
     Args:
         user (User): The user instance to backfill data for.
+        from_date (date, optional): Earliest dirty date. None means a full rebuild.
+        should_abort (callable, optional): Polled between stages; returning True raises
+            `BackfillSuperseded` so the job queue can restart from the new state.
+        timings (dict, optional): Filled with seconds spent per stage
+            (load, fetch, timeline, valuation, write). Used by `bench_backfill`.
+        streaming (bool, optional): Force year-chunked processing on/off. By default it kicks
+            in when the range is longer than `BACKFILL_STREAMING_THRESHOLD_DAYS`.
+
+    Returns:
+        int: Number of snapshots written.
     """
+    def checkpoint(stage):
+        if should_abort and should_abort():
+            raise BackfillSuperseded(f"Superseded before {stage}")
+
+    clock = [time.perf_counter()]
+    def lap(stage):
+        now = time.perf_counter()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + (now - clock[0])
+        clock[0] = now
+
     try:
         # important to close the old connections and start a fresh connection in a thread which is intented to work for a lomgtime in async mode
         close_old_connections()
-        # 1. Fetch Transactions
-        txs = list(Transaction.objects.filter(holding__user=user)
-                   .select_related('holding__asset')
-                   .order_by('date'))
-        
-        if not txs:
-            logger.info(f"No transactions found for user {user.username}. Skipping backfill.")
-            return
+        end_date = date.today()
+        min_date = end_date - timedelta(days=365 * 30) # 30-year safety cap
+        incremental = from_date is not None
+
+        # 1. Fetch Transactions (columnar: one tuple per row, no model instances)
+        tx_qs = Transaction.objects.filter(holding__user=user)
+        if incremental:
+            tx_qs = tx_qs.filter(date__gte=from_date)
+        tx_rows = list(tx_qs.order_by('date').values_list(
+            'holding__asset_id', 'date', 'type',
+            Cast('quantity', FloatField()), Cast('price', FloatField()),
+        ))
 
         # 2. Determine Time Range
-        start_date = txs[0].date
-        min_date = date.today() - timedelta(days=365 * 30) # 30-year safety cap
-        if start_date < min_date:
+        if incremental:
+            start_date = max(from_date, min_date)
+        elif tx_rows:
+            start_date = max(tx_rows[0][1], min_date)
+        else:
             start_date = min_date
-        end_date = date.today()
-        
-        # 3. Identify Assets & Split Buckets
-        asset_symbols = list(set(t.holding.asset.symbol for t in txs))
-        
-        yahoo_symbols = []
-        mf_codes = []
-        
-        # Logic: If it's all digits, it's MFAPI (AMFI Code). Otherwise Yahoo.
-        for sym in asset_symbols:
-            if sym.isdigit():
-                mf_codes.append(sym)
-            else:
-                # Append .NS for Indian stocks if missing (Assumption: NSE)
-                if '.' not in sym and '-' not in sym:
-                    yahoo_symbols.append(f"{sym}.NS")
-                else:
-                    yahoo_symbols.append(sym)
-
-        logger.info(f" Fetching history for {user.username}: {len(yahoo_symbols)} Yahoo, {len(mf_codes)} MFAPI symbols...")
-
-        # 4. Fetch Prices (Hybrid)
-        all_dates = pd.date_range(start=start_date, end=end_date, freq='D')
-        price_df = pd.DataFrame(index=all_dates)
-
-        # --- A. YAHOO FETCH ---
-        if yahoo_symbols:
-            try:
-                # Download close prices
-                # threads=False prevents spawning new threads inside the background thread (RAM Safety)
-                # trade off as we are on render free tier we are bound to use false beacuse we need our server to be in the limit of our free tier but the drawkback is the fecthing will take more time but as this a asynchronus task we can manage it we are trading speed for stability 
-                yf_data = yf.download(yahoo_symbols, start=start_date, end=end_date + timedelta(days=1), progress=False, auto_adjust=True, threads=False)['Close']
-                
-                # Normalize YF data structure (Series -> DataFrame if single asset)
-                if isinstance(yf_data, pd.Series):
-                    yf_data = yf_data.to_frame(name=yahoo_symbols[0])
-                
-                # Merge into main price dataframe
-                # We need to map back to original DB symbols if we added .NS
-                for db_sym in asset_symbols:
-                    if db_sym.isdigit(): continue # Skip MFs here
-                    
-                    yf_sym = f"{db_sym}.NS" if ('.' not in db_sym and '-' not in db_sym) else db_sym
-                    
-                    if yf_sym in yf_data.columns:
-                        price_df[db_sym] = yf_data[yf_sym]
-            except Exception as e:
-                logger.error(f"Yahoo History Error: {e}", exc_info=True)
-
-        # --- B. MFAPI FETCH ---
-        if mf_codes:
-            for code in mf_codes:
-                try:
-                    # Fetch history from MFAPI
-                    res = requests.get(f"https://api.mfapi.in/mf/{code}", timeout=10)
-                    if res.status_code == 200:
-                        data = res.json().get('data', [])
-                        # Convert list of dicts to DataFrame
-                        mf_df = pd.DataFrame(data)
-                        if not mf_df.empty:
-                            # Parse dates (DD-MM-YYYY) and NAV
-                            mf_df['date'] = pd.to_datetime(mf_df['date'], format='%d-%m-%Y')
-                            mf_df['nav'] = mf_df['nav'].astype(float)
-                            mf_df.set_index('date', inplace=True)
-                            
-                            # Reindex to match our master timeline
-                            mf_df = mf_df.reindex(all_dates).ffill()
-                            
-                            # Add to master price DF
-                            price_df[code] = mf_df['nav']
-                            logger.info(f"MFAPI History fetched for: {code}")
-                except Exception as e:
-                    logger.warning(f"MFAPI History Failed for {code}: {e}")
-
-        # 5. Build Holdings Timeline
-        holdings_df = pd.DataFrame(0.0, index=all_dates, columns=asset_symbols)
-        invested_df = pd.DataFrame(0.0, index=all_dates, columns=['invested_cash'])
-
-        for tx in txs:
-            if tx.date < start_date: continue
-            tx_date = pd.Timestamp(tx.date)
-            
-            # Ensure proper indexing even if tx_date is slightly out of range due to timezone
-            if tx_date in holdings_df.index:
-                sym = tx.holding.asset.symbol
-                qty = float(tx.quantity)
-                cash_flow = float(tx.quantity * tx.price)
-
-                if tx.type == 'BUY':
-                    holdings_df.loc[tx_date, sym] += qty
-                    invested_df.loc[tx_date, 'invested_cash'] += cash_flow
-                elif tx.type == 'SELL':
-                    holdings_df.loc[tx_date, sym] -= qty
-                    invested_df.loc[tx_date, 'invested_cash'] -= cash_flow
-
-        daily_holdings = holdings_df.cumsum()
-        daily_invested = invested_df.cumsum()
-
-        # 6. Calculate Value
-        # Forward fill missing prices (holidays/weekends)
-        price_df = price_df.ffill()
-        
-        # Create an aligned dataframe for calculation
-        daily_value = pd.DataFrame(0.0, index=all_dates, columns=daily_holdings.columns)
-        
-        # Multiply only matching columns to avoid key errors
-        common_assets = list(set(daily_holdings.columns) & set(price_df.columns))
-        for col in common_assets:
-            daily_value[col] = daily_holdings[col] * price_df[col]
-        
-        total_daily_value = daily_value.sum(axis=1)
-
-        # 7. Save Snapshots
-        snapshots = []
-        for day, value in total_daily_value.items():
-            # Skip invalid or empty days
-            if pd.isna(value) or value <= 0: continue
-            
-            invested = daily_invested.loc[day, 'invested_cash']
-            snapshots.append(PortfolioSnapshot(
-                user=user,
-                date=day.date(),
-                total_value=round(value, 2),
-                invested_value=round(invested, 2)
-            ))
 
+        checkpoint("price sync")
+
+        # Anything before the window (older edits, or history beyond the 30-year cap)
+        # is folded into an opening position on the first day.
+        opening_qty, opening_invested = get_opening_state(user, start_date)
+        lap("load")
+
+        if not tx_rows and not opening_qty:
+            logger.info(f"No transactions found for user {user.username}. Clearing affected history.")
+            write_history(user, [], [], [], from_date=start_date if incremental else None)
+            lap("write")
+            return 0
+
+        tx_asset_ids, tx_dates, tx_types, tx_qty, tx_price = (
+            map(np.asarray, zip(*tx_rows)) if tx_rows else [np.empty(0)] * 5
+        )
+
+        # 3. Identify Assets (column order = sorted asset id)
+        asset_ids = np.union1d(np.fromiter(opening_qty, dtype=np.int64, count=len(opening_qty)),
+                               tx_asset_ids.astype(np.int64))
+        assets = list(Asset.objects.filter(id__in=asset_ids.tolist()).order_by('id'))
+        asset_symbols = [a.symbol for a in assets]
+
+        # 4. Load Prices from the shared store
+        # Only the missing tail (dates after the last stored bar) is requested from Yahoo/MFAPI,
+        # so 50 users holding the same fund pay the provider cost once per day, not once per edit.
+        sync_price_history(assets, start_date, end_date)
+        checkpoint("timeline build")
+
+        # 5-7. Build Holdings Timeline, Value and Save, one chunk at a time
+        # Fixed point end to end: quantities in 1e-4 units, prices in paise, cash in 1e-4 paise (all int64)
+        signs = np.where(tx_types == 'SELL', -1, 1)
+        signed_units = signs * to_qty_units(tx_qty)
+        cash_flows = signed_units * to_paise(tx_price)
+        asset_cols = np.searchsorted(asset_ids, tx_asset_ids)
+        tx_days = tx_dates.astype('datetime64[D]')
+
+        # State carried across chunk boundaries
+        holdings_carry = np.zeros(len(asset_ids), dtype=np.int64)
+        if opening_qty:
+            holdings_carry[np.searchsorted(asset_ids, list(opening_qty))] = list(opening_qty.values())
+        invested_carry = opening_invested
+        price_carry = None
+
+        if streaming is None:
+            streaming = (end_date - start_date).days > settings.BACKFILL_STREAMING_THRESHOLD_DAYS
+        chunks = list(iter_year_chunks(start_date, end_date)) if streaming else [(start_date, end_date)]
+
+        # One transaction for all chunks: a full rebuild clears the history on its first chunk,
+        # so a failure (or supersession) on a later chunk must roll back to the old history
+        # instead of leaving it truncated until the retry.
+        written = 0
         with transaction.atomic():
-            # Nuclear option: Clear old history and replace with fresh accurate data
-            PortfolioSnapshot.objects.filter(user=user).delete()
-            PortfolioSnapshot.objects.bulk_create(snapshots)
-        
-        logger.info(f"Hybrid Backfill Complete for {user.username}: {len(snapshots)} snapshots created.")
+            for i, (chunk_start, chunk_end) in enumerate(chunks):
+                chunk_dates = pd.date_range(start=chunk_start, end=chunk_end, freq='D')
+                price_df = load_price_frame(assets, chunk_dates).reindex(columns=asset_symbols)
+                if price_carry is not None:
+                    # The store's lookback only covers a few days; the carry bridges longer gaps (illiquid assets)
+                    price_df.iloc[0] = price_df.iloc[0].fillna(pd.Series(price_carry, index=asset_symbols))
+                    price_df = price_df.ffill()
+                prices = price_df.to_numpy(dtype=float)
+                price_carry = prices[-1]
+                del price_df
+                lap("fetch")
+
+                # Holdings Timeline (fully vectorized, no per-transaction Python work)
+                in_chunk = (tx_days >= np.datetime64(chunk_start, 'D')) & (tx_days <= np.datetime64(chunk_end, 'D'))
+                daily_holdings, daily_invested = build_holdings_timeline(
+                    n_days=len(chunk_dates),
+                    day_offsets=(tx_days[in_chunk] - np.datetime64(chunk_start, 'D')).astype(np.int64),
+                    asset_cols=asset_cols[in_chunk],
+                    signed_qty=signed_units[in_chunk],
+                    cash_flows=cash_flows[in_chunk],
+                    opening_qty=holdings_carry,
+                    opening_invested=invested_carry,
+                )
+                holdings_carry, invested_carry = daily_holdings[-1].copy(), daily_invested[-1]
+                lap("timeline")
+
+                # Calculate Value
+                # Missing prices (holidays/weekends) are already forward-filled by the price store.
+                # Assets without any price data contribute 0.
+                price_paise = to_paise(np.nan_to_num(prices, nan=0.0))
+                total_daily_paise = cash_to_paise((daily_holdings * price_paise).sum(axis=1))
+                invested_daily_paise = cash_to_paise(daily_invested)
+                del daily_holdings, price_paise
+                lap("valuation")
+
+                checkpoint("snapshot write")
+
+                # Save Snapshots (rows or columnar blocks, see snapshot_store)
+                # Skip invalid or empty days. A full rebuild wipes everything on the first chunk;
+                # later chunks only replace their own window.
+                keep = total_daily_paise > 0
+                write_history(
+                    user,
+                    chunk_dates.values.astype('datetime64[D]')[keep],
+                    total_daily_paise[keep],
+                    invested_daily_paise[keep],
+                    from_date=chunk_start if (incremental or i > 0) else None,
+                    to_date=chunk_end if i < len(chunks) - 1 else None,
+                )
+                written += int(keep.sum())
+                lap("write")
+
+        mode = f"incremental from {start_date}" if incremental else "full"
+        if streaming:
+            mode += f", {len(chunks)} yearly chunks"
+        logger.info(f"Hybrid Backfill Complete for {user.username} ({mode}): {written} snapshots written.")
+        return written
 
+    except BackfillSuperseded:
+        raise
     except Exception as e:
         logger.error(f"Critical error in backfill_portfolio_history for {user.username}: {e}", exc_info=True)
+        raise # Let the job queue decide whether to retry
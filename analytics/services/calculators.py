@@ -1,11 +1,10 @@
 import logging
-from portfolio.models import Transaction, Holding
-from datetime import date
-from pyxirr import xirr
+from portfolio.services.valuation import value_portfolio
+from analytics.services.xirr_engine import get_xirr
 
 logger = logging.getLogger(__name__)
 
-def calculate_portfolio_xirr(user):
+def calculate_portfolio_xirr(user, valuation=None):
     """
     Calculates the Extended Internal Rate of Return (XIRR) for the user's portfolio.
 
@@ -17,54 +16,26 @@ def calculate_portfolio_xirr(user):
     2. Treat SELL transactions as positive cash flows (inflow).
     3. Treat current portfolio value as a positive cash flow occurring 'today' (unrealized gain).
 
+    This is the since-inception portfolio row of the batch XIRR engine (services/xirr_engine.py),
+    cached by the user's data version.
+
     Args:
         user (User): The user for whom to calculate XIRR.
+        valuation (PortfolioValuation, optional): Shared valuation for this request (computed if omitted).
 
     Returns:
         float: XIRR percentage (e.g., 12.5 for 12.5%). Returns 0.0 on error or insufficient data.
     """
     try:
-        # Fetch relevant fields only for performance
-        txs = Transaction.objects.filter(holding__user=user).values('date', 'type', 'quantity', 'price')
-
-        if not txs:
-            return 0.0
-        
-        dates = []
-        amounts = []
-
-        # 1. Process Historical Cash Flows
-        for t in txs:
-            total = float(t['quantity'] * t['price'])
-            dates.append(t['date'])
-
-            if t['type'] == 'BUY':
-                amounts.append(-total) # Money leaving pocket
-            else:
-                amounts.append(total)  # Money entering pocket
-
-        # 2. Add Terminal Value (Current Portfolio Value)
-        # We pretend we liquidated everything today to mark the end of the calculation period
-        holdings = Holding.objects.filter(user=user)
-        current_value = sum(float(h.quantity * h.asset.last_price) for h in holdings)
-
-        if current_value > 0:
-            dates.append(date.today())
-            amounts.append(current_value)
-
-        # 3. Calculate XIRR
-        # pyxirr is highly optimized (Rust-based)
-        result = xirr(dates, amounts)
-        
-        # Convert to percentage (e.g., 0.12 -> 12.0)
-        return round(result * 100, 2) if result else 0.0
+        result = get_xirr(user, valuation)['portfolio']['inception']
+        return result if result else 0.0
 
     except Exception as e:
         logger.error(f"XIRR Calculation Error for {user.username}: {e}")
         return 0.0
     
 
-def get_sector_split(user):
+def get_sector_split(user, valuation=None):
     """
     Calculates the sectoral allocation of the portfolio.
 
@@ -76,20 +47,9 @@ def get_sector_split(user):
         list[dict]: A list of sectors with their percentage weight and total value.
         Example: [{"name": "IT", "value": 40.0, "total": 50000}, ...]
     """
-    holdings = Holding.objects.filter(user=user).select_related('asset')
-    sector_map = {}
-    total_val = 0
-
-    for h in holdings:
-        val = float(h.quantity * h.asset.last_price)
-        sec = h.asset.sector
-
-        # Fallback for assets like Gold/ETFs that might not have a traditional sector
-        if not sec or sec.strip().lower() in ["other", "unknown"]:
-            sec = h.asset.asset_type
-
-        sector_map[sec] = sector_map.get(sec, 0) + val
-        total_val += val
+    valuation = valuation or value_portfolio(user)
+    sector_map = valuation.by_sector() # Gold/ETFs without a real sector are grouped by asset_type
+    total_val = valuation.total_value
 
     if total_val == 0:
         return []
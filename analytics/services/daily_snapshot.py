@@ -0,0 +1,97 @@
+import logging
+import numpy as np
+from django.db.models import F, OuterRef, Subquery, Sum
+from portfolio.models import Asset, Transaction
+from analytics.models import AssetPriceHistory
+from analytics.services.backfill import signed_by_type
+from analytics.services.price_history import sync_price_history
+from analytics.services.snapshot_store import append_day
+from analytics.services.fixed_point import QTY_SCALE, CASH_SCALE, decimal_to_units, to_paise, cash_to_paise
+
+logger = logging.getLogger(__name__)
+
+
+def load_positions(day):
+    """
+    Every user's position in every asset as of `day`, in one grouped query.
+
+    Returns:
+        tuple[np.ndarray, ...]: (user_ids, asset_ids, quantities, invested_cash) — one entry per (user, asset),
+            quantities in 1e-4 units and cash in 1e-4 paise (exact int64, see `fixed_point`).
+    """
+    rows = list(Transaction.objects.filter(date__lte=day)
+                .values('holding__user_id', 'holding__asset_id')
+                .annotate(qty=Sum(signed_by_type(F('quantity'))), cash=Sum(signed_by_type(F('quantity') * F('price'))))
+                .values_list('holding__user_id', 'holding__asset_id', 'qty', 'cash'))
+    if not rows:
+        return (np.empty(0, dtype=np.int64),) * 4
+
+    user_ids, asset_ids, qty, cash = zip(*rows)
+    return (np.array(user_ids, dtype=np.int64), np.array(asset_ids, dtype=np.int64),
+            np.array([decimal_to_units(q, QTY_SCALE) for q in qty], dtype=np.int64),
+            np.array([decimal_to_units(c, CASH_SCALE) for c in cash], dtype=np.int64))
+
+
+def load_closing_prices(asset_ids, day):
+    """
+    Latest stored close on or before `day` for each asset, as an array aligned to `asset_ids`.
+
+    Same price rule as the backfill, so a rebuild reproduces these rows: the backfill forward-fills
+    stored closes with no limit (and carries them across its chunks), so there is no lookback
+    window here either, and an asset without any bar is worth 0 (no fallback to `Asset.last_price`).
+
+    Returns:
+        np.ndarray[int64]: Prices in paise (0 where unknown).
+    """
+    latest = (AssetPriceHistory.objects.filter(asset_id=OuterRef('pk'), date__lte=day)
+              .order_by('-date').values('close')[:1])
+    closes = dict(Asset.objects.filter(id__in=asset_ids.tolist())
+                  .annotate(close=Subquery(latest)).values_list('id', 'close'))
+    prices = np.array([float(closes.get(asset_id) or 0) for asset_id in asset_ids.tolist()])
+    return to_paise(prices)
+
+
+def snapshot_all_users(day, sync_prices=True):
+    """
+    Appends one snapshot per user for `day` in a single set-based pass.
+
+    Strategy:
+    1. Load every (user, asset) position as of `day` with one grouped query.
+    2. Load the day's closing price for every held asset as one array.
+    3. Value = grouped multiply-sum over the user index, in int64 fixed point.
+    4. Write all users with one bulk upsert (rows or columnar blocks).
+
+    Cost is O(users x holdings) no matter how long anyone's history is,
+    unlike a backfill that replays the whole timeline just to add one day.
+
+    Args:
+        day (date): The logical date to snapshot.
+        sync_prices (bool): Pull the missing tail of price history for held assets first.
+
+    Returns:
+        int: Number of snapshots written.
+    """
+    user_ids, asset_ids, qty, cash = load_positions(day)
+    if not len(user_ids):
+        logger.info(f"Daily snapshot {day}: no positions found.")
+        return 0
+
+    held_assets = np.unique(asset_ids[qty > 0])
+    if sync_prices and len(held_assets):
+        sync_price_history(Asset.objects.filter(id__in=held_assets.tolist()), day, day)
+
+    unique_assets, asset_idx = np.unique(asset_ids, return_inverse=True)
+    prices = load_closing_prices(unique_assets, day)
+
+    unique_users, user_idx = np.unique(user_ids, return_inverse=True)
+    # np.add.at instead of bincount: bincount weights are float64, this stays exact
+    value_units = np.zeros(len(unique_users), dtype=np.int64)
+    np.add.at(value_units, user_idx, qty * prices[asset_idx])
+    invested_units = np.zeros(len(unique_users), dtype=np.int64)
+    np.add.at(invested_units, user_idx, cash)
+    values, invested = cash_to_paise(value_units), cash_to_paise(invested_units)
+
+    keep = values > 0 # Same rule as the backfill: empty days are not stored
+    append_day(day, unique_users[keep], values[keep], invested[keep])
+    logger.info(f"Daily snapshot {day}: {int(keep.sum())} users valued across {len(unique_assets)} assets.")
+    return int(keep.sum())
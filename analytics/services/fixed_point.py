@@ -0,0 +1,48 @@
+import numpy as np
+from decimal import Decimal
+
+# Fixed-point units used by every valuation path (all int64):
+# - quantities: 1e-4 units (Transaction.quantity has 4 decimal places)
+# - prices and stored values: paise (Transaction.price / Asset.last_price have 2)
+# - cash flows and intermediate values: qty units x paise = 1e-4 paise (exact, no rounding)
+# int64 leaves room for ~9 trillion rupees at the finest scale, far above any portfolio.
+QTY_SCALE = 10_000
+PAISE_SCALE = 100
+CASH_SCALE = QTY_SCALE * PAISE_SCALE # 1e-4 paise per rupee unit
+
+
+def _scale(values, scale):
+    # Float inputs come from Decimal columns with <= 4 dp, so rint() lands on the exact integer
+    return np.rint(np.asarray(values, dtype=float) * scale).astype(np.int64)
+
+
+def to_qty_units(values):
+    """Share/unit quantities -> int64 1e-4 units."""
+    return _scale(values, QTY_SCALE)
+
+
+def to_paise(values):
+    """Rupee amounts -> int64 paise (rounded half-to-even, like the Decimal columns)."""
+    return _scale(values, PAISE_SCALE)
+
+
+def decimal_to_units(value, scale):
+    """Exact Decimal -> int conversion (for SQL aggregates, which come back as Decimal)."""
+    return int((Decimal(value or 0) * scale).to_integral_value())
+
+
+def cash_to_paise(cash_units):
+    """1e-4 paise (qty units x paise) -> paise, rounding half away from zero."""
+    cash_units = np.asarray(cash_units, dtype=np.int64)
+    half = QTY_SCALE // 2
+    return np.where(cash_units >= 0, (cash_units + half) // QTY_SCALE, -((-cash_units + half) // QTY_SCALE))
+
+
+def paise_to_rupees(paise):
+    """int64 paise -> float64 rupees (only for JSON / statistics at the API boundary)."""
+    return np.asarray(paise, dtype=np.int64) / PAISE_SCALE
+
+
+def paise_to_decimal(paise):
+    """int paise -> Decimal rupees with exactly 2 places (for DecimalField writes)."""
+    return Decimal(int(paise)).scaleb(-2)
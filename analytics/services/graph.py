@@ -0,0 +1,103 @@
+import numpy as np
+from analytics.services.snapshot_store import read_history, read_benchmark
+
+RESOLUTIONS = ('daily', 'weekly', 'monthly')
+DEFAULT_MAX_POINTS = 500 # more than any chart width we render
+MAX_POINTS_LIMIT = 5000
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last point, splits the rest into `n_out - 2` buckets and picks,
+    in each bucket, the point forming the largest triangle with the previously kept
+    point and the average of the next bucket. Peaks and crashes survive, unlike
+    plain striding or averaging.
+
+    Args:
+        x (np.ndarray): Monotonic x values (e.g. day numbers).
+        y (np.ndarray): Series to preserve the shape of.
+        n_out (int): Number of points to keep (>= 3).
+
+    Returns:
+        np.ndarray[int]: Sorted indices of the kept points.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges over the interior points [1, n-1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Average of the next bucket (the last bucket looks at the final point)
+        nxt_lo, nxt_hi = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+
+        # Twice the triangle area for every candidate in the bucket at once
+        area = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(np.argmax(area))
+        kept[b + 1] = prev
+    return kept
+
+
+def resample_period_end(dates, resolution):
+    """
+    Indices of the last snapshot in each week (Mon-Sun) or calendar month.
+
+    Args:
+        dates (np.ndarray[datetime64[D]]): Sorted snapshot dates.
+        resolution (str): 'daily', 'weekly' or 'monthly'.
+    """
+    if resolution == 'daily' or len(dates) == 0:
+        return np.arange(len(dates))
+    if resolution == 'weekly':
+        # Day 0 (1970-01-01) is a Thursday: shift by 3 so weeks start on Monday
+        period = (dates.astype(np.int64) + 3) // 7
+    else:
+        period = dates.astype('datetime64[M]').astype(np.int64)
+    return np.r_[np.nonzero(np.diff(period))[0], len(dates) - 1]
+
+
+def build_performance_graph(user, start_date=None, end_date=None, resolution='daily', max_points=DEFAULT_MAX_POINTS):
+    """
+    Performance graph points for a date range, with a bounded size.
+
+    Strategy:
+    1. Read the range from the snapshot store as NumPy arrays.
+    2. Reduce to period-end values for weekly/monthly resolution.
+    3. LTTB-downsample the portfolio value to `max_points` (invested value follows the same days).
+    4. Only the surviving points are turned into dicts (with their recorded benchmark value, if any),
+       so the cost no longer grows with account age.
+
+    Returns:
+        dict: {"points": [...], "source_points": int} where each point has
+            name/date/portfolio/invested/benchmark like the dashboard graph.
+    """
+    dates, total, invested = read_history(user, start_date, end_date)
+
+    idx = resample_period_end(dates, resolution)
+    dates, total, invested = dates[idx], total[idx], invested[idx]
+    source_points = len(dates)
+
+    idx = lttb_indices(dates.astype(np.int64), total, max_points)
+    dates, total, invested = dates[idx], total[idx], invested[idx]
+
+    days = dates.tolist()
+    benchmark = read_benchmark(user, days)
+    points = [{
+        "name": day.strftime('%b-%y'),
+        "date": day.isoformat(),
+        "portfolio": value,
+        "invested": inv,
+        "benchmark": benchmark.get(day),
+    } for day, value, inv in zip(days, total.tolist(), invested.tolist())]
+
+    return {"points": points, "source_points": source_points}
@@ -0,0 +1,318 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction, IntegrityError
+from django.db.models import F, Count, Min, Q
+from django.utils import timezone
+from analytics.models import BackfillJob
+from analytics.services.backfill import backfill_portfolio_history, BackfillSuperseded
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    """Identifies the current worker process in job rows (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def current_rss_mb():
+    """
+    Resident memory of this process in MB.
+    Reads /proc on Linux (current RSS); elsewhere falls back to the peak RSS from getrusage.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def limit_address_space(headroom_mb):
+    """
+    Hard memory ceiling for this process: caps its address space (RLIMIT_AS) at the current
+    size plus `headroom_mb`. An allocation past it raises MemoryError inside the job (failing
+    just that attempt) instead of the kernel OOM killer taking the whole worker down.
+    The cooperative RSS check in `run_job` still aborts most jobs earlier, between stages.
+
+    Address space is larger than RSS (thread stacks, malloc arenas), so the headroom should be
+    well above the RSS ceiling. Linux only; elsewhere this is a no-op.
+
+    Returns:
+        float or None: The limit in MB, or None if it could not be set.
+    """
+    try:
+        import resource
+        with open('/proc/self/statm') as f:
+            size_pages = int(f.read().split()[0])
+        limit = size_pages * os.sysconf('SC_PAGE_SIZE') + headroom_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ImportError, OSError, ValueError, IndexError) as e:
+        logger.warning(f"Could not cap the worker's address space: {e}")
+        return None
+    return limit / (1024 * 1024)
+
+
+def _earliest(a, b):
+    """Earliest of two dirty dates, where None (full rebuild) covers everything."""
+    if a is None or b is None:
+        return None
+    return min(a, b)
+
+
+def enqueue_backfill(user, from_date=None):
+    """
+    Queues a backfill for `user`. This is the only thing web processes do;
+    the actual work runs in `run_backfill_worker`.
+
+    Coalescing rules (importing 200 transactions must not queue 200 backfills):
+    - At most one PENDING job per user. New submissions merge into it, widening
+      `from_date` to the earliest dirty date.
+    - The pending job is debounced: each submission pushes `run_after` out by
+      BACKFILL_DEBOUNCE_SECONDS, capped at BACKFILL_MAX_DELAY_SECONDS after creation.
+    - A RUNNING job for the same user is flagged as superseded so it stops early
+      instead of finishing stale work; its range is folded into the pending job.
+
+    Args:
+        user (User): The user whose history changed.
+        from_date (date, optional): Earliest dirty date. None = full rebuild.
+
+    Returns:
+        BackfillJob: The pending job that will cover this change.
+    """
+    debounce = timedelta(seconds=settings.BACKFILL_DEBOUNCE_SECONDS)
+    max_delay = timedelta(seconds=settings.BACKFILL_MAX_DELAY_SECONDS)
+
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+
+                # Supersede in-flight work: it would finish with stale inputs
+                for running in BackfillJob.objects.filter(user=user, status='RUNNING'):
+                    from_date = _earliest(from_date, running.from_date)
+                BackfillJob.objects.filter(user=user, status='RUNNING').update(superseded=True)
+
+                job = BackfillJob.objects.select_for_update().filter(user=user, status='PENDING').first()
+                if job is None:
+                    job = BackfillJob.objects.create(
+                        user=user,
+                        from_date=from_date,
+                        run_after=now + debounce,
+                        max_attempts=settings.BACKFILL_MAX_ATTEMPTS,
+                    )
+                    logger.info(f"📥 Backfill queued for {user.username} (job #{job.id}, from: {from_date or 'start'})")
+                    return job
+
+                job.from_date = _earliest(job.from_date, from_date)
+                job.run_after = min(max(job.run_after, now + debounce), job.created_at + max_delay)
+                job.save(update_fields=['from_date', 'run_after'])
+                logger.info(f"Backfill coalesced into job #{job.id} for {user.username} (from: {job.from_date or 'start'})")
+                return job
+        except IntegrityError:
+            # Another process created the pending job between our SELECT and INSERT: merge into it
+            if attempt == 2:
+                raise
+
+
+def queue_depth():
+    """
+    Snapshot of the backfill queue, used to spot backpressure.
+
+    Returns:
+        dict: Job counts per status plus the age of the oldest runnable job.
+    """
+    counts = dict(BackfillJob.objects.filter(status__in=['PENDING', 'RUNNING', 'FAILED'])
+                  .values_list('status').annotate(n=Count('id')))
+    oldest = (BackfillJob.objects.filter(status='PENDING', run_after__lte=timezone.now())
+              .aggregate(oldest=Min('run_after'))['oldest'])
+
+    return {
+        "pending": counts.get('PENDING', 0),
+        "running": counts.get('RUNNING', 0),
+        "failed": counts.get('FAILED', 0),
+        "oldest_pending_seconds": round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+    }
+
+
+def claim_next_job():
+    """
+    Atomically claims the oldest runnable job.
+
+    `SELECT ... FOR UPDATE SKIP LOCKED` lets any number of worker processes poll the
+    same table: rows locked by another worker are skipped instead of waited on, so
+    two workers never claim the same job.
+
+    Jobs for a user whose previous (superseded) job is still winding down are
+    skipped, so two workers never write the same user's history at once.
+
+    Returns:
+        BackfillJob | None: The claimed job (already marked RUNNING), or None if the queue is empty.
+    """
+    with transaction.atomic():
+        busy_users = BackfillJob.objects.filter(status='RUNNING').values('user_id')
+        job = (BackfillJob.objects.select_for_update(skip_locked=True)
+               .filter(status='PENDING', run_after__lte=timezone.now())
+               .exclude(user_id__in=busy_users)
+               .order_by('created_at')
+               .first())
+        if job is None:
+            return None
+
+        job.status = 'RUNNING'
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.worker = worker_name()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at', 'worker'])
+        return job
+
+
+class _Heartbeat:
+    """
+    Keeps a claimed job's `heartbeat_at` fresh, and tells the worker whether it still owns the job.
+
+    Beats go through a connection of their own: the backfill writes inside one long transaction,
+    where an update of the job row would stay invisible to `requeue_stale_jobs` until the commit.
+    SQLite has a single writer, so there (or if that connection fails) the worker's own is used.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.connection = None
+
+    def beat(self):
+        """Returns False once the job was taken away from this worker (re-queued as stale)."""
+        now = timezone.now()
+        if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite':
+            return _owned(self.job).update(heartbeat_at=now) == 1
+
+        table = BackfillJob._meta.db_table
+        try:
+            if self.connection is None:
+                self.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {self.connection.ops.quote_name(table)} SET heartbeat_at = %s "
+                    f"WHERE id = %s AND worker = %s AND status = 'RUNNING'",
+                    [self.connection.ops.adapt_datetimefield_value(now), self.job.pk, self.job.worker],
+                )
+                return cursor.rowcount == 1
+        except DatabaseError as e:
+            logger.warning(f"Heartbeat connection unavailable ({e}), using the worker's connection")
+            return _owned(self.job).update(heartbeat_at=now) == 1
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def _owned(job):
+    """The job's row, as long as it is still RUNNING under this worker's claim."""
+    return BackfillJob.objects.filter(pk=job.pk, worker=job.worker, status='RUNNING')
+
+
+def _finish(job, **fields):
+    """
+    Records the outcome, unless the job was re-queued (stale heartbeat) while it ran: then
+    another worker owns the row and its state is left alone.
+    """
+    if _owned(job).update(**fields):
+        return True
+    logger.warning(f"Backfill job #{job.id} was re-queued while running; not recording its outcome")
+    return False
+
+
+def run_job(job, max_rss_mb=0):
+    """
+    Executes a claimed job and records the outcome.
+
+    Failures are retried with exponential backoff (base delay doubles per attempt)
+    until `max_attempts` is reached, after which the job is marked FAILED.
+    Every abort check between stages/chunks doubles as the job's heartbeat; a job that
+    was re-queued meanwhile aborts and its outcome is not recorded.
+
+    Args:
+        job (BackfillJob): A job returned by `claim_next_job`.
+        max_rss_mb (int): Per-job memory ceiling. Checked between backfill stages; crossing
+            it aborts the job with a MemoryError (counted as a failed attempt).
+    """
+    logger.info(f"🔄 Backfill job #{job.id} started for {job.user.username} (attempt {job.attempts}/{job.max_attempts})")
+    heartbeat = _Heartbeat(job)
+
+    def is_superseded():
+        return BackfillJob.objects.filter(pk=job.pk, superseded=True).exists()
+
+    def should_abort():
+        rss = current_rss_mb()
+        if max_rss_mb and rss > max_rss_mb:
+            raise MemoryError(f"RSS ceiling exceeded ({rss:.0f} MB > {max_rss_mb} MB)")
+        # Re-queued as stale: another worker may already be on it, stop before writing
+        return not heartbeat.beat() or is_superseded()
+
+    try:
+        backfill_portfolio_history(job.user, from_date=job.from_date, should_abort=should_abort)
+    except BackfillSuperseded:
+        if _finish(job, status='SUPERSEDED', finished_at=timezone.now()):
+            logger.info(f"⏭️ Backfill job #{job.id} superseded by newer edits for {job.user.username}")
+        return False
+    except Exception as e:
+        if is_superseded():
+            # A newer pending job already covers this range; no point retrying this one
+            _finish(job, status='SUPERSEDED', finished_at=timezone.now(), last_error=str(e))
+        elif job.attempts < job.max_attempts:
+            delay = settings.BACKFILL_RETRY_DELAY_SECONDS * (2 ** (job.attempts - 1))
+            try:
+                with transaction.atomic():
+                    requeued = _finish(job, status='PENDING', last_error=str(e),
+                                       run_after=timezone.now() + timedelta(seconds=delay))
+                if requeued:
+                    logger.warning(f"⚠️ Backfill job #{job.id} failed, retrying in {delay}s: {e}")
+            except IntegrityError:
+                # A new submission queued a pending job after our superseded check: it covers this range
+                _finish(job, status='SUPERSEDED', finished_at=timezone.now(), last_error=str(e))
+        else:
+            if _finish(job, status='FAILED', finished_at=timezone.now(), last_error=str(e)):
+                logger.error(f"❌ Backfill job #{job.id} failed permanently for {job.user.username}: {e}")
+        return False
+    finally:
+        heartbeat.close()
+
+    if not _finish(job, status='DONE', finished_at=timezone.now()):
+        return False
+    logger.info(f"✅ Backfill job #{job.id} complete for {job.user.username}")
+    return True
+
+
+def requeue_stale_jobs(stale_after_seconds):
+    """
+    Puts RUNNING jobs whose worker died mid-run (crash, OOM kill, deploy) back in the queue.
+
+    A job is stale when its heartbeat (see `run_job`) is older than `stale_after_seconds`,
+    not when it merely started that long ago: long streaming rebuilds keep beating.
+
+    Returns:
+        int: Number of jobs re-queued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after_seconds)
+    stale = BackfillJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff), status='RUNNING',
+    )
+
+    # Newer edits already queued a job that covers this range (see enqueue_backfill)
+    stale.filter(superseded=True).update(status='SUPERSEDED', finished_at=timezone.now())
+
+    # A job that keeps killing its worker (e.g. OOM) must not loop forever
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', finished_at=timezone.now(), last_error='Worker lost (attempts exhausted)'
+    )
+    count = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='PENDING', run_after=timezone.now(), last_error='Worker lost (re-queued)'
+    )
+    if count:
+        logger.warning(f"Re-queued {count} stale backfill job(s).")
+    return count
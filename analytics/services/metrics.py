@@ -1,47 +1,65 @@
 import logging
 import numpy as np
 import pandas as pd
-import yfinance as yf
+from datetime import date, timedelta
+from django.conf import settings
 from django.core.cache import cache
-from analytics.models import PortfolioSnapshot
-from portfolio.models import Holding
+from analytics.services.snapshot_store import read_history
+from core.providers.routing import get_price_provider
+from core.utils import get_logical_date
+from portfolio.services.valuation import value_portfolio
 
 logger = logging.getLogger(__name__)
 
+def _benchmark_key(days):
+    return f"market_benchmark_nifty_{days}"
+
+
+def refresh_benchmark_data(days=365, force=False):
+    """
+    Fetches Nifty 50 (^NSEI) history for the last `days` into the cache, once per IST logical
+    day (called from the `refresh_prices` daemon). The entry outlives the day, so readers keep
+    the previous day's returns until the new ones are in.
+
+    Returns:
+        bool: Whether the cache was updated.
+    """
+    cached = cache.get(_benchmark_key(days))
+    today = get_logical_date()
+    if not force and cached is not None and cached['as_of'] == today:
+        return False
+    try:
+        # Providers return naive dates, matching the portfolio dates
+        hist = get_price_provider().get_history(["^NSEI"], date.today() - timedelta(days=days))
+    except Exception as e:
+        logger.error(f"Error fetching benchmark data: {e}", exc_info=True)
+        return False
+    if "^NSEI" not in hist.columns:
+        logger.warning("Empty data returned for benchmark ^NSEI")
+        return False
+
+    # Calculate Daily Returns (% change from yesterday)
+    returns = hist["^NSEI"].pct_change().dropna().rename('Market_Return')
+    cache.set(_benchmark_key(days), {'as_of': today, 'returns': returns}, 60 * 60 * 24 * 3)
+    return True
+
+
 def fetch_benchmark_data(days=365):
     """
-    Fetches Nifty 50 (^NSEI) historical data for the last year.
-    Uses caching to avoid hitting Yahoo Finance API limits.
-    
+    Nifty 50 (^NSEI) daily returns for the last `days`, from the cache kept warm by the daemon
+    (see `refresh_benchmark_data`). A miss returns an empty series rather than calling Yahoo
+    from a request, unless PRICE_REFRESH_ON_READ is set (no daemon deployed).
+
     Returns:
         pd.Series: Daily market returns (% change).
     """
-    cache_key = f"market_benchmark_nifty_{days}"
-    data = cache.get(cache_key)
-    
-    if data is None:
-        try:
-            ticker = yf.Ticker("^NSEI")
-            hist = ticker.history(period=f"{days}d")
-            
-            if hist.empty:
-                logger.warning("Empty data returned for benchmark ^NSEI")
-                return pd.Series(dtype=float)
-
-            # Strip Timezone from Market Data to match naive portfolio dates
-            hist.index = hist.index.tz_localize(None) 
-            
-            # Calculate Daily Returns (% change from yesterday)
-            hist['Market_Return'] = hist['Close'].pct_change()
-            data = hist['Market_Return'].dropna()
-            
-            # Cache for 24 hours to reduce API load
-            cache.set(cache_key, data, 60*60*24) 
-        except Exception as e:
-            logger.error(f"Error fetching benchmark data: {e}", exc_info=True)
-            return pd.Series(dtype=float) 
-        
-    return data
+    cached = cache.get(_benchmark_key(days))
+    if cached is None and settings.PRICE_REFRESH_ON_READ and refresh_benchmark_data(days, force=True):
+        cached = cache.get(_benchmark_key(days))
+    if cached is None:
+        logger.info("Benchmark data not cached yet; beta skipped until the price daemon warms it")
+        return pd.Series(dtype=float)
+    return cached['returns']
 
 def calculate_portfolio_metrics(user):
     """
@@ -54,25 +72,19 @@ def calculate_portfolio_metrics(user):
     Returns:
         dict: containing 'beta', 'volatility' (label), and 'volatility_num'.
     """
-    # 1. Get User's Daily History from DB
-    snapshots = PortfolioSnapshot.objects.filter(user=user).order_by('date')
-    
+    # 1. Get User's Daily History from the snapshot store (already float NumPy arrays)
+    dates, total_values, _ = read_history(user)
+
     # Need enough data points for statistical significance
-    if not snapshots.exists() or len(snapshots) < 10:
+    if len(dates) < 10:
         return {
             "beta": 0,
-            "volatility": "Low", 
+            "volatility": "Low",
             "volatility_num": 0
         }
 
     # 2. Prepare DataFrame
-    df = pd.DataFrame(list(snapshots.values('date', 'total_value')))
-    
-    # Convert Decimal to Float immediately for numpy compatibility
-    df['total_value'] = df['total_value'].astype(float) 
-    
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
+    df = pd.DataFrame({'total_value': total_values}, index=pd.DatetimeIndex(dates, name='date'))
 
     # Strip Timezone from Portfolio Data to ensure alignment with benchmark
     df.index = df.index.tz_localize(None)
@@ -117,7 +129,7 @@ def calculate_portfolio_metrics(user):
         "volatility_num": round(annualized_volatility, 2)
     }
 
-def calculate_health_score(user):
+def calculate_health_score(user, valuation=None):
     """
     Generates a Portfolio Health Score (0-100) based on diversification logic.
     
@@ -126,7 +138,8 @@ def calculate_health_score(user):
     2. Sector Diversification: Penalty if invested in < 3 sectors.
     3. Asset Class Diversification: Penalty if invested in < 2 asset types.
     """
-    holdings = list(Holding.objects.filter(user=user).select_related('asset'))
+    valuation = valuation or value_portfolio(user)
+    holdings = valuation.holdings
     if not holdings:
         return 50 # Neutral start score
     
@@ -134,25 +147,25 @@ def calculate_health_score(user):
     penalties = []
     
     # Calculate total value safely
-    total_value = sum(float(h.current_value()) for h in holdings)
+    total_value = valuation.total_value
     
     if total_value == 0: return 0
 
     # 1. Concentration Risk
     for h in holdings:
-        weight = float(h.current_value()) / total_value
+        weight = h['value'] / total_value
         if weight > 0.40:
             score -= 15
-            penalties.append(f"High concentration in {h.asset.symbol}")
+            penalties.append(f"High concentration in {h['symbol']}")
 
     # 2. Sector Diversification
-    sectors = set(h.asset.sector for h in holdings if h.asset.sector)
+    sectors = set(h['sector'] for h in holdings if h['sector'])
     if len(sectors) < 3:
         score -= 20
         penalties.append("Poor sector diversity")
 
     # 3. Asset Class Diversification
-    types = set(h.asset.asset_type for h in holdings)
+    types = set(h['asset_type'] for h in holdings)
     if len(types) < 2:
         score -= 10
         penalties.append("Lack of multi-asset allocation")
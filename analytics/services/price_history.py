@@ -0,0 +1,192 @@
+import logging
+import pandas as pd
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Min, Max
+from analytics.models import AssetPriceHistory
+from core.bulk_writer import bulk_upsert
+from core.providers.routing import get_price_provider
+
+logger = logging.getLogger(__name__)
+
+# How far back we look for a "last known price" when the requested range starts on a weekend/holiday.
+PRICE_LOOKBACK_DAYS = 10
+
+
+def to_yahoo_symbol(symbol):
+    """
+    Maps a DB symbol to its Yahoo Finance ticker.
+    Append .NS for Indian stocks if missing (Assumption: NSE).
+    """
+    if '.' not in symbol and '-' not in symbol:
+        return f"{symbol}.NS"
+    return symbol
+
+
+def _sync_marker_key(asset):
+    return f"price_history_synced_{asset.id}"
+
+
+def _requested_from_key(asset):
+    return f"price_history_requested_from_{asset.id}"
+
+
+def _mark_synced(asset, fetch_from, end_date, requested_from):
+    """
+    Records a successful fetch: the daily "synced" marker, plus the earliest date the provider
+    has been asked for. The store's first bar is often later than that (weekend/holiday start,
+    late listing, MFAPI history starting later), and the provider has nothing earlier to give.
+    Losing the entry (cache eviction) only costs one full re-fetch.
+    """
+    cache.set(_sync_marker_key(asset), end_date.isoformat(), 60 * 60 * 24)
+    if requested_from is None or fetch_from < requested_from:
+        cache.set(_requested_from_key(asset), fetch_from.isoformat(), None)
+
+
+def _save_bars(asset, series, fetch_from):
+    """
+    Persists a (date -> close) series for one asset, keeping only the missing tail.
+    Returns the number of bars written.
+    """
+    bars = []
+    for day, close in series.items():
+        if pd.isna(close):
+            continue
+        day = day.date() if hasattr(day, 'date') else day
+        if day < fetch_from:
+            continue
+        bars.append((asset.id, day, round(Decimal(str(close)), 4)))
+    return store_bars(bars)
+
+
+def store_bars(bars):
+    """
+    Inserts (asset_id, date, close) bars into the price store, keeping any bar already there.
+    DO NOTHING on conflict keeps concurrent writers of the same asset/day safe.
+
+    Returns the number of bars written.
+    """
+    return bulk_upsert(AssetPriceHistory, ['asset_id', 'date', 'close'], bars,
+                       unique_fields=['asset_id', 'date'], update_fields=[])
+
+
+def sync_price_history(assets, start_date, end_date=None):
+    """
+    Brings the local price store up to date for the given assets.
+
+    Strategy ("fetch only the missing tail"):
+    1. Look up the first/last stored bar for every asset in one query.
+    2. Assets already synced today (and covering `start_date`) are skipped entirely. An asset
+       covers `start_date` if its first stored bar is on or before it, or if the provider was
+       already asked from that date or earlier (nothing earlier exists, see `_mark_synced`).
+    3. Everyone else only asks the provider for dates after their last stored bar
+       (or from `start_date` if the store does not reach back that far).
+        - Stocks/Crypto -> one batched Yahoo download
+        - Mutual Funds -> MFAPI (one call per scheme, the API has no range filter)
+
+    Args:
+        assets (Iterable[Asset]): Assets to sync.
+        start_date (date): Earliest date the caller needs prices for.
+        end_date (date, optional): Last date needed. Defaults to today.
+    """
+    end_date = end_date or date.today()
+    assets = list(assets)
+    if not assets:
+        return
+
+    stored = {
+        row['asset_id']: (row['first'], row['last'])
+        for row in AssetPriceHistory.objects.filter(asset__in=assets)
+        .values('asset_id').annotate(first=Min('date'), last=Max('date'))
+    }
+
+    requested = cache.get_many([_requested_from_key(a) for a in assets])
+    requested_from = {}
+    for asset in assets:
+        value = requested.get(_requested_from_key(asset))
+        requested_from[asset] = date.fromisoformat(value) if value else None
+
+    yahoo_jobs = {} # asset -> fetch_from
+    mf_jobs = {}
+    for asset in assets:
+        first, last = stored.get(asset.id, (None, None))
+        covers_start = ((first is not None and first <= start_date)
+                        or (requested_from[asset] is not None and requested_from[asset] <= start_date))
+
+        # Provider cost is paid once per asset per day, no matter how many users hold it
+        if covers_start and cache.get(_sync_marker_key(asset)) == end_date.isoformat():
+            continue
+
+        fetch_from = last + timedelta(days=1) if covers_start and last is not None else start_date
+        if fetch_from > end_date:
+            _mark_synced(asset, fetch_from, end_date, requested_from[asset])
+            continue
+
+        if asset.symbol.isdigit():
+            mf_jobs[asset] = fetch_from
+        else:
+            yahoo_jobs[asset] = fetch_from
+
+    if not yahoo_jobs and not mf_jobs:
+        return
+
+    logger.info(f"Syncing price history: {len(yahoo_jobs)} Yahoo, {len(mf_jobs)} MFAPI symbols...")
+    provider = get_price_provider()
+
+    # --- A. YAHOO FETCH (one batched request) ---
+    if yahoo_jobs:
+        yahoo_symbols = sorted(set(to_yahoo_symbol(a.symbol) for a in yahoo_jobs))
+        try:
+            closes = provider.get_history(yahoo_symbols, min(yahoo_jobs.values()), end_date)
+            for asset, fetch_from in yahoo_jobs.items():
+                yf_sym = to_yahoo_symbol(asset.symbol)
+                if yf_sym not in closes.columns:
+                    continue
+                _save_bars(asset, closes[yf_sym], fetch_from)
+                _mark_synced(asset, fetch_from, end_date, requested_from[asset])
+        except Exception as e:
+            logger.error(f"Yahoo History Error: {e}", exc_info=True)
+
+    # --- B. MFAPI FETCH (one call per scheme, the API has no range filter) ---
+    for asset, fetch_from in mf_jobs.items():
+        try:
+            closes = provider.get_history([asset.symbol], fetch_from, end_date)
+            if asset.symbol in closes.columns:
+                written = _save_bars(asset, closes[asset.symbol], fetch_from)
+                logger.info(f"MFAPI History synced for {asset.symbol}: {written} new bars")
+                _mark_synced(asset, fetch_from, end_date, requested_from[asset])
+        except Exception as e:
+            logger.warning(f"MFAPI History Failed for {asset.symbol}: {e}")
+
+
+def load_price_frame(assets, all_dates):
+    """
+    Reads stored closes into a (dates x symbols) DataFrame aligned to `all_dates`.
+
+    Prices are forward-filled across weekends/holidays. A short lookback before the
+    first date seeds the fill so a range starting on a Sunday still has Friday's close.
+
+    Returns:
+        pd.DataFrame: Index `all_dates`, one float column per DB symbol that has data.
+    """
+    if len(all_dates) == 0:
+        return pd.DataFrame(index=all_dates)
+
+    rows = list(AssetPriceHistory.objects.filter(
+        asset__in=assets,
+        date__gte=all_dates[0].date() - timedelta(days=PRICE_LOOKBACK_DAYS),
+        date__lte=all_dates[-1].date(),
+    ).values_list('asset__symbol', 'date', 'close'))
+
+    if not rows:
+        return pd.DataFrame(index=all_dates)
+
+    bars = pd.DataFrame(rows, columns=['symbol', 'date', 'close'])
+    bars['date'] = pd.to_datetime(bars['date'])
+    bars['close'] = bars['close'].astype(float)
+
+    price_df = bars.pivot(index='date', columns='symbol', values='close')
+    # Union with the master timeline first so the lookback rows can seed the fill
+    price_df = price_df.reindex(price_df.index.union(all_dates)).ffill()
+    return price_df.reindex(all_dates)
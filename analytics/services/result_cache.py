@@ -0,0 +1,74 @@
+import logging
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from core.utils import get_logical_date
+from portfolio.models import Holding
+
+logger = logging.getLogger(__name__)
+
+# Payloads are also keyed by the logical day (XIRR runs up to "today", the benchmark moves daily),
+# so nothing outlives a day anyway
+PAYLOAD_TTL = 60 * 60 * 24
+
+
+def _version_key(user_id):
+    return f"analytics_version_{user_id}"
+
+
+def get_version(user_id):
+    """
+    Current analytics version of a user.
+
+    Versions are random tokens rather than a counter starting at 1: if the version entry is
+    ever evicted, the re-created one can never match a payload cached under an older version.
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate_users(user_ids):
+    """
+    Moves the given users to a new analytics version (their cached payloads stop matching).
+    Inside a transaction this waits for the commit, so a reader can't re-cache pre-commit data.
+    """
+    user_ids = {int(uid) for uid in user_ids}
+    if not user_ids:
+        return
+
+    def bump():
+        cache.set_many({_version_key(uid): uuid.uuid4().hex for uid in user_ids}, None)
+
+    transaction.on_commit(bump, robust=True)
+
+
+def invalidate_asset_holders(asset_ids):
+    """New prices for `asset_ids`: invalidates everyone holding one of them."""
+    asset_ids = list(asset_ids)
+    if asset_ids:
+        invalidate_users(Holding.objects.filter(asset_id__in=asset_ids).values_list('user_id', flat=True).distinct())
+
+
+def get_or_compute(user, compute, namespace='analytics_payload', day=None):
+    """
+    Returns the user's analytics payload, computing it only when its inputs changed.
+
+    The cache key is (user, version, logical day). The version changes on Transaction/Holding
+    writes, price updates of held assets and snapshot rebuilds, so a repeat view is one cache hit.
+
+    Args:
+        user (User): Whose analytics.
+        compute (callable): `compute(user) -> dict` (JSON-serialisable payload).
+        namespace (str): Which result this is (one cache entry per namespace and version).
+        day (date, optional): The logical day `compute` ran for; defaults to `get_logical_date()`.
+    """
+    day = day or get_logical_date()
+    key = f"{namespace}_{user.id}_{get_version(user.id)}_{day.isoformat()}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = compute(user)
+        cache.set(key, payload, PAYLOAD_TTL)
+    return payload
@@ -0,0 +1,333 @@
+import logging
+import struct
+import zlib
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from analytics.models import PortfolioSnapshot, SnapshotBlock
+from analytics.services.fixed_point import to_paise, paise_to_rupees, paise_to_decimal
+from analytics.services.result_cache import invalidate_users
+from core.bulk_writer import bulk_upsert
+
+logger = logging.getLogger(__name__)
+
+# Block layout: header (magic, day count) + zlib(day offset deltas | total deltas | invested deltas)
+_BLOCK_MAGIC = b'PLS1'
+_BLOCK_HEADER = struct.Struct('<4sH')
+
+
+def storage_mode():
+    """'rows' (one PortfolioSnapshot per day) or 'columnar' (one SnapshotBlock per year)."""
+    return getattr(settings, 'ANALYTICS_SNAPSHOT_STORAGE', 'rows')
+
+
+def _empty_history():
+    return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+
+# --- Block codec ---
+
+def _shuffle(deltas):
+    """
+    Byte-plane shuffle: all low bytes first, then all second bytes, ...
+    Day-to-day deltas are small, so the high planes are long zero runs that zlib squashes.
+    """
+    return deltas.astype('<i8').view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(buf, n):
+    return np.frombuffer(buf, dtype=np.uint8).reshape(8, n).T.copy().view('<i8').ravel()
+
+
+def encode_block(day_offsets, total_paise, invested_paise):
+    """
+    Packs one year of snapshots into bytes.
+
+    Args:
+        day_offsets (np.ndarray): Days since 1 Jan, strictly increasing.
+        total_paise (np.ndarray): Portfolio value per day in paise.
+        invested_paise (np.ndarray): Invested capital per day in paise.
+    """
+    n = len(day_offsets)
+    payload = b''.join([
+        np.diff(np.asarray(day_offsets, dtype=np.int64), prepend=0).astype('<u2').tobytes(),
+        _shuffle(np.diff(total_paise, prepend=0)),
+        _shuffle(np.diff(invested_paise, prepend=0)),
+    ])
+    return _BLOCK_HEADER.pack(_BLOCK_MAGIC, n) + zlib.compress(payload, 9)
+
+
+def decode_block(blob):
+    """
+    Inverse of `encode_block`.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: (day_offsets, total_paise, invested_paise)
+    """
+    blob = bytes(blob) # BinaryField comes back as memoryview on PostgreSQL
+    magic, n = _BLOCK_HEADER.unpack_from(blob)
+    if magic != _BLOCK_MAGIC:
+        raise ValueError(f"Unknown snapshot block format: {magic!r}")
+
+    payload = zlib.decompress(blob[_BLOCK_HEADER.size:])
+    offsets = np.cumsum(np.frombuffer(payload[:2 * n], dtype='<u2').astype(np.int64))
+    total = np.cumsum(_unshuffle(payload[2 * n:10 * n], n))
+    invested = np.cumsum(_unshuffle(payload[10 * n:18 * n], n))
+    return offsets, total, invested
+
+
+def _build_blocks(user_id, dates, total_paise, invested_paise):
+    """Splits a sorted daily series into one unsaved SnapshotBlock per calendar year."""
+    years = dates.astype('datetime64[Y]')
+    offsets = (dates - years.astype('datetime64[D]')).astype(np.int64)
+
+    blocks = []
+    for year in np.unique(years):
+        mask = years == year
+        block_dates = dates[mask]
+        blocks.append(SnapshotBlock(
+            user_id=user_id,
+            year=int(year.astype(int)) + 1970,
+            first_date=block_dates[0].item(),
+            last_date=block_dates[-1].item(),
+            n_days=int(mask.sum()),
+            data=encode_block(offsets[mask], total_paise[mask], invested_paise[mask]),
+        ))
+    return blocks
+
+
+def _decode_to_dates(block):
+    offsets, total, invested = decode_block(block.data)
+    jan_1 = np.datetime64(f"{block.year:04d}-01-01", 'D')
+    return jan_1 + offsets, total, invested
+
+
+# --- Reads ---
+
+def read_history(user, start_date=None, end_date=None):
+    """
+    A user's daily snapshot series as NumPy arrays (no model instances).
+
+    Args:
+        user (User): Owner of the history.
+        start_date (date, optional): First day to include.
+        end_date (date, optional): Last day to include.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: (dates as datetime64[D], total_value, invested_value)
+            with values as float rupees, sorted by date. For exact values use `read_history_paise`.
+    """
+    dates, total, invested = read_history_paise(user, start_date, end_date)
+    return dates, paise_to_rupees(total), paise_to_rupees(invested)
+
+
+def read_history_paise(user, start_date=None, end_date=None):
+    """Same as `read_history`, with values as exact int64 paise."""
+    if storage_mode() == 'columnar':
+        blocks = SnapshotBlock.objects.filter(user=user)
+        if start_date:
+            blocks = blocks.filter(year__gte=start_date.year)
+        if end_date:
+            blocks = blocks.filter(year__lte=end_date.year)
+        decoded = [_decode_to_dates(b) for b in blocks.order_by('year').only('year', 'data')]
+        if not decoded:
+            return _empty_history()
+
+        dates, total, invested = (np.concatenate(col) for col in zip(*decoded))
+        mask = np.ones(len(dates), dtype=bool)
+        if start_date:
+            mask &= dates >= np.datetime64(start_date, 'D')
+        if end_date:
+            mask &= dates <= np.datetime64(end_date, 'D')
+        return dates[mask], total[mask], invested[mask]
+
+    rows = PortfolioSnapshot.objects.filter(user=user)
+    if start_date:
+        rows = rows.filter(date__gte=start_date)
+    if end_date:
+        rows = rows.filter(date__lte=end_date)
+    rows = list(rows.order_by('date').values_list(
+        'date', Cast('total_value', FloatField()), Cast('invested_value', FloatField())
+    ))
+    if not rows:
+        return _empty_history()
+
+    dates, total, invested = zip(*rows)
+    return np.array(dates, dtype='datetime64[D]'), to_paise(total), to_paise(invested)
+
+
+def last_snapshot_date(user):
+    """Date of the user's most recent snapshot, or None."""
+    if storage_mode() == 'columnar':
+        return SnapshotBlock.objects.filter(user=user).order_by('-year').values_list('last_date', flat=True).first()
+    return PortfolioSnapshot.objects.filter(user=user).order_by('-date').values_list('date', flat=True).first()
+
+
+def read_benchmark(user, dates):
+    """
+    Recorded benchmark values for just the given days (e.g. the points a graph kept).
+
+    Only row storage has a benchmark column; in columnar mode this is always empty.
+
+    Returns:
+        dict[date, float]: Day -> benchmark value, for days that have a non-zero one.
+    """
+    if storage_mode() == 'columnar' or len(dates) == 0:
+        return {}
+    rows = PortfolioSnapshot.objects.filter(
+        user=user, date__in=list(dates), benchmark_value__isnull=False
+    ).exclude(benchmark_value=0).values_list('date', Cast('benchmark_value', FloatField()))
+    return dict(rows)
+
+
+# --- Writes ---
+
+def write_history(user, dates, total_paise, invested_paise, from_date=None, to_date=None):
+    """
+    Replaces a user's history from `from_date` onwards (or entirely if None) with the given series.
+    Days before `from_date` (and after `to_date`, if given) are kept as-is. An empty series just clears the range.
+
+    Args:
+        user (User): Owner of the history.
+        dates (array-like): Sorted days (datetime64[D] or date objects).
+        total_paise (array-like[int]): Portfolio value per day in paise.
+        invested_paise (array-like[int]): Invested capital per day in paise.
+        from_date (date, optional): First day covered by the new series.
+        to_date (date, optional): Last day covered by the new series (chunked writes). Ignored without `from_date`.
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    total_paise = np.asarray(total_paise, dtype=np.int64)
+    invested_paise = np.asarray(invested_paise, dtype=np.int64)
+    if storage_mode() == 'columnar':
+        _write_columnar(user.id, dates, total_paise, invested_paise, from_date, to_date)
+    else:
+        _write_rows(user, dates, total_paise, invested_paise, from_date, to_date)
+    invalidate_users([user.id])
+
+
+_SNAPSHOT_FIELDS = ['user_id', 'date', 'total_value', 'invested_value']
+
+
+def _build_rows(user_ids, dates, total_paise, invested_paise):
+    # Plain tuples for the bulk writer; exact int -> Decimal (no float rounding per row)
+    return (
+        (uid, day, paise_to_decimal(value), paise_to_decimal(invested))
+        for uid, day, value, invested in zip(user_ids, dates, total_paise.tolist(), invested_paise.tolist())
+    )
+
+
+def _write_rows(user, dates, total_paise, invested_paise, from_date, to_date=None):
+    # Upsert the recomputed window (whole history if from_date is None); days that became empty are dropped
+    window = PortfolioSnapshot.objects.filter(user=user)
+    if from_date is not None:
+        window = window.filter(date__gte=from_date)
+        if to_date is not None:
+            window = window.filter(date__lte=to_date)
+
+    bulk_upsert(
+        PortfolioSnapshot,
+        _SNAPSHOT_FIELDS,
+        _build_rows([user.id] * len(dates), dates.tolist(), total_paise, invested_paise),
+        unique_fields=['user_id', 'date'],
+        replace=window,
+    )
+
+
+def _write_columnar(user_id, dates, total_paise, invested_paise, from_date, to_date=None):
+    with transaction.atomic():
+        affected = SnapshotBlock.objects.select_for_update().filter(user_id=user_id)
+        if from_date is not None:
+            affected = affected.filter(year__gte=from_date.year)
+            if to_date is not None:
+                affected = affected.filter(year__lte=to_date.year)
+
+            # The first touched year keeps its days before `from_date`, the last one its days after `to_date`
+            head, tail = [], []
+            for block in affected.filter(year__in={from_date.year, to_date.year if to_date else from_date.year}):
+                old_dates, old_total, old_invested = _decode_to_dates(block)
+                before = old_dates < np.datetime64(from_date, 'D')
+                after = old_dates > np.datetime64(to_date, 'D') if to_date else np.zeros(len(old_dates), dtype=bool)
+                head.append((old_dates[before], old_total[before], old_invested[before]))
+                tail.append((old_dates[after], old_total[after], old_invested[after]))
+
+            if head or tail:
+                dates, total_paise, invested_paise = (
+                    np.concatenate(col) for col in zip(*head, (dates, total_paise, invested_paise), *tail)
+                )
+
+        affected.delete()
+        SnapshotBlock.objects.bulk_create(_build_blocks(user_id, dates, total_paise, invested_paise))
+
+
+def append_day(day, user_ids, total_paise, invested_paise):
+    """
+    Writes one day's snapshot for many users at once (the nightly job).
+    An existing snapshot for the same user and day is overwritten.
+
+    Args:
+        day (date): The snapshot date.
+        user_ids (array-like): One entry per user.
+        total_paise (array-like[int]): Portfolio value per user in paise.
+        invested_paise (array-like[int]): Invested capital per user in paise.
+    """
+    user_ids = [int(uid) for uid in user_ids]
+    total_paise = np.asarray(total_paise, dtype=np.int64)
+    invested_paise = np.asarray(invested_paise, dtype=np.int64)
+    if storage_mode() != 'columnar':
+        bulk_upsert(
+            PortfolioSnapshot,
+            _SNAPSHOT_FIELDS,
+            _build_rows(user_ids, [day] * len(user_ids), total_paise, invested_paise),
+            unique_fields=['user_id', 'date'],
+        )
+        invalidate_users(user_ids)
+        return
+
+    day64 = np.datetime64(day, 'D')
+
+    with transaction.atomic():
+        # One read + one upsert for the whole user base
+        existing = {b.user_id: b for b in SnapshotBlock.objects.select_for_update()
+                    .filter(user_id__in=user_ids, year=day.year)}
+
+        blocks = []
+        for i, uid in enumerate(user_ids):
+            dates, total, invested = np.array([day64]), total_paise[i:i + 1], invested_paise[i:i + 1]
+            if uid in existing:
+                old_dates, old_total, old_invested = _decode_to_dates(existing[uid])
+                keep = old_dates != day64
+                dates = np.concatenate([old_dates[keep], dates])
+                total = np.concatenate([old_total[keep], total])
+                invested = np.concatenate([old_invested[keep], invested])
+                order = np.argsort(dates, kind='stable') # usually already sorted (appending today)
+                dates, total, invested = dates[order], total[order], invested[order]
+            blocks.extend(_build_blocks(uid, dates, total, invested))
+
+        SnapshotBlock.objects.bulk_create(
+            blocks,
+            update_conflicts=True,
+            unique_fields=['user', 'year'],
+            update_fields=['first_date', 'last_date', 'n_days', 'data'],
+        )
+    invalidate_users(user_ids)
+
+
+def compact_user_rows(user, delete_rows=False):
+    """
+    Converts a user's PortfolioSnapshot rows into SnapshotBlocks (migration to columnar storage).
+
+    Returns:
+        int: Number of days converted.
+    """
+    rows = list(PortfolioSnapshot.objects.filter(user=user).order_by('date').values_list(
+        'date', Cast('total_value', FloatField()), Cast('invested_value', FloatField())
+    ))
+    dates, total, invested = zip(*rows) if rows else ([], [], [])
+
+    with transaction.atomic():
+        _write_columnar(user.id, np.array(dates, dtype='datetime64[D]'), to_paise(total), to_paise(invested), None)
+        if delete_rows:
+            PortfolioSnapshot.objects.filter(user=user).delete()
+    return len(rows)
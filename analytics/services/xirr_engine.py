@@ -0,0 +1,147 @@
+import logging
+import numpy as np
+from datetime import timedelta
+from django.db.models import Q
+from pyxirr import xirr
+from analytics.models import AssetPriceHistory
+from analytics.services.price_history import PRICE_LOOKBACK_DAYS
+from analytics.services.result_cache import get_or_compute
+from core.utils import get_logical_date
+from portfolio.models import Transaction
+from portfolio.services.valuation import value_portfolio
+
+logger = logging.getLogger(__name__)
+
+# Standard periods: days back from today (None = since the first transaction)
+PERIODS = {'1y': 365, '3y': 3 * 365, 'inception': None}
+
+
+def _as_percent(rate):
+    # pyxirr returns None (silent mode) or NaN when the flows have no solution
+    return round(rate * 100, 2) if rate is not None and np.isfinite(rate) else None
+
+
+class CashFlows:
+    """
+    A user's transactions as contiguous NumPy arrays, sorted by (asset, date).
+
+    Holding `i` owns the slice `starts[i]:ends[i]` of every array, so per-holding work is
+    array slicing, never a Python list per holding.
+    """
+    def __init__(self, rows):
+        n = len(rows)
+        asset_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        self.dates = np.array([r[1] for r in rows], dtype='datetime64[D]')
+        sign = np.fromiter((1.0 if r[2] == 'BUY' else -1.0 for r in rows), dtype=np.float64, count=n)
+        quantity = np.fromiter((float(r[3]) for r in rows), dtype=np.float64, count=n)
+        price = np.fromiter((float(r[4]) for r in rows), dtype=np.float64, count=n)
+
+        self.units = sign * quantity # held quantity delta
+        self.amounts = -sign * quantity * price # BUY = money out (negative), SELL = money in
+        self.asset_ids, self.starts = np.unique(asset_ids, return_index=True)
+        self.ends = np.append(self.starts[1:], n).astype(np.int64)
+
+    @classmethod
+    def for_user(cls, user):
+        return cls(list(
+            Transaction.objects.filter(holding__user=user)
+            .order_by('holding__asset_id', 'date', 'id')
+            .values_list('holding__asset_id', 'date', 'type', 'quantity', 'price')
+        ))
+
+    def split_at(self, cutoff):
+        """Per holding: index of its first flow after `cutoff` and the quantity held at `cutoff`."""
+        if cutoff is None:
+            return self.starts, np.zeros(len(self.starts))
+        cut = np.datetime64(cutoff, 'D')
+        splits = np.array([s + np.searchsorted(self.dates[s:e], cut, side='right')
+                           for s, e in zip(self.starts, self.ends)], dtype=np.int64)
+        held = np.array([self.units[s:k].sum() for s, k in zip(self.starts, splits)])
+        return splits, held
+
+
+def _closes_at(asset_ids, cutoffs):
+    """{(asset_id, cutoff): last close on or before cutoff}, for all pairs in one query."""
+    if not asset_ids or not cutoffs:
+        return {}
+    window = Q()
+    for cutoff in cutoffs:
+        window |= Q(date__gt=cutoff - timedelta(days=PRICE_LOOKBACK_DAYS), date__lte=cutoff)
+    closes = {}
+    for asset_id, day, close in (AssetPriceHistory.objects.filter(window, asset_id__in=asset_ids)
+                                 .order_by('date').values_list('asset_id', 'date', 'close')):
+        for cutoff in cutoffs:
+            if day <= cutoff:
+                closes[(asset_id, cutoff)] = float(close) # ascending dates: the last write wins
+    return closes
+
+
+def compute_xirr(user, valuation=None, today=None):
+    """
+    XIRR per holding and for the whole portfolio, for every period in PERIODS.
+
+    Strategy:
+    1. One query for the user's transactions, packed into contiguous arrays grouped by holding.
+    2. For 1Y/3Y, each holding's position at the period start becomes an opening outflow
+       (quantity held then * that day's stored close; one query for all holdings and periods).
+    3. Today's value (from the shared valuation) is the terminal inflow.
+    4. pyxirr's Rust solver runs over each group's array slices; the portfolio row runs over
+       all groups' flows at once.
+
+    Args:
+        user (User): Whose transactions.
+        valuation (PortfolioValuation, optional): Shared valuation of the user's holdings.
+        today (date, optional): Terminal date and anchor of the 1Y/3Y cutoffs; defaults to the logical day.
+
+    Returns:
+        dict: {'portfolio': {period: pct}, 'holdings': {asset_id: {period: pct}}}.
+        A pct is None when there is no solution or the period's opening price is unknown.
+    """
+    today = today or get_logical_date()
+    valuation = valuation or value_portfolio(user)
+    flows = CashFlows.for_user(user)
+    terminal = {h['asset_id']: h['value'] for h in valuation.holdings}
+
+    cutoffs = {name: today - timedelta(days=days) for name, days in PERIODS.items() if days}
+    splits = {name: flows.split_at(cutoffs.get(name)) for name in PERIODS}
+    needed = {int(a) for name, (_, held) in splits.items() for a, q in zip(flows.asset_ids, held) if q > 0}
+    closes = _closes_at(sorted(needed), sorted(cutoffs.values()))
+
+    today64 = np.datetime64(today, 'D')
+    result = {'portfolio': {}, 'holdings': {int(a): {} for a in flows.asset_ids}}
+    for name, (split, held) in splits.items():
+        cutoff = cutoffs.get(name)
+        all_dates, all_amounts, complete = [], [], True
+
+        for i, asset_id in enumerate(flows.asset_ids.tolist()):
+            k, e = split[i], flows.ends[i]
+            dates, amounts = [flows.dates[k:e]], [flows.amounts[k:e]]
+            if held[i] > 0:
+                price = closes.get((asset_id, cutoff))
+                if price is None:
+                    result['holdings'][asset_id][name] = None
+                    complete = False
+                    continue
+                dates.insert(0, np.array([cutoff], dtype='datetime64[D]'))
+                amounts.insert(0, np.array([-held[i] * price]))
+            if terminal.get(asset_id, 0) > 0:
+                dates.append(np.array([today64]))
+                amounts.append(np.array([terminal[asset_id]]))
+
+            dates, amounts = np.concatenate(dates), np.concatenate(amounts)
+            result['holdings'][asset_id][name] = _as_percent(xirr(dates, amounts, silent=True)) if len(dates) > 1 else None
+            all_dates.append(dates)
+            all_amounts.append(amounts)
+
+        if complete and all_dates:
+            result['portfolio'][name] = _as_percent(xirr(np.concatenate(all_dates), np.concatenate(all_amounts), silent=True))
+        else:
+            result['portfolio'][name] = None
+    return result
+
+
+def get_xirr(user, valuation=None):
+    """`compute_xirr`, cached by the user's analytics data version (see result_cache)."""
+    # Compute for the same logical day that keys the cache, even if the day rolls over meanwhile
+    today = get_logical_date()
+    return get_or_compute(user, lambda u: compute_xirr(u, valuation, today=today), namespace='xirr', day=today)
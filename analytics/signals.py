@@ -1,36 +1,26 @@
 import logging
-import threading
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from portfolio.models import Transaction
-from analytics.services.backfill import backfill_portfolio_history
-from concurrent.futures import ThreadPoolExecutor
+from django.utils.dateparse import parse_date
+from portfolio.models import Holding, Transaction
+from analytics.services.jobs import enqueue_backfill
+from analytics.services.result_cache import invalidate_users
 
 logger = logging.getLogger(__name__)
 
-from django.db import close_old_connections, transaction
-
-def run_backfill_in_background(user):
-    """
-    Executes the portfolio history backfill process in a separate thread.
-    
-    This ensures that expensive calculations (fetching historical data, recalculating daily values)
-    do not block the main request/response cycle for the user.
+@receiver(pre_save, sender=Transaction)
+def remember_previous_date(sender, instance, **kwargs):
     """
-    logger.info(f"🔄 Background Backfill started for user: {user.username}")
-    try:
-        close_old_connections()
-        backfill_portfolio_history(user)
-        logger.info(f"✅ Background Backfill complete for user: {user.username}")
-    except Exception as e:
-        logger.error(f"❌ Background Backfill failed for user {user.username}: {e}", exc_info=True)
+    Captures the stored date of a Transaction before an update.
 
-# Global Executor: Acts as a simple "Queue".
-# max_workers=1 ensures we only process ONE backfill at a time.
-# If 100 users add transactions, they will form a line in memory 
-# instead of crashing the server.
+    If an edit moves a transaction from March to June, history is dirty from March,
+    not June, so the incremental backfill must start at the older of the two dates.
+    """
+    if instance.pk:
+        instance._previous_date = (Transaction.objects.filter(pk=instance.pk)
+                                   .values_list('date', flat=True).first())
 
-executor = ThreadPoolExecutor(max_workers=1)
 
 @receiver(post_save, sender=Transaction)
 @receiver(post_delete, sender=Transaction)
@@ -43,16 +33,41 @@ def trigger_backfill(sender, instance, **kwargs):
     - Transaction Update
     - Transaction Deletion
     
+    Only the history from the earliest affected date onwards is recomputed (incremental mode).
+
     Note:
-    Uses a global `ThreadPoolExecutor` (max_workers=1) to strictly serialize backfills.
-    This protects the server from OOM crashes by ensuring 
-    RAM usage remains constant regardless of concurrent users.
+    The web process only enqueues a durable `BackfillJob`; the heavy lifting happens in
+    `python manage.py run_backfill_worker`, so queued work survives restarts/deploys and
+    backfill throughput scales separately from request serving.
     """
     try:
         user = instance.holding.user
+        if isinstance(kwargs.get('origin'), type(user)):
+            return # The whole account is being deleted: nothing left to backfill
+
+        # Earliest date affected by this write (old date matters when an edit moves a transaction)
+        # (dates set straight from request JSON are still strings at this point)
+        candidates = (instance.date, getattr(instance, '_previous_date', None))
+        dirty_from = min(parse_date(d) if isinstance(d, str) else d for d in candidates if d)
         
-        # Wait for the database commit to finish before queueing the thread
-        transaction.on_commit(lambda: executor.submit(run_backfill_in_background, user))
+        # Wait for the database commit to finish before queueing the job
+        transaction.on_commit(lambda: enqueue_backfill(user, dirty_from), robust=True)
 
     except Exception as e:
         logger.error(f"Error triggering backfill signal: {e}", exc_info=True)
+
+
+@receiver(post_save, sender=Holding)
+@receiver(post_delete, sender=Holding)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def invalidate_analytics(sender, instance, **kwargs):
+    """
+    Holdings and transactions feed XIRR, the sector split and the health score,
+    so any write to them drops the owner's cached analytics payload.
+    """
+    try:
+        holding = instance if sender is Holding else instance.holding
+        invalidate_users([holding.user_id])
+    except Exception as e:
+        logger.error(f"Error invalidating analytics cache: {e}", exc_info=True)
@@ -1,3 +1,588 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pyxirr
+import pandas as pd
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from portfolio.models import Asset, Holding, Transaction
+from .models import AssetPriceHistory, PortfolioSnapshot, BackfillJob, SnapshotBlock
+from .services.backfill import BackfillSuperseded, backfill_portfolio_history, build_holdings_timeline
+from .services.daily_snapshot import snapshot_all_users
+from .services import snapshot_store
+from .services.graph import build_performance_graph, lttb_indices
+from .services.fixed_point import to_paise
+from .services.jobs import (
+    claim_next_job, run_job, enqueue_backfill, queue_depth, limit_address_space, requeue_stale_jobs,
+)
+from .services.price_history import sync_price_history, load_price_frame
+from .services.xirr_engine import compute_xirr, get_xirr
+from portfolio.services.live_prices import refresh_prices
+from core.utils import IST
 
-# Create your tests here.
+User = get_user_model()
+
+
+class PriceHistorySyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.asset = Asset.objects.create(symbol="RELIANCE.NS", name="Reliance Industries Ltd")
+        self.today = date.today()
+
+    def _yahoo_frame(self, start):
+        dates = pd.date_range(start=start, end=self.today, freq='D')
+        # Mimics PriceProvider.get_history(...) for a multi-ticker request
+        return pd.DataFrame({'RELIANCE.NS': range(100, 100 + len(dates))}, index=dates)
+
+    def test_only_missing_tail_is_requested(self):
+        """Test that a second sync asks the provider only for dates after the last stored bar."""
+        start = self.today - timedelta(days=10)
+        stored_until = self.today - timedelta(days=3)
+        AssetPriceHistory.objects.bulk_create([
+            AssetPriceHistory(asset=self.asset, date=start + timedelta(days=i), close=100)
+            for i in range((stored_until - start).days + 1)
+        ])
+
+        with mock.patch('analytics.services.price_history.get_price_provider') as get_provider:
+            get_history = get_provider.return_value.get_history
+            get_history.return_value = self._yahoo_frame(stored_until + timedelta(days=1))
+            sync_price_history([self.asset], start)
+
+        self.assertEqual(get_history.call_args.args[1], stored_until + timedelta(days=1))
+        self.assertEqual(AssetPriceHistory.objects.filter(asset=self.asset).count(), 11)
+
+        # Already synced today: no provider call at all
+        with mock.patch('analytics.services.price_history.get_price_provider') as get_provider:
+            sync_price_history([self.asset], start)
+        get_provider.return_value.get_history.assert_not_called()
+
+    def test_start_before_first_bar_is_fetched_once(self):
+        """Test that a weekend start or a late listing (first bar after `start_date`) doesn't re-fetch the whole range."""
+        listed = self.today - timedelta(days=20)
+        for start in (listed - timedelta(days=2), listed - timedelta(days=200)): # weekend start, listed after the first trade
+            cache.clear()
+            AssetPriceHistory.objects.all().delete()
+            with mock.patch('analytics.services.price_history.get_price_provider') as get_provider:
+                get_history = get_provider.return_value.get_history
+                get_history.return_value = self._yahoo_frame(listed) # the provider has nothing earlier
+                for _ in range(3):
+                    sync_price_history([self.asset], start)
+            self.assertEqual(get_history.call_count, 1)
+            self.assertEqual(get_history.call_args.args[1], start)
+
+        # The next day only the tail is requested, not the range again
+        cache.delete(f"price_history_synced_{self.asset.id}")
+        AssetPriceHistory.objects.filter(date=self.today).delete()
+        with mock.patch('analytics.services.price_history.get_price_provider') as get_provider:
+            get_provider.return_value.get_history.return_value = self._yahoo_frame(self.today)
+            sync_price_history([self.asset], start)
+        self.assertEqual(get_provider.return_value.get_history.call_args.args[1], self.today)
+
+    def test_price_frame_forward_fills_from_lookback(self):
+        """Test that a range starting after the last bar still gets the last known close."""
+        AssetPriceHistory.objects.create(asset=self.asset, date=self.today - timedelta(days=3), close=250)
+        all_dates = pd.date_range(start=self.today - timedelta(days=1), end=self.today, freq='D')
+
+        price_df = load_price_frame([self.asset], all_dates)
+
+        self.assertEqual(list(price_df['RELIANCE.NS']), [250.0, 250.0])
+
+
+@mock.patch('analytics.services.backfill.sync_price_history')
+class IncrementalBackfillTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='investor', password='password123')
+        self.asset = Asset.objects.create(symbol="TCS.NS", name="Tata Consultancy Services")
+        self.holding = Holding.objects.create(user=self.user, asset=self.asset)
+        self.today = date.today()
+        AssetPriceHistory.objects.bulk_create([
+            AssetPriceHistory(asset=self.asset, date=self.today - timedelta(days=i), close=100 + i)
+            for i in range(60)
+        ])
+
+    def _snapshots(self):
+        return list(PortfolioSnapshot.objects.filter(user=self.user).values_list('date', 'total_value', 'invested_value'))
+
+    def test_incremental_matches_full_rebuild(self, _sync):
+        """Test that recomputing from the dirty date gives the same history as a full rebuild."""
+        Transaction.objects.create(holding=self.holding, type='BUY', quantity=10, price=150, date=self.today - timedelta(days=50))
+        backfill_portfolio_history(self.user)
+
+        edit_date = self.today - timedelta(days=20)
+        Transaction.objects.create(holding=self.holding, type='SELL', quantity=4, price=120, date=edit_date)
+        untouched = PortfolioSnapshot.objects.get(user=self.user, date=edit_date - timedelta(days=1))
+
+        backfill_portfolio_history(self.user, from_date=edit_date)
+        incremental = self._snapshots()
+        self.assertEqual(len(incremental), 51)
+
+        # Rows before the dirty date are never rewritten
+        self.assertEqual(PortfolioSnapshot.objects.get(user=self.user, date=untouched.date).pk, untouched.pk)
+
+        backfill_portfolio_history(self.user)
+        self.assertEqual(incremental, self._snapshots())
+
+
+    def test_fixed_point_values_are_exact(self, _sync):
+        """Test that fractional units are valued in integer fixed point (no float drift in the stored Decimals)."""
+        for _ in range(3):
+            Transaction.objects.create(holding=self.holding, type='BUY', quantity='0.1001', price='33.33', date=self.today - timedelta(days=5))
+        AssetPriceHistory.objects.filter(asset=self.asset, date=self.today).update(close='0.0700')
+
+        self.assertEqual(backfill_portfolio_history(self.user), 6)
+        snap = PortfolioSnapshot.objects.get(user=self.user, date=self.today)
+        # 0.3003 x 33.33 = 10.008999 -> 10.01 ; 0.3003 x 0.07 = 0.021021 -> 0.02
+        self.assertEqual((snap.invested_value, snap.total_value), (Decimal('10.01'), Decimal('0.02')))
+
+    def test_streaming_matches_single_pass(self, _sync):
+        """Test that year-chunked processing carries holdings and sparse prices across chunk boundaries."""
+        start = self.today - timedelta(days=3 * 365)
+        # Monthly bars only: gaps are longer than the store's lookback, so the price carry does the bridging
+        AssetPriceHistory.objects.bulk_create([
+            AssetPriceHistory(asset=self.asset, date=start + timedelta(days=d), close=50 + d // 30)
+            for d in range(0, 3 * 365 - 60, 30)
+        ])
+        Transaction.objects.create(holding=self.holding, type='BUY', quantity=10, price=50, date=start)
+        Transaction.objects.create(holding=self.holding, type='SELL', quantity=3, price=70, date=start + timedelta(days=400))
+
+        for storage in ('rows', 'columnar'):
+            with override_settings(ANALYTICS_SNAPSHOT_STORAGE=storage):
+                backfill_portfolio_history(self.user, streaming=False)
+                expected = snapshot_store.read_history_paise(self.user)
+                self.assertEqual(backfill_portfolio_history(self.user, streaming=True), len(expected[0]))
+                for got, want in zip(snapshot_store.read_history_paise(self.user), expected):
+                    np.testing.assert_array_equal(got, want)
+
+                backfill_portfolio_history(self.user, from_date=start + timedelta(days=215), streaming=True)
+                for got, want in zip(snapshot_store.read_history_paise(self.user), expected):
+                    np.testing.assert_array_equal(got, want)
+
+    def test_aborted_streaming_rebuild_keeps_old_history(self, _sync):
+        """Test that a full streaming rebuild failing at its second chunk rolls back instead of truncating history."""
+        start = self.today - timedelta(days=3 * 365)
+        AssetPriceHistory.objects.bulk_create([
+            AssetPriceHistory(asset=self.asset, date=start + timedelta(days=d), close=50 + d // 30)
+            for d in range(0, 3 * 365 - 60, 30)
+        ])
+        Transaction.objects.create(holding=self.holding, type='BUY', quantity=10, price=50, date=start)
+        backfill_portfolio_history(self.user, streaming=True)
+        before = self._snapshots()
+        self.assertGreater(len(before), 2 * 365)
+
+        # Checkpoints: price sync, timeline build, then one per chunk write -> abort at the second chunk
+        polls = iter([False, False, False, True])
+        with self.assertRaises(BackfillSuperseded):
+            backfill_portfolio_history(self.user, streaming=True, should_abort=lambda: next(polls, True))
+        self.assertEqual(self._snapshots(), before)
+
+
+class HoldingsTimelineTest(TestCase):
+    def test_scatter_and_cumsum(self):
+        """Test that same-day trades are summed, opening state seeds day 0 and out-of-range rows are dropped."""
+        holdings, invested = build_holdings_timeline(
+            n_days=4,
+            day_offsets=np.array([1, 1, 2, 9]),
+            asset_cols=np.array([0, 0, 1, 1]),
+            signed_qty=np.array([5.0, -2.0, 1.0, 100.0]),
+            cash_flows=np.array([500.0, -220.0, 50.0, 1.0]),
+            opening_qty=np.array([1.0, 0.0]),
+            opening_invested=100.0,
+        )
+
+        np.testing.assert_array_equal(holdings, [[1, 0], [4, 0], [4, 1], [4, 1]])
+        np.testing.assert_array_equal(invested, [100, 380, 430, 430])
+
+
+class DailySnapshotTest(TestCase):
+    def test_values_all_users_in_one_pass(self):
+        """Test that the nightly job upserts one row per user with the backfill's price rule, so a rebuild matches it."""
+        today = date.today()
+        tcs = Asset.objects.create(symbol="TCS.NS", name="TCS")
+        fund = Asset.objects.create(symbol="120503", name="Some Fund", asset_type='MF', last_price=20)
+        unpriced = Asset.objects.create(symbol="NEWCO.NS", name="NewCo", last_price=500) # no bars yet
+        AssetPriceHistory.objects.create(asset=tcs, date=today - timedelta(days=3), close=90)
+        AssetPriceHistory.objects.create(asset=tcs, date=today - timedelta(days=1), close=100)
+        AssetPriceHistory.objects.create(asset=fund, date=today - timedelta(days=20), close=15) # older than the lookback
+
+        alice = User.objects.create_user(username='alice', password='password123')
+        bob = User.objects.create_user(username='bob', password='password123')
+        carol = User.objects.create_user(username='carol', password='password123')
+        with mock.patch('analytics.signals.enqueue_backfill'):
+            a_tcs = Holding.objects.create(user=alice, asset=tcs)
+            Transaction.objects.create(holding=a_tcs, type='BUY', quantity=10, price=80, date=today - timedelta(days=30))
+            Transaction.objects.create(holding=a_tcs, type='SELL', quantity=4, price=95, date=today - timedelta(days=2))
+            Transaction.objects.create(holding=Holding.objects.create(user=alice, asset=fund),
+                                       type='BUY', quantity=5, price=10, date=today - timedelta(days=30))
+            Transaction.objects.create(holding=Holding.objects.create(user=alice, asset=unpriced),
+                                       type='BUY', quantity=1, price=400, date=today - timedelta(days=30))
+            # Bob sold out, Carol only trades in the future: neither gets a row
+            b_tcs = Holding.objects.create(user=bob, asset=tcs)
+            Transaction.objects.create(holding=b_tcs, type='BUY', quantity=1, price=80, date=today - timedelta(days=10))
+            Transaction.objects.create(holding=b_tcs, type='SELL', quantity=1, price=85, date=today - timedelta(days=5))
+            Transaction.objects.create(holding=Holding.objects.create(user=carol, asset=tcs),
+                                       type='BUY', quantity=1, price=80, date=today + timedelta(days=1))
+
+        PortfolioSnapshot.objects.create(user=alice, date=today, total_value=1, invested_value=1)
+        self.assertEqual(snapshot_all_users(today, sync_prices=False), 1)
+
+        snap = PortfolioSnapshot.objects.get(user=alice, date=today)
+        self.assertEqual(float(snap.total_value), 6 * 100 + 5 * 15) # last_price is never used
+        self.assertEqual(float(snap.invested_value), 800 - 380 + 50 + 400)
+        self.assertEqual(PortfolioSnapshot.objects.filter(date=today).count(), 1)
+
+        with mock.patch('analytics.services.backfill.sync_price_history'):
+            backfill_portfolio_history(alice)
+        rebuilt = PortfolioSnapshot.objects.get(user=alice, date=today)
+        self.assertEqual((rebuilt.total_value, rebuilt.invested_value), (snap.total_value, snap.invested_value))
+
+
+@override_settings(ANALYTICS_SNAPSHOT_STORAGE='columnar')
+class ColumnarSnapshotStoreTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='columnar', password='password123')
+        # Two and a half years with a gap, crossing year boundaries
+        self.dates = np.concatenate([
+            np.arange('2022-06-01', '2023-03-01', dtype='datetime64[D]'),
+            np.arange('2023-04-10', '2024-12-31', dtype='datetime64[D]'),
+        ])
+        rng = np.random.default_rng(7)
+        self.total = np.round(100000 + rng.normal(0, 500, len(self.dates)).cumsum(), 2)
+        self.invested = np.round(np.linspace(50000, 90000, len(self.dates)), 2)
+
+    def test_block_codec_round_trip(self):
+        """Test that encode/decode is lossless to the paisa."""
+        offsets = np.array([0, 1, 2, 5, 364])
+        total = to_paise([1.01, 99999999.99, 0.5, -12.34, 100])
+        invested = to_paise([0, 0, 1, 1, 2])
+        for got, expected in zip(snapshot_store.decode_block(snapshot_store.encode_block(offsets, total, invested)),
+                                 (offsets, total, invested)):
+            np.testing.assert_array_equal(got, expected)
+
+    def test_write_read_and_incremental_rewrite(self):
+        """Test that one block is stored per year and an incremental write keeps days before from_date."""
+        snapshot_store.write_history(self.user, self.dates, to_paise(self.total), to_paise(self.invested))
+        self.assertEqual(list(SnapshotBlock.objects.filter(user=self.user).values_list('year', flat=True)), [2022, 2023, 2024])
+
+        dates, total, invested = snapshot_store.read_history(self.user)
+        np.testing.assert_array_equal(dates, self.dates)
+        np.testing.assert_allclose(total, self.total)
+        np.testing.assert_allclose(invested, self.invested)
+
+        # Rewrite from mid-2023 with a shorter tail: 2024 disappears, early 2023 survives
+        cut = np.datetime64('2023-07-01')
+        tail = np.arange(cut, np.datetime64('2023-08-01'))
+        snapshot_store.write_history(self.user, tail, np.full(len(tail), 500), np.full(len(tail), 400), from_date=date(2023, 7, 1))
+
+        dates, total, _ = snapshot_store.read_history(self.user, start_date=date(2023, 1, 1))
+        np.testing.assert_array_equal(dates, np.concatenate([self.dates[(self.dates >= np.datetime64('2023-01-01')) & (self.dates < cut)], tail]))
+        self.assertEqual(total[-1], 5.0)
+        self.assertEqual(snapshot_store.last_snapshot_date(self.user), date(2023, 7, 31))
+
+    def test_append_day_and_compaction(self):
+        """Test that the nightly append overwrites the same day and compacted rows read back identically."""
+        with override_settings(ANALYTICS_SNAPSHOT_STORAGE='rows'):
+            snapshot_store.write_history(self.user, self.dates, to_paise(self.total), to_paise(self.invested))
+            expected = snapshot_store.read_history(self.user)
+        snapshot_store.compact_user_rows(self.user, delete_rows=True)
+        self.assertFalse(PortfolioSnapshot.objects.filter(user=self.user).exists())
+        for got, want in zip(snapshot_store.read_history(self.user), expected):
+            np.testing.assert_array_equal(got, want)
+
+        snapshot_store.append_day(date(2024, 12, 31), [self.user.id], [100], [100])
+        snapshot_store.append_day(date(2024, 12, 31), [self.user.id], [200], [150])
+        dates, total, invested = snapshot_store.read_history(self.user, start_date=date(2024, 12, 30))
+        self.assertEqual((len(dates), total[-1], invested[-1]), (2, 2.0, 1.5))
+
+
+class PerformanceGraphTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='grapher', password='password123')
+        self.dates = np.arange('2015-01-01', '2025-01-01', dtype='datetime64[D]')
+        self.total = 1000 + np.sin(np.arange(len(self.dates)) / 50) * 100
+        self.total[1234] = 5000 # one-day spike must survive downsampling
+        snapshot_store.write_history(self.user, self.dates, to_paise(self.total), np.full(len(self.dates), 90000))
+        self.client.force_login(self.user)
+
+    def test_lttb_keeps_endpoints_and_extremes(self):
+        """Test that LTTB returns exactly n points including the ends and the spike."""
+        idx = lttb_indices(self.dates.astype(np.int64), self.total, 200)
+        self.assertEqual(len(idx), 200)
+        self.assertEqual((idx[0], idx[-1]), (0, len(self.dates) - 1))
+        self.assertIn(1234, idx)
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+    def test_range_resolution_and_budget(self):
+        """Test that the endpoint filters the range, resamples to period ends and caps the point count."""
+        res = self.client.get('/api/analytics/performance-graph/',
+                              {'start': '2020-01-01', 'end': '2020-12-31', 'resolution': 'monthly'})
+        body = res.json()
+        self.assertEqual((body['source_points'], len(body['performance_graph'])), (12, 12))
+        self.assertEqual(body['performance_graph'][0]['date'], '2020-01-31')
+
+        body = self.client.get('/api/analytics/performance-graph/', {'max_points': 100}).json()
+        self.assertEqual((body['source_points'], len(body['performance_graph'])), (len(self.dates), 100))
+
+        self.assertEqual(self.client.get('/api/analytics/performance-graph/', {'resolution': 'hourly'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/performance-graph/', {'start': '2020-13-01'}).status_code, 400)
+
+    def test_kept_points_carry_recorded_benchmark(self):
+        """Test that downsampled points keep the benchmark value recorded on their snapshot, like the old dashboard."""
+        PortfolioSnapshot.objects.filter(user=self.user, date=date(2024, 12, 31)).update(benchmark_value=Decimal('23644.80'))
+        points = build_performance_graph(self.user, max_points=100)['points']
+        self.assertEqual(points[-1]['benchmark'], 23644.8)
+        self.assertIsNone(points[0]['benchmark'])
+
+
+class BenchBackfillCommandTest(TestCase):
+    def test_reports_stage_timings_as_json(self):
+        """Test that the benchmark runs offline and reports one timed case per matrix cell, then cleans up."""
+        with tempfile.NamedTemporaryFile(suffix='.json') as out:
+            call_command('bench_backfill', assets=[1, 3], transactions=[20], years=[1], repeat=1, output=out.name, stderr=mock.Mock())
+            report = json.loads(open(out.name).read())
+
+        self.assertEqual([(c['assets'], c['transactions'], c['years']) for c in report['cases']], [(1, 20, 1), (3, 20, 1)])
+        for case in report['cases']:
+            self.assertEqual(set(case['stages_ms']), {'load', 'fetch', 'timeline', 'valuation', 'write'})
+            self.assertGreater(case['rows_written'], 300)
+        self.assertFalse(User.objects.filter(username__startswith='bench_backfill').exists())
+        self.assertFalse(Asset.objects.filter(symbol__startswith='BENCH').exists())
+
+
+class BackfillJobQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queued', password='password123')
+        asset = Asset.objects.create(symbol="INFY.NS", name="Infosys")
+        self.holding = Holding.objects.create(user=self.user, asset=asset)
+
+    def test_transaction_write_only_enqueues(self):
+        """Test that saving a transaction queues a durable job from its date instead of running the backfill."""
+        tx_date = date.today() - timedelta(days=5)
+        with mock.patch('analytics.services.jobs.backfill_portfolio_history') as backfill:
+            with self.captureOnCommitCallbacks(execute=True):
+                Transaction.objects.create(holding=self.holding, type='BUY', quantity=1, price=10, date=tx_date)
+        backfill.assert_not_called()
+
+        job = BackfillJob.objects.get(user=self.user)
+        self.assertEqual((job.status, job.from_date), ('PENDING', tx_date))
+
+    def test_failed_job_is_retried_then_failed(self):
+        """Test that a failing job backs off and is marked FAILED after max_attempts."""
+        BackfillJob.objects.create(user=self.user, max_attempts=2)
+
+        with mock.patch('analytics.services.jobs.backfill_portfolio_history', side_effect=RuntimeError("Yahoo down")):
+            self.assertFalse(run_job(claim_next_job()))
+            job = BackfillJob.objects.get(user=self.user)
+            self.assertEqual(job.status, 'PENDING')
+            self.assertIsNone(claim_next_job()) # Backoff: not runnable yet
+
+            BackfillJob.objects.update(run_after=job.created_at)
+            self.assertFalse(run_job(claim_next_job()))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('FAILED', 2, 'Yahoo down'))
+
+    def test_submissions_coalesce_into_one_pending_job(self):
+        """Test that repeated submissions merge into one job covering the earliest dirty date."""
+        today = date.today()
+        for days_ago in (3, 10, 7):
+            enqueue_backfill(self.user, today - timedelta(days=days_ago))
+
+        job = BackfillJob.objects.get(user=self.user)
+        self.assertEqual(job.from_date, today - timedelta(days=10))
+        self.assertEqual(queue_depth()['pending'], 1)
+
+    def test_running_job_is_superseded_by_new_edits(self):
+        """Test that a new edit flags the running job, which then aborts instead of writing stale history."""
+        BackfillJob.objects.create(user=self.user, from_date=date.today())
+        running = claim_next_job()
+
+        pending = enqueue_backfill(self.user, date.today() - timedelta(days=1))
+        self.assertNotEqual(pending.pk, running.pk)
+        self.assertEqual(pending.from_date, date.today() - timedelta(days=1))
+
+        with mock.patch('analytics.services.backfill.sync_price_history'):
+            self.assertFalse(run_job(running))
+
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'SUPERSEDED')
+        self.assertIsNone(claim_next_job()) # debounced, not runnable yet
+
+    def test_only_jobs_with_a_stale_heartbeat_are_requeued(self):
+        """Test that a long job that keeps beating stays RUNNING, and a re-queued job's old worker can't overwrite it."""
+        BackfillJob.objects.create(user=self.user)
+        job = claim_next_job()
+        long_ago = timezone.now() - timedelta(hours=2)
+        BackfillJob.objects.filter(pk=job.pk).update(started_at=long_ago, heartbeat_at=long_ago)
+
+        def beating_backfill(user, from_date, should_abort):
+            self.assertFalse(should_abort()) # one stage done: heartbeat
+            self.assertEqual(requeue_stale_jobs(900), 0)
+            BackfillJob.objects.filter(pk=job.pk).update(heartbeat_at=long_ago) # then the worker stalls
+            self.assertEqual(requeue_stale_jobs(900), 1)
+            return 0
+
+        with mock.patch('analytics.services.jobs.backfill_portfolio_history', side_effect=beating_backfill):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'PENDING') # left for the next worker, not marked DONE
+
+        # A re-queued job's worker stops at its next checkpoint instead of writing
+        job = claim_next_job()
+        BackfillJob.objects.filter(pk=job.pk).update(status='PENDING')
+        with mock.patch('analytics.services.backfill.sync_price_history'):
+            self.assertFalse(run_job(job))
+        self.assertEqual(BackfillJob.objects.get(pk=job.pk).status, 'PENDING')
+
+    def test_retry_racing_a_new_submission_is_superseded(self):
+        """Test that a failing job whose retry would collide with a freshly queued job yields to it."""
+        BackfillJob.objects.create(user=self.user)
+        job = claim_next_job()
+
+        def fails_after_new_edit(user, from_date, should_abort):
+            BackfillJob.objects.create(user=self.user) # lands after the superseded check would have run
+            raise RuntimeError("Yahoo down")
+
+        with mock.patch('analytics.services.jobs.backfill_portfolio_history', side_effect=fails_after_new_edit):
+            self.assertFalse(run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('SUPERSEDED', 'Yahoo down'))
+        self.assertEqual(BackfillJob.objects.filter(user=self.user, status='PENDING').count(), 1)
+
+    def test_job_over_rss_ceiling_is_aborted_and_retried(self):
+        """Test that a job crossing the per-job memory ceiling fails its attempt instead of running on."""
+        BackfillJob.objects.create(user=self.user, max_attempts=3)
+
+        self.assertFalse(run_job(claim_next_job(), max_rss_mb=1))
+
+        job = BackfillJob.objects.get(user=self.user)
+        self.assertEqual(job.status, 'PENDING')
+        self.assertIn("RSS ceiling exceeded", job.last_error)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "RLIMIT_AS is only enforced on Linux")
+    def test_address_space_cap_turns_oversized_allocations_into_memory_errors(self):
+        """Test that under the worker's hard cap a too-large allocation raises MemoryError instead of growing."""
+        def child():
+            # Exit codes only: under the cap the child can't spare memory for a result queue's thread
+            if limit_address_space(64) is None:
+                os._exit(2)
+            try:
+                np.ones(256 * 1024 * 1024, dtype=np.uint8)
+            except MemoryError:
+                os._exit(0)
+            os._exit(1)
+
+        proc = multiprocessing.get_context('fork').Process(target=child) # keeps the cap out of the test process
+        proc.start()
+        proc.join(timeout=30)
+        self.assertEqual(proc.exitcode, 0)
+
+
+@mock.patch('analytics.views.calculate_portfolio_metrics', return_value={'beta': 1.0, 'volatility': 'Low'})
+@mock.patch('analytics.views.calculate_portfolio_xirr', return_value=12.5)
+class AnalyticsResultCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='password123')
+        self.other = User.objects.create_user(username='neighbour', password='password123')
+        self.tcs = Asset.objects.create(symbol='TCS.NS', name='TCS', last_price=3500)
+        self.infy = Asset.objects.create(symbol='INFY.NS', name='Infosys', last_price=1500)
+        self.holding = Holding.objects.create(user=self.user, asset=self.tcs, quantity=1, avg_buy_price=3000)
+        Holding.objects.create(user=self.other, asset=self.infy, quantity=1, avg_buy_price=1000)
+        Asset.objects.update(updated_at=timezone.now() - timedelta(minutes=10)) # both prices due for a refresh
+        self.tcs.refresh_from_db()
+        self.infy.refresh_from_db()
+        self.client.force_login(self.user)
+
+    def _view(self):
+        response = self.client.get('/api/analytics/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @mock.patch('portfolio.services.live_prices.get_price_provider')
+    def test_recomputed_only_when_inputs_change(self, get_provider, xirr, _metrics):
+        """Test that repeat views hit the cache, and only the user's own writes or held prices invalidate it."""
+        self._view()
+        self.assertEqual(self._view()['metrics']['xirr'], 12.5)
+        self.assertEqual(xirr.call_count, 1)
+
+        # Someone else's asset moved: still cached
+        get_provider.return_value.get_quotes.return_value = {'INFY.NS': 1600.0}
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_prices([self.infy])
+        self._view()
+        self.assertEqual(xirr.call_count, 1)
+
+        # A held asset moved
+        get_provider.return_value.get_quotes.return_value = {'TCS.NS': 3600.0}
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_prices([self.tcs])
+        self._view()
+        self.assertEqual(xirr.call_count, 2)
+
+        # A transaction, then a snapshot rebuild
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(holding=self.holding, type='BUY', quantity=1, price=3500, date=date.today())
+        self._view()
+        with self.captureOnCommitCallbacks(execute=True):
+            snapshot_store.append_day(date.today(), [self.user.id], [700000], [650000])
+        self._view()
+        self._view()
+        self.assertEqual(xirr.call_count, 4)
+
+
+class XirrEngineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = date.today()
+        self.user = User.objects.create_user(username='xirr', password='password123')
+        self.tcs = Asset.objects.create(symbol='TCS.NS', name='TCS', sector='IT', last_price=121)
+        self.hdfc = Asset.objects.create(symbol='HDFCBANK.NS', name='HDFC Bank', sector='Finance', last_price=200)
+        for asset, qty, price, days_ago in ((self.tcs, 10, 100, 730), (self.hdfc, 5, 200, 100)):
+            holding = Holding.objects.create(user=self.user, asset=asset)
+            Transaction.objects.create(holding=holding, type='BUY', quantity=qty, price=price,
+                                       date=self.today - timedelta(days=days_ago))
+        # TCS compounds 10% a year: 100 -> 110 a year ago -> 121 today
+        AssetPriceHistory.objects.create(asset=self.tcs, date=self.today - timedelta(days=367), close=110)
+
+    def test_per_holding_and_period_xirr(self):
+        """Test XIRR per holding and per period, with the 1Y opening position valued at the period start."""
+        report = compute_xirr(self.user, today=self.today)
+
+        self.assertEqual(report['holdings'][self.tcs.id], {'1y': 10.0, '3y': 10.0, 'inception': 10.0})
+        self.assertEqual(report['holdings'][self.hdfc.id], {'1y': 0.0, '3y': 0.0, 'inception': 0.0})
+
+        # Portfolio rows solve all holdings' flows together
+        one_year = pyxirr.xirr([self.today - timedelta(days=365), self.today - timedelta(days=100), self.today],
+                               [-10 * 110, -1000, 1210 + 1000])
+        self.assertEqual(report['portfolio']['1y'], round(one_year * 100, 2))
+        legacy = pyxirr.xirr([self.today - timedelta(days=730), self.today - timedelta(days=100), self.today],
+                             [-1000, -1000, 1210 + 1000])
+        self.assertEqual(report['portfolio']['inception'], round(legacy * 100, 2))
+
+    def test_unknown_opening_price_gives_no_period_xirr(self):
+        """Test that a period whose opening price is not stored reports None instead of a wrong number."""
+        AssetPriceHistory.objects.all().delete()
+        report = compute_xirr(self.user, today=self.today)
+        self.assertIsNone(report['holdings'][self.tcs.id]['1y'])
+        self.assertIsNone(report['portfolio']['1y'])
+        self.assertEqual(report['portfolio']['3y'], report['portfolio']['inception'])
+
+    def test_cached_xirr_runs_for_the_logical_day(self):
+        """Test that before the 4am IST rollover, get_xirr values the portfolio as of the logical day that keys its cache."""
+        before_rollover = datetime.combine(self.today, time(2, 0), tzinfo=IST)
+        with mock.patch('django.utils.timezone.now', return_value=before_rollover):
+            report = get_xirr(self.user)
+            self.assertEqual(compute_xirr(self.user), report)
+        self.assertEqual(compute_xirr(self.user, today=self.today - timedelta(days=1)), report)
+        self.assertNotEqual(compute_xirr(self.user, today=self.today), report)
@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('analytics/dashboard/', views.portfolio_analytics, name='analytics_dashboard'),
+    path('analytics/performance-graph/', views.performance_graph, name='performance_graph'),
     path('analytics/home-summary/', views.home_summary, name='home_summary'),
+    path('analytics/backfill-queue/', views.backfill_queue_status, name='backfill_queue_status'),
 ]
\ No newline at end of file
@@ -2,14 +2,18 @@ import logging
 from django.http import JsonResponse
 from django.db.models import Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_GET
 
 from .services.calculators import calculate_portfolio_xirr, get_sector_split
 from .services.metrics import calculate_portfolio_metrics, calculate_health_score
-from .models import PortfolioSnapshot
+from .services.jobs import queue_depth
+from .services.result_cache import get_or_compute
+from .services.xirr_engine import get_xirr
+from .services.graph import build_performance_graph, RESOLUTIONS, DEFAULT_MAX_POINTS, MAX_POINTS_LIMIT
 from ledger.models import Expense
-from portfolio.models import Holding
+from portfolio.services.valuation import value_portfolio
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +23,15 @@ def portfolio_analytics(request):
     API Endpoint: Returns detailed portfolio analytics.
 
     Data Included:
-    - XIRR (Extended Internal Rate of Return)
+    - XIRR (Extended Internal Rate of Return), since inception and per period (1Y/3Y)
     - Risk Metrics (Beta, Volatility)
     - Portfolio Health Score
     - Sector Allocation
     - Historical Performance Graph Data
 
+    The payload is cached per user and only recomputed when its inputs change
+    (transactions, held asset prices, snapshot rebuilds; see services/result_cache.py).
+
     Returns:
         JSON response with metrics and graph data.
     """
@@ -32,41 +39,85 @@ def portfolio_analytics(request):
         return JsonResponse({"error": "Authentication required"}, status=401)
 
     try:
-        user = request.user
-        
-        # Calculate complex metrics (delegated to services)
-        xirr_value = calculate_portfolio_xirr(user)
-        sectors = get_sector_split(user)
-        risk_metrics = calculate_portfolio_metrics(user)
-        health_score = calculate_health_score(user)
-
-        # Fetch historical data for the graph
-        snapshots = PortfolioSnapshot.objects.filter(user=user).order_by('date')
-        
-        performance_data = [{
-            "name": s.date.strftime('%b-%y'),
-            "date": s.date.isoformat(),
-            "portfolio": float(s.total_value),
-            "invested": float(s.invested_value),
-            "benchmark": float(s.benchmark_value) if s.benchmark_value else None,
-        } for s in snapshots]
-
-        return JsonResponse({
-            "metrics": {
-                "xirr": xirr_value,
-                "beta": risk_metrics.get('beta', 0),
-                "volatility": risk_metrics.get('volatility', 0),
-                "health_score": health_score,
-            },
-            "sectors": sectors,
-            "performance_graph": performance_data
-        })
+        return JsonResponse(get_or_compute(request.user, _compute_portfolio_analytics))
 
     except Exception as e:
         logger.error(f"Error generating portfolio analytics for user {request.user.username}: {e}", exc_info=True)
         return JsonResponse({"error": "Failed to calculate analytics"}, status=500)
 
 
+def _compute_portfolio_analytics(user):
+    # One valuation query shared by every holdings-based metric
+    valuation = value_portfolio(user)
+
+    # Calculate complex metrics (delegated to services)
+    xirr_value = calculate_portfolio_xirr(user, valuation)
+    sectors = get_sector_split(user, valuation)
+    risk_metrics = calculate_portfolio_metrics(user)
+    health_score = calculate_health_score(user, valuation)
+
+    # Historical data for the graph, downsampled to a fixed budget
+    # (the full-range / zoomed view lives at /api/analytics/performance-graph/)
+    performance_data = build_performance_graph(user)["points"]
+
+    return {
+        "metrics": {
+            "xirr": xirr_value,
+            "xirr_periods": get_xirr(user, valuation)['portfolio'], # same cached batch as `xirr`
+            "beta": risk_metrics.get('beta', 0),
+            "volatility": risk_metrics.get('volatility', 0),
+            "health_score": health_score,
+        },
+        "sectors": sectors,
+        "performance_graph": performance_data
+    }
+
+
+@require_GET
+def performance_graph(request):
+    """
+    API Endpoint: Returns the portfolio performance graph for a date range.
+
+    Query params:
+    - start, end (YYYY-MM-DD, optional): Range to plot. Defaults to the whole history.
+    - resolution: daily | weekly | monthly (period-end values). Defaults to daily.
+    - max_points: Upper bound on returned points (shape-preserving LTTB downsampling).
+
+    Returns:
+        JSON response with the graph points and how many points they were reduced from.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    start = request.GET.get('start')
+    end = request.GET.get('end')
+    resolution = request.GET.get('resolution', 'daily')
+    try:
+        start_date = parse_date(start) if start else None
+        end_date = parse_date(end) if end else None
+        max_points = int(request.GET.get('max_points', DEFAULT_MAX_POINTS))
+    except ValueError:
+        return JsonResponse({"error": "Invalid start, end or max_points"}, status=400)
+
+    if (start and start_date is None) or (end and end_date is None):
+        return JsonResponse({"error": "Dates must be YYYY-MM-DD"}, status=400)
+    if resolution not in RESOLUTIONS:
+        return JsonResponse({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}, status=400)
+    if not 3 <= max_points <= MAX_POINTS_LIMIT:
+        return JsonResponse({"error": f"max_points must be between 3 and {MAX_POINTS_LIMIT}"}, status=400)
+
+    try:
+        graph = build_performance_graph(request.user, start_date, end_date, resolution, max_points)
+        return JsonResponse({
+            "resolution": resolution,
+            "source_points": graph["source_points"],
+            "performance_graph": graph["points"],
+        })
+    except Exception as e:
+        logger.error(f"Error building performance graph for user {request.user.username}: {e}", exc_info=True)
+        return JsonResponse({"error": "Failed to load graph"}, status=500)
+
+
 @require_GET
 def home_summary(request):
     """
@@ -93,9 +144,8 @@ def home_summary(request):
             date__year=today.year
         ).aggregate(Sum('amount'))['amount__sum'] or 0
 
-        # 2. Calculate Real-time Net Worth
-        holdings = Holding.objects.filter(user=request.user).select_related('asset')
-        net_worth = sum(h.quantity * h.asset.last_price for h in holdings)
+        # 2. Calculate Real-time Net Worth (summed in SQL)
+        net_worth = value_portfolio(request.user).total_value
 
         return JsonResponse({
             "monthly_spend": float(month_spend),
@@ -107,3 +157,17 @@ def home_summary(request):
     except Exception as e:
         logger.error(f"Error generating home summary for user {request.user.username}: {e}", exc_info=True)
         return JsonResponse({"error": "Failed to load summary"}, status=500)
+
+
+@require_GET
+def backfill_queue_status(request):
+    """
+    API Endpoint (Admins only): Returns the depth of the backfill job queue.
+
+    Used to watch for backpressure: a growing `pending` count or `oldest_pending_seconds`
+    means workers can't keep up and `run_backfill_worker --workers` should be raised.
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "Admins only"}, status=403)
+
+    return JsonResponse(queue_depth())
@@ -0,0 +1,114 @@
+import csv
+import io
+import itertools
+import logging
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Rows buffered per COPY round trip (keeps the CSV buffer small for very long histories)
+COPY_BATCH_ROWS = 50_000
+
+
+def bulk_upsert(model, fields, rows, unique_fields, update_fields=None, replace=None, batch_size=5000):
+    """
+    Writes a large batch of rows into `model`'s table, merging on a unique key.
+
+    Strategy:
+    - PostgreSQL: rows are streamed with `COPY ... FROM STDIN` into a temp staging table,
+      then merged with a single `INSERT ... SELECT ... ON CONFLICT` (no model instances,
+      no giant multi-row INSERT).
+    - Other backends (SQLite in tests/dev): plain `bulk_create` with the same conflict rules.
+
+    Columns not listed in `fields` are left to the database, so they must be nullable
+    (or have a `db_default`) on the PostgreSQL path.
+
+    Args:
+        model (Model): Target model.
+        fields (list[str]): Field attnames (e.g. 'user_id') in the order of each row.
+        rows (iterable[tuple]): DB-ready values (date, Decimal, int, str or None). Consumed once.
+        unique_fields (list[str]): Conflict target; must match a unique constraint.
+        update_fields (list[str], optional): Columns overwritten on conflict. Defaults to every
+            non-key field; [] keeps existing rows untouched (ON CONFLICT DO NOTHING).
+        replace (QuerySet, optional): Window being rewritten. Rows in it whose key is not in
+            `rows` are deleted, so the window ends up holding exactly the new data.
+        batch_size (int): bulk_create batch size for the fallback path.
+
+    Returns:
+        int: Number of rows written (staged).
+    """
+    if update_fields is None:
+        update_fields = [f for f in fields if f not in unique_fields]
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            return _copy_upsert(model, fields, rows, unique_fields, update_fields, replace)
+        return _orm_upsert(model, fields, rows, unique_fields, update_fields, replace, batch_size)
+
+
+def _orm_upsert(model, fields, rows, unique_fields, update_fields, replace, batch_size):
+    objs = [model(**dict(zip(fields, row))) for row in rows]
+
+    if replace is not None:
+        new_keys = {tuple(getattr(o, f) for f in unique_fields) for o in objs}
+        stale = [pk for pk, *key in replace.values_list('pk', *unique_fields) if tuple(key) not in new_keys]
+        if stale:
+            model.objects.filter(pk__in=stale).delete()
+
+    if update_fields:
+        model.objects.bulk_create(objs, batch_size=batch_size, update_conflicts=True,
+                                  unique_fields=unique_fields, update_fields=update_fields)
+    else:
+        model.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+    return len(objs)
+
+
+def _copy_upsert(model, fields, rows, unique_fields, update_fields, replace):
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    stage = qn(f"stage_{opts.db_table}")
+    column = {f: qn(opts.get_field(f).column) for f in fields}
+    cols = ", ".join(column[f] for f in fields)
+
+    written = 0
+    with connection.cursor() as cursor:
+        # Same column types as the target, but no constraints/indexes: COPY runs at full speed
+        cursor.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA")
+
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, COPY_BATCH_ROWS)):
+            buf = io.StringIO()
+            csv.writer(buf).writerows(batch) # None -> empty unquoted field = NULL in CSV mode
+            buf.seek(0)
+            _copy_in(cursor, f"COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+            written += len(batch)
+
+        if replace is not None:
+            window_sql, params = replace.order_by().values('pk').query.sql_with_params()
+            same_key = " AND ".join(f"s.{column[f]} = t.{column[f]}" for f in unique_fields)
+            cursor.execute(
+                f"DELETE FROM {table} t WHERE t.{qn(opts.pk.column)} IN ({window_sql}) "
+                f"AND NOT EXISTS (SELECT 1 FROM {stage} s WHERE {same_key})",
+                params,
+            )
+
+        conflict = ", ".join(column[f] for f in unique_fields)
+        if update_fields:
+            action = "DO UPDATE SET " + ", ".join(f"{column[f]} = EXCLUDED.{column[f]}" for f in update_fields)
+        else:
+            action = "DO NOTHING"
+        cursor.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage} ON CONFLICT ({conflict}) {action}")
+        cursor.execute(f"DROP TABLE {stage}")
+
+    logger.debug(f"COPY upsert: {written} rows into {opts.db_table}")
+    return written
+
+
+def _copy_in(cursor, sql, buf):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'): # psycopg2
+        raw.copy_expert(sql, buf)
+    else: # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(buf.read())
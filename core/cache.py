@@ -0,0 +1,126 @@
+import base64
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connections, router
+from django.utils.timezone import now as tz_now
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Per-process counters for a cache backend: calls, hits/misses and time spent, per operation."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    @contextmanager
+    def timed(self, op):
+        outcome = {'hits': 0, 'misses': 0}
+        started = time.perf_counter()
+        try:
+            yield outcome
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stats = self._ops.setdefault(op, {'calls': 0, 'hits': 0, 'misses': 0, 'total_ms': 0.0})
+                stats['calls'] += 1
+                stats['hits'] += outcome['hits']
+                stats['misses'] += outcome['misses']
+                stats['total_ms'] += elapsed_ms
+
+    def snapshot(self):
+        with self._lock:
+            ops = {op: dict(s, total_ms=round(s['total_ms'], 1), avg_ms=round(s['total_ms'] / s['calls'], 2))
+                   for op, s in self._ops.items()}
+        lookups = sum(ops[op]['hits'] + ops[op]['misses'] for op in ('get', 'get_many') if op in ops)
+        hits = sum(ops[op]['hits'] for op in ('get', 'get_many') if op in ops)
+        return {'ops': ops, 'hit_rate': round(hits / lookups, 3) if lookups else None}
+
+
+class InstrumentedDatabaseCache(DatabaseCache):
+    """
+    Django's database cache with per-operation timings and hit/miss counters.
+
+    One table shared by every gunicorn worker, the daemons and the backfill workers, so
+    cached market data and "only one refresh" claims hold across processes without Redis.
+
+    `add` is overridden to be atomic: Django's version selects the row, then updates it if it
+    expired, so two processes can both "win" an expired claim. Here it is one
+    `INSERT ... ON CONFLICT DO UPDATE ... WHERE expires < now` (PostgreSQL and SQLite), and the
+    claim is won iff a row was written. For `add`, hits = claims won, misses = claims lost.
+
+    Needs its table: `python manage.py createcachetable` (Procfile release step).
+    """
+    def __init__(self, table, params):
+        super().__init__(table, params)
+        self.stats = CacheStats()
+
+    def get(self, key, default=None, version=None):
+        with self.stats.timed('get') as outcome:
+            # DatabaseCache.get goes through get_many: call the parent's directly to count once
+            value = super().get_many([key], version).get(key, _MISSING)
+            outcome['hits' if value is not _MISSING else 'misses'] += 1
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with self.stats.timed('get_many') as outcome:
+            values = super().get_many(keys, version)
+            outcome['hits'], outcome['misses'] = len(values), len(keys) - len(values)
+        return values
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.stats.timed('add') as outcome:
+            added = self._atomic_add(key, value, timeout, version)
+            outcome['hits' if added else 'misses'] += 1
+        return added
+
+    def _atomic_add(self, key, value, timeout, version):
+        db = router.db_for_write(self.cache_model_class)
+        connection = connections[db]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            return super().add(key, value, timeout, version) # no ON CONFLICT upsert
+
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        now = tz_now().replace(microsecond=0)
+        if timeout is None:
+            expires = datetime.max
+        else:
+            expires = datetime.fromtimestamp(timeout, tz=timezone.utc if settings.USE_TZ else None)
+        value = base64.b64encode(pickle.dumps(value, self.pickle_protocol)).decode('latin1')
+
+        table = connection.ops.quote_name(self._table)
+        with connection.cursor() as cursor:
+            # Same MAX_ENTRIES culling as DatabaseCache's writes
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            num = cursor.fetchone()[0]
+            if num > self._max_entries:
+                self._cull(db, cursor, now, num)
+            # Written (inserted, or an expired row taken over) -> rowcount 1; live row -> 0
+            cursor.execute(
+                f"INSERT INTO {table} (cache_key, value, expires) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (cache_key) DO UPDATE SET value = EXCLUDED.value, expires = EXCLUDED.expires "
+                f"WHERE {table}.expires < %s",
+                [key, value, connection.ops.adapt_datetimefield_value(expires.replace(microsecond=0)),
+                 connection.ops.adapt_datetimefield_value(now)],
+            )
+            return cursor.rowcount == 1
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.stats.timed('set'):
+            super().set(key, value, timeout, version)
+
+    def delete(self, key, version=None):
+        with self.stats.timed('delete'):
+            return super().delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        with self.stats.timed('delete_many'):
+            return super().delete_many(keys, version)
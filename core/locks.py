@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+_stats = {} # name -> counters
+
+
+def _advisory_key(name):
+    # pg advisory locks take a signed bigint
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def _record(name, acquired, held_seconds=0.0):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {'acquired': 0, 'busy': 0, 'held_ms': 0.0})
+        stats['acquired' if acquired else 'busy'] += 1
+        stats['held_ms'] += held_seconds * 1000
+
+
+@contextmanager
+def distributed_lock(name, timeout=60):
+    """
+    Non-blocking lock shared by every process of the deployment.
+
+    - PostgreSQL: a session advisory lock (`pg_try_advisory_lock`). It dies with the
+      connection, so a crashed holder never leaves it stuck.
+    - Other databases (SQLite in dev/tests): a `cache.add` claim that expires after `timeout`.
+      Only as exclusive as the cache's `add`: atomic on `core.cache.InstrumentedDatabaseCache`
+      (an upsert), not on Django's stock DatabaseCache, whose `add` can hand an expired claim to two callers.
+
+    Usage:
+        with distributed_lock('market_refresh') as acquired:
+            if not acquired:
+                return # somebody else is on it
+
+    Yields:
+        bool: Whether this caller holds the lock.
+    """
+    if connection.vendor == 'postgresql':
+        key = _advisory_key(name)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [key])
+            acquired = cursor.fetchone()[0]
+
+        def release():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+    else:
+        lock_key, token = f"lock:{name}", uuid.uuid4().hex
+        acquired = cache.add(lock_key, token, timeout)
+
+        def release():
+            # Only drop the claim if it is still ours (it may have expired and been re-taken)
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    started = time.perf_counter()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release()
+        _record(name, acquired, time.perf_counter() - started if acquired else 0.0)
+        if not acquired:
+            logger.info(f"🔒 Lock '{name}' is held by another process. Skipping.")
+
+
+def lock_metrics():
+    """Per-lock counters for this process: acquisitions, attempts that found it busy, time held."""
+    with _stats_lock:
+        return {name: dict(s, held_ms=round(s['held_ms'], 1)) for name, s in _stats.items()}
@@ -0,0 +1,63 @@
+import pandas as pd
+
+
+class PriceProvider:
+    """
+    One interface for every source of market data (Yahoo, MFAPI, recorded fixtures...).
+
+    Callers never talk to yfinance/requests directly, so the whole app can run against
+    `FixtureProvider` on an offline box (benchmarks, load tests, CI).
+
+    Conventions:
+    - Symbols are passed exactly as the provider knows them (Yahoo tickers, AMFI codes).
+    - Symbols a provider has no data for are simply missing from the result.
+    """
+    name = 'base'
+
+    def get_history(self, symbols, start, end=None):
+        """
+        Daily closes for `symbols` between `start` and `end` (inclusive, default today).
+
+        Returns:
+            pd.DataFrame: Naive DatetimeIndex (one row per trading day), one float column per symbol.
+        """
+        raise NotImplementedError
+
+    def get_quotes(self, symbols):
+        """
+        Latest price for each symbol.
+
+        Returns:
+            dict: {symbol: float}, only for symbols with a positive price.
+        """
+        raise NotImplementedError
+
+    def get_info(self, symbol):
+        """
+        Metadata used when a new asset is discovered via search.
+
+        Returns:
+            dict | None: {"price", "name", "sector", "market_cap"} or None if unknown.
+        """
+        return None
+
+    def get_news(self, symbol):
+        """Raw news items attached to a symbol (Yahoo format)."""
+        return []
+
+    def list_schemes(self):
+        """Master list of Mutual Fund schemes: [{"schemeCode", "schemeName"}, ...]."""
+        return []
+
+
+def normalize_history(frame):
+    """Brings a provider's close frame to the `get_history` contract."""
+    if frame is None or frame.empty:
+        return pd.DataFrame()
+    frame = frame.copy()
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    frame.index = index.normalize()
+    frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+    return frame.dropna(axis=1, how='all').astype(float)
@@ -0,0 +1,151 @@
+import json
+import logging
+import random
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from urllib.parse import quote
+import pandas as pd
+from core.providers.base import PriceProvider, normalize_history
+
+logger = logging.getLogger(__name__)
+
+# On-disk layout of a fixture directory:
+#   history/<symbol>.csv   date,close (one row per trading day)
+#   quotes.json            {"<symbol>": price}  (missing symbols fall back to their last close)
+#   info/<symbol>.json     get_info() payload
+#   news/<symbol>.json     get_news() payload
+#   schemes.json           list_schemes() payload
+# Symbols are URL-quoted in file names (^NSEI -> %5ENSEI).
+
+
+def _file_name(symbol, suffix):
+    return f"{quote(symbol, safe='')}{suffix}"
+
+
+class FixtureProvider(PriceProvider):
+    """
+    Replays recorded provider responses from disk. No network access at all.
+
+    `latency_ms` (+ up to `jitter_ms` random extra) is slept on every call, so
+    throughput work can be measured against a realistic, but reproducible, provider.
+    """
+    name = 'fixture'
+
+    def __init__(self, root, latency_ms=0, jitter_ms=0, seed=None):
+        self.root = Path(root)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._history_cache = {}
+
+    def _simulate_latency(self):
+        delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _read_json(self, relative, default):
+        path = self.root / relative
+        if not path.exists():
+            return default
+        return json.loads(path.read_text())
+
+    def _history(self, symbol):
+        if symbol not in self._history_cache:
+            path = self.root / 'history' / _file_name(symbol, '.csv')
+            if path.exists():
+                series = pd.read_csv(path, parse_dates=['date'], index_col='date')['close'].astype(float)
+            else:
+                series = None
+            self._history_cache[symbol] = series
+        return self._history_cache[symbol]
+
+    def get_history(self, symbols, start, end=None):
+        self._simulate_latency()
+        end = end or date.today()
+        series = {s: self._history(s) for s in symbols}
+        series = {s: v.loc[pd.Timestamp(start):pd.Timestamp(end)] for s, v in series.items() if v is not None}
+        return normalize_history(pd.DataFrame(series)) if series else pd.DataFrame()
+
+    def get_quotes(self, symbols):
+        self._simulate_latency()
+        recorded = self._read_json('quotes.json', {})
+        quotes = {}
+        for symbol in symbols:
+            price = recorded.get(symbol)
+            if price is None and (history := self._history(symbol)) is not None and not history.empty:
+                price = float(history.iloc[-1])
+            if price and price > 0:
+                quotes[symbol] = float(price)
+        return quotes
+
+    def get_info(self, symbol):
+        self._simulate_latency()
+        return self._read_json(Path('info') / _file_name(symbol, '.json'), None)
+
+    def get_news(self, symbol):
+        self._simulate_latency()
+        return self._read_json(Path('news') / _file_name(symbol, '.json'), [])
+
+    def list_schemes(self):
+        self._simulate_latency()
+        return self._read_json('schemes.json', [])
+
+
+class RecordingProvider(PriceProvider):
+    """
+    Passes calls through to a live provider and saves every response in the
+    `FixtureProvider` layout, to build fixture sets from real traffic.
+    """
+    name = 'record'
+
+    def __init__(self, inner, root):
+        self.inner = inner
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _write_json(self, relative, payload):
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, indent=1, default=str))
+
+    def get_history(self, symbols, start, end=None):
+        frame = self.inner.get_history(symbols, start, end)
+        with self._lock:
+            for symbol in frame.columns:
+                path = self.root / 'history' / _file_name(symbol, '.csv')
+                path.parent.mkdir(parents=True, exist_ok=True)
+                series = frame[symbol].dropna()
+                if path.exists():
+                    # Merge with what was recorded before (new bars win)
+                    old = pd.read_csv(path, parse_dates=['date'], index_col='date')['close']
+                    series = pd.concat([old, series])
+                    series = series[~series.index.duplicated(keep='last')].sort_index()
+                series.rename('close').rename_axis('date').to_csv(path)
+        return frame
+
+    def get_quotes(self, symbols):
+        quotes = self.inner.get_quotes(symbols)
+        with self._lock:
+            path = self.root / 'quotes.json'
+            recorded = json.loads(path.read_text()) if path.exists() else {}
+            recorded.update(quotes)
+            self._write_json('quotes.json', recorded)
+        return quotes
+
+    def get_info(self, symbol):
+        info = self.inner.get_info(symbol)
+        if info is not None:
+            self._write_json(Path('info') / _file_name(symbol, '.json'), info)
+        return info
+
+    def get_news(self, symbol):
+        news = self.inner.get_news(symbol)
+        self._write_json(Path('news') / _file_name(symbol, '.json'), news)
+        return news
+
+    def list_schemes(self):
+        schemes = self.inner.list_schemes()
+        self._write_json('schemes.json', schemes)
+        return schemes
@@ -0,0 +1,266 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Worth another try: throttling and transient upstream errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while a host's circuit breaker is open."""
+
+
+class RetryableStatus(Exception):
+    """Internal: a response whose status is worth retrying."""
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills `rate` tokens per second, holds at most `capacity`.
+    A rate of 0 disables limiting.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available. Returns the seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    closed --(N consecutive failures)--> open --(reset_timeout)--> half-open.
+    In half-open a single trial call goes through: success closes the circuit, failure re-opens it.
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self):
+        # The call ended without a verdict on the host's health (e.g. bad input): free the trial slot
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"🔌 Circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+class _Host:
+    """Per-host state: keep-alive session, rate limiter, breaker and counters."""
+    def __init__(self, client):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=client.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.bucket = TokenBucket(client.rate_per_second, client.burst)
+        self.breaker = CircuitBreaker(client.breaker_failures, client.breaker_reset_seconds)
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def pool_stats(self):
+        # urllib3 keeps one pool per scheme/host/port; its counters tell us how often sockets were reused
+        pools = self.session.get_adapter('https://').poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        return sum(p.num_connections for p in pools), sum(p.num_requests for p in pools)
+
+
+class HttpClient:
+    """
+    The one way out to market data APIs (MFAPI directly, Yahoo through yfinance).
+
+    Every call, from the backfill worker, the live price pool or a dashboard refresh, shares:
+    - one keep-alive `requests.Session` per host (no TLS handshake per NAV lookup),
+    - a process-wide token bucket per host,
+    - retries with exponential backoff (and Retry-After) on timeouts, connection errors, 429 and 5xx,
+    - a circuit breaker that fails fast with `CircuitOpenError` once `breaker_failures` consecutive
+      calls (each after all its retries) have failed.
+    """
+    def __init__(self, rate_per_second=10, burst=20, max_retries=3, backoff_seconds=0.5,
+                 breaker_failures=5, breaker_reset_seconds=60, pool_size=10):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.pool_size = pool_size
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(self)
+            return self._hosts[host]
+
+    def _backoff(self, attempt, error):
+        retry_after = getattr(getattr(error, 'response', None), 'headers', {}).get('Retry-After')
+        if retry_after and str(retry_after).isdigit():
+            return float(retry_after)
+        # Jitter keeps a burst of failed callers from retrying in lockstep
+        return self.backoff_seconds * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def call(self, host, fn, *args, retry_on=(OSError,), **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` (one network round trip) under `host`'s limiter, breaker and retry policy.
+        Used directly for libraries that do their own HTTP (yfinance).
+
+        Only `retry_on` errors (transport failures by default: requests, curl and socket errors
+        are all OSErrors) are retried; anything else is raised as-is. The breaker sees logical
+        calls, not attempts: it admits the call once, and one failure is recorded only when the
+        retries are exhausted, so a single unlucky call can't open the circuit on its own.
+
+        Raises:
+            CircuitOpenError: The host is failing; nothing was sent.
+            Exception: Whatever `fn` raised on the last attempt.
+        """
+        state = self._host(host)
+        if not state.breaker.allow():
+            state.add('short_circuited')
+            raise CircuitOpenError(f"{host} is failing, circuit open")
+        attempt = 0
+        while True:
+            state.add('throttled_seconds', state.bucket.acquire())
+            state.add('requests')
+            try:
+                result = fn(*args, **kwargs)
+            except retry_on as e:
+                state.add('failures')
+                if attempt >= self.max_retries:
+                    state.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                state.add('retries')
+                logger.warning(f"{host} call failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+            except Exception:
+                state.breaker.release()
+                raise
+            else:
+                state.breaker.record_success()
+                return result
+
+    def get(self, url, timeout=10, **kwargs):
+        """
+        GET through the host's pooled session. Non-retryable responses (e.g. 404) are returned
+        as-is, so callers keep checking `status_code` like with plain `requests`.
+        """
+        host = urlsplit(url).netloc
+        session = self._host(host).session
+
+        def fetch():
+            response = session.get(url, timeout=timeout, **kwargs)
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableStatus(response)
+            return response
+
+        try:
+            return self.call(host, fetch, retry_on=(requests.ConnectionError, requests.Timeout, RetryableStatus))
+        except RetryableStatus as e:
+            return e.response # Out of retries: hand back the last answer
+
+    def metrics(self):
+        """
+        Per-host counters for this process: calls, retries, failures, short-circuits,
+        time spent throttled, breaker state and keep-alive reuse.
+        """
+        with self._lock:
+            hosts = dict(self._hosts)
+
+        report = {}
+        for host, state in hosts.items():
+            with state.lock:
+                counters = dict(state.counters)
+            connections, pooled_requests = state.pool_stats()
+            report[host] = {
+                "requests": counters.get('requests', 0),
+                "retries": counters.get('retries', 0),
+                "failures": counters.get('failures', 0),
+                "short_circuited": counters.get('short_circuited', 0),
+                "throttled_seconds": round(counters.get('throttled_seconds', 0.0), 3),
+                "breaker": state.breaker.state,
+                # Only for hosts reached through `get` (yfinance manages its own sockets)
+                "connections_opened": connections,
+                "connection_reuse": round(1 - connections / pooled_requests, 3) if pooled_requests else None,
+            }
+        return report
+
+
+def get_http_client():
+    """Process-wide client configured from the `HTTP_*` settings."""
+    return _build_client(settings.HTTP_RATE_LIMIT_PER_SECOND, settings.HTTP_RATE_BURST, settings.HTTP_MAX_RETRIES,
+                         settings.HTTP_BACKOFF_SECONDS, settings.HTTP_BREAKER_FAILURES,
+                         settings.HTTP_BREAKER_RESET_SECONDS, settings.HTTP_POOL_SIZE)
+
+
+@lru_cache(maxsize=None)
+def _build_client(*config):
+    return HttpClient(*config)
@@ -0,0 +1,100 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.utils import timezone
+from core.singleflight import SingleFlight
+from core.utils import get_logical_day_start
+
+logger = logging.getLogger(__name__)
+
+
+def parse_nav_history(data):
+    """
+    Turns an MFAPI scheme payload into compact, date-ascending arrays.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray] | None: (dates as datetime64[D], NAVs as float64),
+        or None when the payload has no usable NAVs.
+    """
+    rows = pd.DataFrame((data or {}).get('data') or [])
+    if rows.empty:
+        return None
+    dates = pd.to_datetime(rows['date'], format='%d-%m-%Y', errors='coerce')
+    navs = pd.to_numeric(rows['nav'], errors='coerce')
+    valid = dates.notna() & (navs > 0)
+    if not valid.any():
+        return None
+
+    # MFAPI lists newest first; store oldest first so "latest" is [-1] and slicing is a searchsorted
+    dates = dates[valid].values.astype('datetime64[D]')
+    navs = navs[valid].to_numpy(dtype=np.float64)
+    order = np.argsort(dates, kind='stable')
+    return dates[order], navs[order]
+
+
+class MFHistoryCache:
+    """
+    Parsed NAV history per scheme code, downloaded at most once per IST trading day.
+
+    Live NAVs (the last element) and backfill series (a date slice) are both served from here,
+    so MFAPI's full-history JSON is fetched and parsed once instead of once per use.
+    - Threads of this process share a small in-memory LRU of the arrays.
+    - Other processes share them through the Django cache, until the next 4am IST rollover.
+    - Concurrent misses for the same code are single-flighted, so only one download happens.
+
+    Args:
+        download (callable): `download(code) -> dict | None`, the raw MFAPI payload.
+        local_size (int): Schemes kept in process memory.
+    """
+    def __init__(self, download, local_size=512):
+        self.download = download
+        self.local_size = local_size
+        self._local = OrderedDict() # (code, day) -> (dates, navs)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight('mf_history', lock_ttl=60, wait_timeout=30)
+
+    def _cache_key(self, code, day_start):
+        return f"mf_history:{code}:{day_start.date().isoformat()}"
+
+    def get(self, code, now=None):
+        """
+        Returns:
+            tuple[np.ndarray, np.ndarray] | None: (dates, navs) for the scheme, oldest first.
+        """
+        now = now or timezone.now()
+        day_start = get_logical_day_start(now)
+        key = (code, day_start)
+
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                return self._local[key]
+
+        history = cache.get(self._cache_key(code, day_start))
+        if history is None:
+            # Expire with the trading day: tomorrow's first reader downloads the new NAV
+            ttl = max(int((day_start + pd.Timedelta(days=1) - now).total_seconds()), 1)
+
+            def fetch(codes):
+                parsed = parse_nav_history(self.download(code))
+                if parsed is not None:
+                    cache.set(self._cache_key(code, day_start), parsed, ttl)
+                return {code: parsed}
+
+            history = self._flight.do([code], fetch).get(code)
+            if history is None:
+                return None
+
+        with self._lock:
+            self._local[key] = history
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        return history
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
@@ -0,0 +1,83 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import pandas as pd
+from core.providers.base import PriceProvider, normalize_history
+from core.providers.http_client import get_http_client
+from core.providers.mf_history import MFHistoryCache
+
+logger = logging.getLogger(__name__)
+
+MFAPI_BASE_URL = "https://api.mfapi.in/mf"
+
+
+class MFAPIProvider(PriceProvider):
+    """Indian Mutual Fund NAVs from MFAPI.in (symbols are AMFI scheme codes)."""
+    name = 'mfapi'
+
+    def __init__(self, quote_timeout=5, history_timeout=10, max_workers=10, client=None):
+        self.quote_timeout = quote_timeout
+        self.history_timeout = history_timeout
+        self.max_workers = max_workers
+        self._client = client
+        # Live NAVs and backfill series both come out of one parsed download per scheme per day
+        self.history = MFHistoryCache(lambda code: self._scheme(code, self.history_timeout))
+
+    @property
+    def client(self):
+        # Shared pooled client (keep-alive, rate limit, retries, breaker) unless one was injected
+        return self._client or get_http_client()
+
+    def _scheme(self, code, timeout):
+        response = self.client.get(f"{MFAPI_BASE_URL}/{code}", timeout=timeout)
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def get_history(self, symbols, start, end=None):
+        end = end or date.today()
+        series = {}
+        # One call per scheme: the API has no range filter
+        for code in symbols:
+            try:
+                history = self.history.get(code)
+                if history is not None:
+                    dates, navs = history
+                    series[code] = pd.Series(navs, index=pd.DatetimeIndex(dates))
+            except Exception as e:
+                logger.warning(f"MFAPI History Failed for {code}: {e}")
+
+        if not series:
+            return pd.DataFrame()
+        frame = normalize_history(pd.DataFrame(series))
+        return frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+    def _latest_nav(self, code):
+        try:
+            history = self.history.get(code)
+            if history is not None:
+                return code, float(history[1][-1]) # arrays are oldest first
+        except Exception as e:
+            logger.error(f"MFAPI Failed {code}: {e}")
+        return code, None
+
+    def get_quotes(self, symbols):
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        # One request per scheme, so fan out over a small thread pool
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as executor:
+            results = executor.map(self._latest_nav, symbols)
+        return {code: nav for code, nav in results if nav and nav > 0}
+
+    def get_info(self, symbol):
+        data = self._scheme(symbol, self.quote_timeout) or {}
+        if not data.get('data'):
+            return None
+        name = data.get('meta', {}).get('scheme_name', symbol)
+        return {"price": float(data['data'][0]['nav']), "name": name, "sector": 'Unknown', "market_cap": None}
+
+    def list_schemes(self):
+        response = self.client.get(MFAPI_BASE_URL, timeout=30)
+        response.raise_for_status()
+        return response.json()
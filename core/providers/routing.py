@@ -0,0 +1,81 @@
+import logging
+from functools import lru_cache
+import pandas as pd
+from django.conf import settings
+from core.providers.base import PriceProvider
+from core.providers.fixture import FixtureProvider, RecordingProvider
+from core.providers.mfapi import MFAPIProvider
+from core.providers.yahoo import YahooProvider
+
+logger = logging.getLogger(__name__)
+
+
+def is_mf_symbol(symbol):
+    """AMFI scheme codes are all digits; everything else is a market ticker."""
+    return symbol.isdigit()
+
+
+class RoutingProvider(PriceProvider):
+    """Sends Mutual Fund scheme codes to `funds` and everything else to `market`."""
+    name = 'routing'
+
+    def __init__(self, market, funds):
+        self.market = market
+        self.funds = funds
+
+    def _split(self, symbols):
+        symbols = list(symbols)
+        return [s for s in symbols if not is_mf_symbol(s)], [s for s in symbols if is_mf_symbol(s)]
+
+    def get_history(self, symbols, start, end=None):
+        tickers, codes = self._split(symbols)
+        frames = [provider.get_history(group, start, end)
+                  for provider, group in ((self.market, tickers), (self.funds, codes)) if group]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        return frames[0] if len(frames) == 1 else pd.concat(frames, axis=1).sort_index()
+
+    def get_quotes(self, symbols):
+        quotes = {}
+        # Quotes are best-effort: a Yahoo outage must not cost us the MF NAVs (and vice versa)
+        for provider, group in zip((self.market, self.funds), self._split(symbols)):
+            if not group:
+                continue
+            try:
+                quotes.update(provider.get_quotes(group))
+            except Exception as e:
+                logger.error(f"{provider.name} quotes failed: {e}")
+        return quotes
+
+    def get_info(self, symbol):
+        return (self.funds if is_mf_symbol(symbol) else self.market).get_info(symbol)
+
+    def get_news(self, symbol):
+        return self.market.get_news(symbol)
+
+    def list_schemes(self):
+        return self.funds.list_schemes()
+
+
+def get_price_provider():
+    """
+    The provider every caller should use, chosen by `PRICE_PROVIDER`:
+    - 'live'    -> Yahoo Finance + MFAPI
+    - 'fixture' -> recorded responses from `PRICE_FIXTURE_DIR` (offline, with injected latency)
+    - 'record'  -> live, and every response is saved to `PRICE_FIXTURE_DIR`
+    """
+    return _build_provider(settings.PRICE_PROVIDER, str(settings.PRICE_FIXTURE_DIR),
+                           settings.PRICE_FIXTURE_LATENCY_MS, settings.PRICE_FIXTURE_JITTER_MS)
+
+
+@lru_cache(maxsize=None)
+def _build_provider(mode, fixture_dir, latency_ms, jitter_ms):
+    # One instance per configuration: fixture files are parsed once per process
+    if mode == 'fixture':
+        return FixtureProvider(fixture_dir, latency_ms=latency_ms, jitter_ms=jitter_ms)
+
+    live = RoutingProvider(YahooProvider(), MFAPIProvider())
+    if mode == 'record':
+        return RecordingProvider(live, fixture_dir)
+    return live
@@ -0,0 +1,132 @@
+import logging
+import threading
+from datetime import date, timedelta
+import pandas as pd
+import yfinance as yf
+import yfinance.exceptions
+import yfinance.shared
+from yfinance.exceptions import YFRateLimitError
+from core.providers.base import PriceProvider, normalize_history
+from core.providers.http_client import CircuitOpenError, get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Limiter/breaker key for every yfinance call (yfinance owns its HTTP session)
+YAHOO_HOST = 'finance.yahoo.com'
+YAHOO_RETRY_ON = (YFRateLimitError, OSError) # curl_cffi errors are OSErrors
+
+
+# yfinance errors meaning "Yahoo answered, there is just no data" (delisted, bad symbol/period).
+# Anything else a download records (DNS, timeouts, HTTP errors, rate limits) is a failed call.
+_NO_DATA_ERRORS = tuple(
+    name for name, cls in vars(yfinance.exceptions).items()
+    if isinstance(cls, type) and issubclass(cls, yfinance.exceptions.YFException) and cls is not YFRateLimitError
+)
+
+# `yf.download` reports per-ticker results through module globals it resets on every call
+_download_lock = threading.Lock()
+
+
+class YahooDownloadError(OSError):
+    """`yf.download` swallowed a transport or rate-limit error (it never raises them itself)."""
+
+
+def _guarded(fn, *args, **kwargs):
+    return get_http_client().call(YAHOO_HOST, fn, *args, retry_on=YAHOO_RETRY_ON, **kwargs)
+
+
+def _download(symbols, **kwargs):
+    """
+    `yf.download` that raises on failure: the library catches every error per ticker, logs it
+    and returns an empty (or partial) frame. Without this, an outage looks like a successful
+    call with no data, so nothing is retried and the breaker never opens.
+
+    Raises:
+        YahooDownloadError: Any requested ticker failed for a reason other than missing data.
+    """
+    with _download_lock:
+        yfinance.shared._ERRORS = {}
+        frame = yf.download(symbols, **kwargs)
+        errors = dict(yfinance.shared._ERRORS)
+    requested = {s.upper() for s in symbols}
+    failed = {s: e for s, e in errors.items() if s in requested and not str(e).startswith(_NO_DATA_ERRORS)}
+    if failed:
+        symbol, error = next(iter(failed.items()))
+        raise YahooDownloadError(f"{len(failed)}/{len(requested)} tickers failed, e.g. {symbol}: {error}")
+    return frame
+
+
+def _download_closes(symbols, **kwargs):
+    """One multi-ticker `yf.download` call -> (dates x symbols) close frame."""
+    # threads=False keeps background workers within the free-tier RAM budget
+    frame = _guarded(_download, symbols, progress=False, auto_adjust=True, threads=False, **kwargs)
+    if frame is None or frame.empty or 'Close' not in frame.columns.get_level_values(0):
+        return pd.DataFrame()
+    closes = frame['Close']
+
+    # Normalize YF data structure (Series -> DataFrame if single asset)
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(name=symbols[0])
+    return normalize_history(closes)
+
+
+class YahooProvider(PriceProvider):
+    """Stocks, ETFs, crypto, indices, commodities and FX via yfinance."""
+    name = 'yahoo'
+
+    def __init__(self, quote_batch_size=50):
+        self.quote_batch_size = quote_batch_size
+
+    def get_history(self, symbols, start, end=None):
+        symbols = list(symbols)
+        if not symbols:
+            return pd.DataFrame()
+        end = end or date.today()
+        return _download_closes(symbols, start=start, end=end + timedelta(days=1))
+
+    def get_quotes(self, symbols):
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+
+        quotes = {}
+        # One batched daily download per chunk instead of a fast_info lookup per symbol:
+        # 100 symbols cost 2 requests, not 100. Today's daily bar tracks the live price during
+        # market hours, and a 5-day window still has a last close over weekends/holidays.
+        for i in range(0, len(symbols), self.quote_batch_size):
+            chunk = symbols[i:i + self.quote_batch_size]
+            try:
+                closes = _download_closes(chunk, period='5d', interval='1d')
+            except CircuitOpenError:
+                raise # Yahoo is down: let the caller skip it once instead of failing every chunk
+            except Exception as e:
+                logger.warning(f"Yahoo batch quote failed for {len(chunk)} symbols: {e}")
+                continue
+            if closes.empty:
+                continue
+
+            last = closes.ffill().iloc[-1]
+            quotes.update({symbol: float(price) for symbol, price in last.items() if pd.notna(price) and price > 0})
+        return quotes
+
+    def get_info(self, symbol):
+        ticker = yf.Ticker(symbol)
+        try:
+            full_info = _guarded(lambda: ticker.info)
+            price = full_info.get('currentPrice') or full_info.get('regularMarketPreviousClose')
+            info = {
+                "price": price,
+                "name": full_info.get('longName', symbol),
+                "sector": full_info.get('sector', 'Other'),
+                "market_cap": full_info.get('marketCap', 0),
+            }
+        except Exception:
+            # .info is slow and flaky; fast_info at least gives us a price
+            info = {"price": _guarded(lambda: ticker.fast_info.last_price), "name": symbol, "sector": 'Other', "market_cap": None}
+
+        if not info["price"] or info["price"] <= 0:
+            return None
+        return info
+
+    def get_news(self, symbol):
+        return _guarded(lambda: yf.Ticker(symbol).news) or []
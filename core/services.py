@@ -1,61 +1,76 @@
 import logging
-import yfinance as yf
+import time
+from django.conf import settings
 from django.core.cache import cache
 from django.apps import apps
 from decimal import Decimal
+from core.providers.routing import get_price_provider
 
 logger = logging.getLogger(__name__)
 
-def get_usd_inr_rate():
+USD_INR_CACHE_KEY = 'usd_inr_live_rate'
+USD_INR_REFRESH_SECONDS = 60 * 60 * 3 # how often the daemon re-fetches the rate
+USD_INR_FALLBACK = 87.00
+
+
+def refresh_usd_inr_rate(max_age=USD_INR_REFRESH_SECONDS):
     """
-    Fetches the live USD to INR exchange rate.
+    Fetches the live USD to INR rate into the cache (called from the `refresh_prices` daemon).
 
     Strategy:
-    1. Check Cache (TTL 3 hours).
-    2. If not in cache, fetch from Yahoo Finance.
-    3. If successful, update Cache and persist to DB (Asset model) for future fallback.
-    4. If YFinance fails, attempt to retrieve the last known rate from DB.
-    5. If DB is empty, return a hardcoded safe fallback.
+    1. Skip if the cached rate is younger than `max_age` seconds (0 forces a fetch).
+    2. Fetch the latest quote from the price provider (Yahoo Finance).
+    3. Cache it (kept for twice `max_age`, so a failed fetch doesn't empty the cache right away)
+       and persist it on the INR=X Asset row, the fallback once the cache is gone.
 
     Returns:
-        float: The current USD/INR exchange rate.
+        float or None: The fresh rate, or None if it was still fresh or the fetch failed.
     """
-    cache_key = 'usd_inr_live_rate'
-    cached_rate = cache.get(cache_key)
+    cached = cache.get(USD_INR_CACHE_KEY)
+    if max_age and cached and time.time() - cached['fetched_at'] < max_age:
+        return None
 
-    if cached_rate:
-        return cached_rate
+    try:
+        quote = get_price_provider().get_quotes(["INR=X"]).get("INR=X")
+    except Exception as e:
+        logger.error(f"Error fetching USD Rate from Yahoo: {e}")
+        return None
+    if not quote:
+        logger.warning("Yahoo Finance returned empty data for INR=X")
+        return None
 
+    rate = round(quote, 2)
+    cache.set(USD_INR_CACHE_KEY, {'rate': rate, 'fetched_at': time.time()}, 2 * USD_INR_REFRESH_SECONDS)
     # Dynamic import to avoid circular dependency if core is imported by portfolio
     Asset = apps.get_model('portfolio', 'Asset')
-    fallback_value = 87.00 
-
-    try:
-        # fetch data from yahoo 
-        ticker = yf.Ticker("INR=X")
-
-        # now after the data is fetched we will only need the most recent one 
-
-        data = ticker.history( period = "1d", interval ="1m")
+    Asset.objects.filter(symbol="INR=X").update(last_price=rate)
+    return rate
 
-        if not data.empty:
-            current_rate = round(float(data['Close'].iloc[-1]), 2)
 
-            # we will save it in cache for 3hrs 
-            cache.set('usd_inr_live_rate', current_rate, 10800) # 3hrs in seconds 
+def get_usd_inr_rate():
+    """
+    Returns the USD to INR exchange rate without calling the provider (see `refresh_usd_inr_rate`).
 
-            return current_rate
-        else:
-            logger.warning("Yahoo Finance returned empty data for INR=X")
+    Strategy:
+    1. The cached rate kept fresh by the daemon.
+    2. On a miss, the last known rate from DB (Asset model), or a fetch if PRICE_REFRESH_ON_READ
+       is set (no daemon deployed).
+    3. If DB is empty, a hardcoded safe fallback.
 
-    except Exception as e:
-        logger.error(f"Error fetching USD Rate from Yahoo: {e}")
+    Returns:
+        float: The current USD/INR exchange rate.
+    """
+    cached = cache.get(USD_INR_CACHE_KEY)
+    if cached:
+        return cached['rate']
+    if settings.PRICE_REFRESH_ON_READ:
+        rate = refresh_usd_inr_rate(max_age=0)
+        if rate:
+            return rate
 
-    # Fallback Strategy: Try DB first, then hardcoded value
-    try:
-        asset = Asset.objects.get(symbol="INR=X")
-        logger.info(f"Using DB fallback rate: {asset.last_price}")
-        return float(asset.last_price)
-    except Asset.DoesNotExist:
-        logger.warning("No DB fallback found for INR=X. Using hardcoded default.")
-        return fallback_value
+    Asset = apps.get_model('portfolio', 'Asset')
+    last_price = Asset.objects.filter(symbol="INR=X", last_price__gt=0).values_list('last_price', flat=True).first()
+    if last_price is None:
+        logger.warning("No cached or DB rate for INR=X. Using hardcoded default.")
+        return USD_INR_FALLBACK
+    return float(last_price)
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+import uuid
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight fetch for a key, shared by every local caller that asks for it meanwhile."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class SingleFlight:
+    """
+    Per-key request deduplication ("single-flight").
+
+    While a key is being fetched, other callers asking for it attach to the running fetch
+    and get its result instead of starting their own:
+    - Threads of this process wait on an in-memory in-flight table.
+    - Other worker processes see a lock in the shared cache and read the result the leader
+      publishes there. The lock is a `cache.add`, atomic on Redis/Memcached and on
+      `core.cache.InstrumentedDatabaseCache` (Django's stock DatabaseCache is not, for expired rows).
+      With LocMemCache every process is its own island, which is still correct, just less shared.
+
+    Args:
+        namespace (str): Prefix for the cache keys (one per kind of fetch).
+        lock_ttl (int): Seconds a cross-process claim (and the published result) lives;
+            a crashed leader stops blocking others after this.
+        wait_timeout (float): Max seconds a follower waits for the leader.
+    """
+    def __init__(self, namespace, lock_ttl=60, wait_timeout=15, poll_interval=0.1):
+        self.namespace = namespace
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _lock_key(self, key):
+        return f"singleflight:{self.namespace}:lock:{key}"
+
+    def _result_key(self, key):
+        return f"singleflight:{self.namespace}:result:{key}"
+
+    def do(self, keys, fetch):
+        """
+        Resolves `keys`, fetching only those nobody else is already fetching.
+
+        Args:
+            keys (iterable[str]): Keys wanted by this caller.
+            fetch (callable): `fetch(keys) -> {key: value}` for the keys this caller leads.
+                Runs at most once per call; an exception propagates to this caller only
+                (attached callers just get no value for those keys).
+
+        Returns:
+            dict: {key: value} for every key that resolved, whoever fetched it.
+        """
+        keys = list(dict.fromkeys(keys))
+        led, attached = [], {}
+        with self._lock:
+            for key in keys:
+                if key in self._inflight:
+                    attached[key] = self._inflight[key]
+                else:
+                    self._inflight[key] = _Call()
+                    led.append(key)
+
+        # Cross-process claim for the keys this thread leads
+        token = uuid.uuid4().hex
+        owned, remote = [], []
+        for key in led:
+            (owned if cache.add(self._lock_key(key), token, self.lock_ttl) else remote).append(key)
+
+        results = {}
+        try:
+            if owned:
+                values = fetch(owned) or {}
+                results.update({k: v for k, v in values.items() if k in owned})
+                cache.set_many({self._result_key(k): v for k, v in results.items()}, self.lock_ttl)
+            if remote:
+                results.update(self._wait_remote(remote))
+        finally:
+            # Only drop claims that are still ours (a claim may have expired and been re-taken)
+            mine = [self._lock_key(k) for k in owned]
+            current = cache.get_many(mine)
+            cache.delete_many([k for k in mine if current.get(k) == token])
+
+            with self._lock:
+                for key in led:
+                    call = self._inflight.pop(key)
+                    call.value = results.get(key)
+                    call.event.set()
+
+        if attached:
+            logger.info(f"Single-flight ({self.namespace}): {len(attached)} key(s) attached to in-flight fetches")
+        deadline = time.monotonic() + self.wait_timeout
+        for key, call in attached.items():
+            if call.event.wait(max(deadline - time.monotonic(), 0)) and call.value is not None:
+                results[key] = call.value
+        return results
+
+    def _wait_remote(self, keys):
+        """Waits for another process's claims on `keys` to clear, then reads what it published."""
+        lock_keys = [self._lock_key(k) for k in keys]
+        deadline = time.monotonic() + self.wait_timeout
+        while cache.get_many(lock_keys) and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+
+        published = cache.get_many([self._result_key(k) for k in keys])
+        return {k: published[self._result_key(k)] for k in keys if self._result_key(k) in published}
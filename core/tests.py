@@ -1,3 +1,358 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
+from unittest import mock
+import pandas as pd
+import yfinance.shared
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from analytics.models import PortfolioSnapshot
+from core.bulk_writer import bulk_upsert
+from core.cache import InstrumentedDatabaseCache
+from core.locks import distributed_lock, lock_metrics
+from core.providers.http_client import CircuitOpenError, HttpClient, TokenBucket
+from core.singleflight import SingleFlight
+from core.providers.base import PriceProvider
+from core.providers.fixture import FixtureProvider, RecordingProvider
+from core.providers.mfapi import MFAPIProvider
+from core.providers.routing import RoutingProvider
+from core.providers.yahoo import YAHOO_HOST, YahooDownloadError, YahooProvider
 
-# Create your tests here.
+
+class StubProvider(PriceProvider):
+    """In-memory provider standing in for a live API."""
+    def __init__(self, name, closes, fail=False):
+        self.name = name
+        self.closes = closes
+        self.fail = fail
+
+    def get_history(self, symbols, start, end=None):
+        return self.closes[[s for s in symbols if s in self.closes.columns]].loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+    def get_quotes(self, symbols):
+        if self.fail:
+            raise ConnectionError(f"{self.name} down")
+        return {s: float(self.closes[s].iloc[-1]) for s in symbols if s in self.closes.columns}
+
+
+# Thread-heavy tests: SQLite's shared in-memory test DB can't take concurrent writers to the cache table
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class PriceProviderTest(TestCase):
+    def setUp(self):
+        dates = pd.date_range('2024-01-01', '2024-01-10', freq='D')
+        self.market = StubProvider('market', pd.DataFrame({'^NSEI': [float(x) for x in range(10)], 'INR=X': [83.0] * 10}, index=dates))
+        self.funds = StubProvider('funds', pd.DataFrame({'120503': [float(x) for x in range(50, 60)]}, index=dates))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_routing_splits_symbols_and_isolates_failures(self):
+        """Test that scheme codes go to the MF provider and one provider's outage keeps the other's quotes."""
+        router = RoutingProvider(self.market, self.funds)
+        history = router.get_history(['^NSEI', '120503'], date(2024, 1, 3), date(2024, 1, 4))
+        self.assertEqual(list(history.columns), ['^NSEI', '120503'])
+        self.assertEqual(history['120503'].tolist(), [52.0, 53.0])
+
+        self.market.fail = True
+        self.assertEqual(router.get_quotes(['INR=X', '120503']), {'120503': 59.0})
+
+    def test_yahoo_quotes_are_batched(self):
+        """Test that quotes for 120 symbols take 3 chunked downloads, with holidays forward-filled per symbol."""
+        def download(symbols, **kwargs):
+            dates = pd.date_range('2024-01-01', periods=2, freq='D', tz='Asia/Kolkata')
+            closes = pd.DataFrame({s: [100.0, 101.0] for s in symbols}, index=dates)
+            closes.iloc[-1, 0] = float('nan') # first symbol of the chunk has no bar today
+            return pd.concat({'Close': closes}, axis=1)
+
+        symbols = [f"S{i}.NS" for i in range(120)]
+        with mock.patch('core.providers.yahoo.yf.download', side_effect=download) as yf_download:
+            quotes = YahooProvider(quote_batch_size=50).get_quotes(symbols)
+
+        self.assertEqual(yf_download.call_count, 3)
+        self.assertEqual(len(quotes), 120)
+        self.assertEqual((quotes['S0.NS'], quotes['S1.NS'], quotes['S50.NS']), (100.0, 101.0, 100.0))
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_mf_history_is_downloaded_once_for_quotes_and_backfill(self):
+        """Test that live NAVs and the backfill series share one parsed download per scheme."""
+        cache.clear()
+        payload = {'data': [{'date': '03-01-2024', 'nav': '52.5'}, {'date': '02-01-2024', 'nav': '51.0'},
+                            {'date': '01-01-2024', 'nav': '50.25'}]}
+        client = mock.Mock()
+        client.get.side_effect = lambda url, timeout: time.sleep(0.05) or mock.Mock(status_code=200, json=lambda: payload)
+        provider = MFAPIProvider(client=client)
+
+        quotes = []
+        threads = [threading.Thread(target=lambda: quotes.append(provider.get_quotes(['120503']))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        history = provider.get_history(['120503'], date(2024, 1, 2), date(2024, 1, 3))
+
+        self.assertEqual(client.get.call_count, 1)
+        self.assertEqual(quotes, [{'120503': 52.5}] * 4)
+        self.assertEqual(history['120503'].tolist(), [51.0, 52.5])
+        # Another worker process starts with an empty local LRU but finds the arrays in the shared cache
+        provider.history.clear()
+        self.assertEqual(provider.get_quotes(['120503']), {'120503': 52.5})
+        self.assertEqual(client.get.call_count, 1)
+
+    def test_recorded_responses_replay_offline(self):
+        """Test that a recording session can be replayed by the fixture provider, with injected latency."""
+        recorder = RecordingProvider(RoutingProvider(self.market, self.funds), self.tmp.name)
+        recorded = recorder.get_history(['^NSEI', 'INR=X', '120503'], date(2024, 1, 1), date(2024, 1, 10))
+        recorder.get_quotes(['INR=X'])
+
+        replay = FixtureProvider(self.tmp.name, latency_ms=20)
+        started = time.perf_counter()
+        replayed = replay.get_history(['^NSEI', 'INR=X', '120503', 'UNKNOWN'], date(2024, 1, 1), date(2024, 1, 10))
+        self.assertGreaterEqual(time.perf_counter() - started, 0.02)
+
+        pd.testing.assert_frame_equal(replayed, recorded, check_freq=False, check_names=False)
+        # No recorded quote for the fund: falls back to its last recorded close
+        self.assertEqual(replay.get_quotes(['INR=X', '120503', 'UNKNOWN']), {'INR=X': 83.0, '120503': 59.0})
+
+
+class BulkUpsertTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='writer', password='password123')
+        PortfolioSnapshot.objects.create(user=self.user, date=date(2024, 1, 1), total_value=1, invested_value=1)
+        PortfolioSnapshot.objects.create(user=self.user, date=date(2024, 1, 2), total_value=2, invested_value=2)
+        self.fields = ['user_id', 'date', 'total_value', 'invested_value']
+        self.rows = [(self.user.id, date(2024, 1, 2), Decimal('20.50'), Decimal('2.00')),
+                     (self.user.id, date(2024, 1, 3), Decimal('30.00'), None)]
+
+    def test_fallback_merges_and_replaces_window(self):
+        """Test that the bulk_create path updates, inserts and drops stale rows of the window."""
+        bulk_upsert(PortfolioSnapshot, self.fields, self.rows[:1] + [(self.user.id, date(2024, 1, 3), 30, 3)],
+                    unique_fields=['user_id', 'date'], replace=PortfolioSnapshot.objects.filter(user=self.user))
+        self.assertEqual(list(PortfolioSnapshot.objects.filter(user=self.user).values_list('date', 'total_value')),
+                         [(date(2024, 1, 2), Decimal('20.50')), (date(2024, 1, 3), Decimal('30.00'))])
+
+        # update_fields=[] -> existing rows win
+        bulk_upsert(PortfolioSnapshot, self.fields, [(self.user.id, date(2024, 1, 2), 99, 99)],
+                    unique_fields=['user_id', 'date'], update_fields=[])
+        self.assertEqual(PortfolioSnapshot.objects.get(user=self.user, date=date(2024, 1, 2)).total_value, Decimal('20.50'))
+
+    def test_postgres_path_stages_with_copy_and_merges_once(self):
+        """Test the PostgreSQL statement sequence: COPY into a staging table, stale delete, one INSERT ... ON CONFLICT."""
+        executed, copied = [], []
+        cursor = mock.MagicMock()
+        cursor.execute.side_effect = lambda sql, params=None: executed.append(sql)
+        cursor.cursor.copy_expert.side_effect = lambda sql, buf: copied.append((sql, buf.read()))
+        fake = mock.MagicMock(vendor='postgresql')
+        fake.ops.quote_name = connection.ops.quote_name
+        fake.cursor.return_value.__enter__.return_value = cursor
+
+        with mock.patch('core.bulk_writer.connection', fake):
+            written = bulk_upsert(PortfolioSnapshot, self.fields, iter(self.rows), unique_fields=['user_id', 'date'],
+                                  replace=PortfolioSnapshot.objects.filter(user=self.user))
+
+        self.assertEqual(written, 2)
+        self.assertIn('COPY "stage_analytics_portfoliosnapshot"', copied[0][0])
+        self.assertEqual(copied[0][1].splitlines(), [f"{self.user.id},2024-01-02,20.50,2.00", f"{self.user.id},2024-01-03,30.00,"])
+        self.assertTrue(executed[0].startswith('CREATE TEMP TABLE "stage_analytics_portfoliosnapshot"'))
+        self.assertIn('NOT EXISTS', executed[1])
+        self.assertIn('ON CONFLICT ("user_id", "date") DO UPDATE SET "total_value" = EXCLUDED."total_value"', executed[2])
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    statuses = []
+
+    def do_GET(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTest(TestCase):
+    def test_retries_then_breaker_fails_fast(self):
+        """Test that Yahoo outages (which yf.download swallows) are retried, then the open circuit rejects calls until a trial succeeds."""
+        client = HttpClient(rate_per_second=0, max_retries=2, backoff_seconds=0, breaker_failures=2, breaker_reset_seconds=0.05)
+        outcomes = []
+
+        def download(symbols, **kwargs):
+            # Like the real library: per-ticker errors go to yfinance.shared, nothing is raised
+            ok = outcomes.pop(0) if outcomes else False
+            yfinance.shared._ERRORS = {} if ok else {s: "DNSError('Could not resolve host: guce.yahoo.com')" for s in symbols}
+            if not ok:
+                return pd.DataFrame()
+            return pd.concat({'Close': pd.DataFrame({s: [100.0] for s in symbols}, index=pd.DatetimeIndex(['2024-01-01']))}, axis=1)
+
+        provider = YahooProvider()
+        with mock.patch('core.providers.yahoo.get_http_client', return_value=client), \
+                mock.patch('core.providers.yahoo.yf.download', side_effect=download) as yf_download:
+            outcomes[:] = [False, False, True]
+            self.assertEqual(provider.get_history(['TCS.NS'], date(2024, 1, 1))['TCS.NS'].tolist(), [100.0])
+            self.assertEqual(client.metrics()[YAHOO_HOST]['retries'], 2)
+
+            for _ in range(2):
+                with self.assertRaises(YahooDownloadError):
+                    provider.get_history(['TCS.NS'], date(2024, 1, 1))
+            with self.assertRaises(CircuitOpenError):
+                provider.get_quotes(['TCS.NS'])
+            self.assertEqual(yf_download.call_count, 3 + 6) # the open circuit never reached the network
+
+            # A delisted ticker is an answer, not an outage: the half-open trial succeeds and closes the circuit
+            def delisted(symbols, **kwargs):
+                yfinance.shared._ERRORS = {'GONE.NS': "YFPricesMissingError('possibly delisted; no price data found')"}
+                return pd.DataFrame()
+
+            yf_download.side_effect = delisted
+            time.sleep(0.06)
+            self.assertTrue(provider.get_history(['GONE.NS'], date(2024, 1, 1)).empty)
+            self.assertEqual(yf_download.call_count, 10)
+            self.assertEqual(client.metrics()[YAHOO_HOST]['breaker'], 'closed')
+
+        # Non-transport errors are not retried and say nothing about the host
+        with self.assertRaises(KeyError):
+            client.call('other.test', mock.Mock(side_effect=KeyError('AAPL')))
+        self.assertEqual(client.metrics()['other.test']['failures'], 0)
+
+    def test_breaker_counts_calls_not_attempts(self):
+        """Test that one call failing on every retry records a single failure and leaves the circuit closed."""
+        client = HttpClient(rate_per_second=0, max_retries=3, backoff_seconds=0, breaker_failures=2)
+        down = mock.Mock(side_effect=ConnectionError("reset by peer"))
+        with self.assertRaises(ConnectionError):
+            client.call('api.test', down)
+
+        stats = client.metrics()['api.test']
+        self.assertEqual((down.call_count, stats['failures'], stats['breaker']), (4, 4, 'closed'))
+        self.assertEqual(client.call('api.test', lambda: 'ok'), 'ok')
+
+    def test_token_bucket_spaces_out_bursts(self):
+        """Test that calls beyond the burst wait for refills."""
+        bucket = TokenBucket(rate=50, capacity=1)
+        started = time.perf_counter()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertGreaterEqual(time.perf_counter() - started, 0.035)
+
+    def test_get_reuses_keep_alive_connections(self):
+        """Test that GETs share one pooled socket and a 503 is retried."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        _KeepAliveHandler.statuses = [503]
+
+        client = HttpClient(rate_per_second=0, backoff_seconds=0)
+        url = f"http://127.0.0.1:{server.server_port}/mf/120503"
+        for _ in range(4):
+            self.assertEqual(client.get(url, timeout=5).status_code, 200)
+
+        stats = client.metrics()[f"127.0.0.1:{server.server_port}"]
+        self.assertEqual((stats['requests'], stats['retries'], stats['connections_opened']), (5, 1, 1))
+        self.assertEqual(stats['connection_reuse'], 0.8)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight('test', lock_ttl=5, wait_timeout=2, poll_interval=0.01)
+
+    def test_concurrent_callers_share_one_fetch_per_key(self):
+        """Test that overlapping requests for the same symbols fetch each symbol once."""
+        fetched, started = [], threading.Event()
+
+        def slow_fetch(symbols):
+            fetched.extend(symbols)
+            started.set()
+            time.sleep(0.1)
+            return {s: 100.0 for s in symbols}
+
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(a=self.flight.do(['TCS.NS', 'INFY.NS'], slow_fetch)))
+        leader.start()
+        started.wait(1)
+        results['b'] = self.flight.do(['INFY.NS', '120503'], slow_fetch)
+        leader.join()
+
+        self.assertEqual(sorted(fetched), ['120503', 'INFY.NS', 'TCS.NS'])
+        self.assertEqual(results['b'], {'INFY.NS': 100.0, '120503': 100.0})
+
+    def test_other_process_claim_is_awaited_not_refetched(self):
+        """Test that a symbol claimed in the shared cache is read from the leader's published result."""
+        cache.set(self.flight._lock_key('TCS.NS'), 'other-worker', 5)
+
+        def leader_finishes():
+            time.sleep(0.05)
+            cache.set(self.flight._result_key('TCS.NS'), 3500.0, 5)
+            cache.delete(self.flight._lock_key('TCS.NS'))
+
+        threading.Thread(target=leader_finishes).start()
+        fetch = mock.Mock(return_value={'INFY.NS': 1500.0})
+        self.assertEqual(self.flight.do(['TCS.NS', 'INFY.NS'], fetch), {'TCS.NS': 3500.0, 'INFY.NS': 1500.0})
+        fetch.assert_called_once_with(['INFY.NS'])
+        self.assertIsNone(cache.get(self.flight._lock_key('INFY.NS'))) # our claim is released
+
+
+class SharedCacheTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_is_shared_and_instrumented(self):
+        """Test that a second backend instance (another worker) sees the same entries, and hits/claims are counted."""
+        other_worker = InstrumentedDatabaseCache('pandaledger_cache', {})
+        cache.set('market_dashboard_full', {'market_summary': []}, 10)
+        self.assertEqual(other_worker.get('market_dashboard_full'), {'market_summary': []})
+        self.assertIsNone(other_worker.get('usd_inr_live_rate'))
+        self.assertTrue(cache.add('market_update_lock', 'true', 15))
+        self.assertFalse(other_worker.add('market_update_lock', 'true', 15))
+
+        ops = other_worker.stats.snapshot()['ops']
+        self.assertEqual((ops['get']['hits'], ops['get']['misses']), (1, 1))
+        self.assertEqual((ops['add']['hits'], ops['add']['misses']), (0, 1))
+
+    def test_add_takes_over_expired_claims_in_one_statement(self):
+        """Test that `add` wins only free or expired keys, with a single upsert (no read-then-write race)."""
+        other_worker = InstrumentedDatabaseCache('pandaledger_cache', {})
+        self.assertTrue(cache.add('backfill_exec_lock_1', 'a', 60))
+        self.assertFalse(other_worker.add('backfill_exec_lock_1', 'b', 60))
+
+        cache.set('backfill_exec_lock_1', 'a', -1) # the holder's claim expired
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(other_worker.add('backfill_exec_lock_1', 'b', 60))
+        self.assertEqual(cache.get('backfill_exec_lock_1'), 'b')
+        self.assertFalse(cache.add('backfill_exec_lock_1', 'a', 60))
+
+        claims = [q['sql'] for q in queries.captured_queries if 'pandaledger_cache' in q['sql'] and 'COUNT' not in q['sql']]
+        self.assertEqual(len(claims), 1)
+        self.assertIn('ON CONFLICT', claims[0])
+
+    def test_lock_is_exclusive_until_released(self):
+        """Test that a held lock turns other callers away, and is free again once released."""
+        before = lock_metrics().get('market_refresh', {'acquired': 0, 'busy': 0})
+        seen = []
+
+        def other_worker():
+            with distributed_lock('market_refresh') as acquired:
+                seen.append(acquired)
+
+        with distributed_lock('market_refresh') as acquired:
+            self.assertTrue(acquired)
+            worker = threading.Thread(target=other_worker)
+            worker.start()
+            worker.join()
+        self.assertEqual(seen, [False])
+        with distributed_lock('market_refresh') as acquired:
+            self.assertTrue(acquired)
+
+        after = lock_metrics()['market_refresh']
+        self.assertEqual((after['acquired'] - before['acquired'], after['busy'] - before['busy']), (2, 1))
@@ -10,5 +10,7 @@ urlpatterns = [
     path('auth/reset-password/', views.request_password_reset, name='reset_password'),
     path('auth/reset-password-confirm/', views.reset_password_confirm, name='reset_password_confirm'),
     path('auth/csrf/', views.get_csrf_token, name='get_csrf_token'),
+    path('system/http-metrics/', views.http_metrics, name='http_metrics'),
+    path('system/cache-metrics/', views.cache_metrics, name='cache_metrics'),
 
 ]
@@ -1,9 +1,43 @@
 import threading
 import logging
+import zoneinfo
+from datetime import datetime, time, timedelta
 from django.core.mail import EmailMessage
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+IST = zoneinfo.ZoneInfo('Asia/Kolkata')
+
+# Indian market data for a day is only final a few hours after midnight,
+# so a "day" in PandaLedger starts at 4am IST.
+DAY_ROLLOVER_HOUR_IST = 4
+
+# NSE/BSE close; end-of-day prices (and the NAVs struck from them) are as of this time
+MARKET_CLOSE_IST = time(15, 30)
+
+
+def get_logical_date(now=None):
+    """
+    Returns the date whose closing prices are the latest settled ones.
+    Before 4am IST this is still yesterday.
+    """
+    now_ist = (now or timezone.now()).astimezone(IST)
+    if now_ist.hour >= DAY_ROLLOVER_HOUR_IST:
+        return now_ist.date()
+    return (now_ist - timedelta(days=1)).date()
+
+
+def get_logical_day_start(now=None):
+    """The moment (4am IST) the current logical day began, as an aware datetime."""
+    day = get_logical_date(now)
+    return datetime(day.year, day.month, day.day, DAY_ROLLOVER_HOUR_IST, tzinfo=IST)
+
+
+def market_close(day):
+    """The market close (15:30 IST) of `day`: the moment an end-of-day price for that date is as of."""
+    return datetime.combine(day, MARKET_CLOSE_IST, tzinfo=IST)
+
 class EmailThread(threading.Thread):
     """
     A thread subclass to send emails asynchronously.
@@ -9,7 +9,11 @@ from django.contrib.auth.forms import PasswordResetForm
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
+from django.views.decorators.http import require_GET
+from django.core.cache import cache
 from .utils import send_email_async 
+from .locks import lock_metrics
+from .providers.http_client import get_http_client
 
 @ensure_csrf_cookie
 def signup_api(request):
@@ -220,4 +224,33 @@ def get_csrf_token(request):
     This view does nothing but set the CSRF cookie.
     React calls this when the app loads.
     """
-    return JsonResponse({'message': 'CSRF cookie set'})
\ No newline at end of file
+    return JsonResponse({'message': 'CSRF cookie set'})
+
+
+@require_GET
+def http_metrics(request):
+    """
+    API Endpoint (Admins only): Outbound HTTP health for this process.
+
+    Per host (MFAPI, Yahoo): calls, retries, failures, calls rejected by an open circuit,
+    time spent waiting on the rate limiter, and how often keep-alive sockets were reused.
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "Admins only"}, status=403)
+
+    return JsonResponse(get_http_client().metrics())
+
+
+@require_GET
+def cache_metrics(request):
+    """
+    API Endpoint (Admins only): Shared cache and lock activity for this process.
+
+    Cache: calls, hits/misses and time spent per operation (`add` hits are claims won).
+    Locks: acquisitions, attempts that found the lock busy, and time held.
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "Admins only"}, status=403)
+
+    stats = getattr(cache, 'stats', None) # only the instrumented backend keeps counters
+    return JsonResponse({"cache": stats.snapshot() if stats else None, "locks": lock_metrics()})
@@ -1,9 +1,12 @@
 import logging
-import yfinance as yf
 import random
 import threading
+from django.conf import settings
 from django.core.cache import cache
 import math
+from datetime import date, timedelta
+from core.locks import distributed_lock
+from core.providers.routing import get_price_provider
 from .models import MarketCache
 
 logger = logging.getLogger(__name__)
@@ -26,7 +29,19 @@ def clean_data(data):
 
 def fetch_live_data_and_save():
     """
-    Fetches real-time market data from Yahoo Finance using optimized batch processing.
+    Refreshes the market dashboard unless another process (web worker or the
+    `refresh_prices` daemon) is already doing it; in that case returns what is cached.
+    """
+    with distributed_lock('market_refresh', timeout=60) as acquired:
+        if acquired:
+            return _fetch_market_data_and_save()
+    cached = MarketCache.objects.filter(id=1).first()
+    return cache.get('market_dashboard_full') or (cached.data if cached else {"market_summary": [], "news": []})
+
+
+def _fetch_market_data_and_save():
+    """
+    Fetches real-time market data from the price provider (Yahoo Finance) using optimized batch processing.
     
     Operations:
     1. Batch fetches prices for Indices, Commodities, Crypto, and Forex (1 API Call).
@@ -55,9 +70,11 @@ def fetch_live_data_and_save():
     dashboard_data = { "market_summary": [], "news": [] }
 
     try:
+        provider = get_price_provider()
+
         # 1. Batch Fetch All Prices (Efficient: 1 Call)
-        # Using threads=True for faster downloading; group_by='ticker' organizes data by symbol
-        market_data = yf.download(tickers=" ".join(all_symbols), period="1mo", interval="1d", group_by='ticker', threads=True, progress=False, auto_adjust=True)
+        # One column of daily closes per symbol for the last month
+        market_data = provider.get_history(all_symbols, date.today() - timedelta(days=31))
         
         market_data= market_data.ffill()
         
@@ -66,9 +83,9 @@ def fetch_live_data_and_save():
         usd_price = 87.0
         if 'INR=X' in market_data.columns:
             try:
-                usd_hist = market_data['INR=X']
+                usd_hist = market_data['INR=X'].dropna()
                 if not usd_hist.empty:
-                    usd_price = float(usd_hist['Close'].iloc[-1])
+                    usd_price = float(usd_hist.iloc[-1])
             except Exception:
                 pass # Keep default 87.0
 
@@ -84,7 +101,7 @@ def fetch_live_data_and_save():
                     
                     if not ticker_df.empty:
                         # Extract Close Series and handle NaNs
-                        close_data = ticker_df['Close'].dropna()
+                        close_data = ticker_df.dropna()
                         if close_data.empty:
                             continue
 
@@ -145,9 +162,7 @@ def fetch_live_data_and_save():
             
             for src in news_sources:
                 try:
-                    # News fetch still requires Ticker object access
-                    t = yf.Ticker(src)
-                    src_news = t.news
+                    src_news = provider.get_news(src)
                     tag = "India" if src == "^NSEI" else "Global"
                     for article in src_news:
                         article['source_tag'] = tag
@@ -208,29 +223,31 @@ def get_market_dashboard_data():
     Retrieves market dashboard data with a multi-tiered caching strategy.
     
     Strategy:
-    1. RAM (Redis Cache): Returns instantly (< 10ms).
+    1. Shared cache (DB cache table, one for all workers): Returns in a single indexed lookup.
     2. DB (Persistent Cache): Returns if cache misses (< 50ms), then triggers background refresh.
     3. Cold Start: Fetches fresh data synchronously if both Cache and DB are empty (Fallback).
+
+    Steps 2-3 only touch the provider with PRICE_REFRESH_ON_READ; otherwise the
+    `refresh_prices` daemon keeps the DB copy fresh and reads never do provider I/O.
     
     Returns:
         dict: The dashboard data JSON.
     """
-    # 1. TRY RAM CACHE
+    # 1. TRY SHARED CACHE
     cached_data = cache.get("market_dashboard_full")
     if cached_data:
         return cached_data
     
     # 2. TRY DATABASE
     db_data = MarketCache.objects.filter(id=1).first()
+    if not settings.PRICE_REFRESH_ON_READ:
+        return db_data.data if db_data else {"market_summary": [], "news": []}
+
     if db_data:
         #  Only trigger update if one isn't already running
-        if not cache.get("market_update_lock"):
+        # `add` is atomic on the shared cache (an upsert, see core.cache): one claim for all workers, not one per process
+        if cache.add("market_update_lock", "true", 15):
             logger.info("Serving stale data from DB. Triggering background update...")
-            
-            # Set a temporary lock 5 seconds to prevent multiple threads from spawning 
-            # if 100 users hit this exact line simultaneously.
-            cache.set("market_update_lock", "true", 15)
-            
             thread = threading.Thread(target=fetch_live_data_and_save, daemon=True)
             thread.start()
         else:
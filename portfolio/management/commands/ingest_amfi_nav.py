@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from portfolio.services.amfi_nav import ingest_amfi_nav
+
+
+class Command(BaseCommand):
+    help = ("Updates every seeded Mutual Fund's NAV from AMFI's daily NAVAll file in one streaming pass "
+            "(run after ~11pm IST, once AMFI has published the day's NAVs).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', default=settings.AMFI_NAV_URL,
+                            help='Path or URL of NAVAll.txt (default: AMFI_NAV_URL)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Funds per bulk_update batch')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Ingesting AMFI NAVs from {options['source']}...")
+        try:
+            stats = ingest_amfi_nav(options['source'], batch_size=options['batch_size'])
+        except OSError as e: # missing file, network failure, HTTP error status
+            raise CommandError(f"Could not read {options['source']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Parsed {stats['parsed']} NAVs: {stats['updated']} funds updated, "
+            f"{stats['bars']} history bars appended, {stats['skipped']} outdated NAVs skipped, "
+            f"{stats['unknown']} schemes not seeded."
+        ))
@@ -0,0 +1,68 @@
+import logging
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from analytics.services.metrics import refresh_benchmark_data
+from core.services import refresh_usd_inr_rate
+from dashboard.services import fetch_live_data_and_save
+from portfolio.services.live_prices import refresh_held_assets
+
+logger = logging.getLogger(__name__)
+
+_stop_requested = False
+
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+
+
+class Command(BaseCommand):
+    help = ('Keeps prices fresh for every asset held by any user (stocks/crypto every 5 minutes, '
+            'MFs once per IST trading day), plus the market dashboard, the Nifty benchmark and USD/INR, '
+            'so read endpoints never call providers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.PRICE_REFRESH_INTERVAL_SECONDS,
+                            help='Seconds between ticks (default: PRICE_REFRESH_INTERVAL_SECONDS)')
+        parser.add_argument('--batch-size', type=int, default=settings.PRICE_REFRESH_BATCH_SIZE,
+                            help='Assets per provider batch (default: PRICE_REFRESH_BATCH_SIZE)')
+        parser.add_argument('--market-interval', type=float, default=settings.MARKET_REFRESH_INTERVAL_SECONDS,
+                            help='Seconds between market dashboard refreshes (0 = off)')
+        parser.add_argument('--once', action='store_true', help='Run a single tick and exit (cron style)')
+
+    def handle(self, *args, **options):
+        signal.signal(signal.SIGTERM, _request_stop)
+        signal.signal(signal.SIGINT, _request_stop)
+        last_market = 0.0
+        self.stdout.write(f"Price refresh daemon started (every {options['interval']}s, batches of {options['batch_size']}).")
+
+        while not _stop_requested:
+            started = time.monotonic()
+            try:
+                stale, updated = refresh_held_assets(batch_size=options['batch_size'])
+                if stale:
+                    logger.info(f"Price refresh tick: {updated}/{stale} stale assets updated in {time.monotonic() - started:.1f}s")
+
+                if options['market_interval'] and started - last_market >= options['market_interval']:
+                    fetch_live_data_and_save()
+                    last_market = started
+
+                # Reference data read by the analytics endpoints (no-ops while still fresh)
+                refresh_benchmark_data()
+                refresh_usd_inr_rate()
+            except Exception as e:
+                # A provider or DB hiccup must not kill the daemon; the next tick retries
+                logger.error(f"Price refresh tick failed: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+            if options['once']:
+                break
+            # Sleep in short steps so SIGTERM is honoured quickly
+            while not _stop_requested and time.monotonic() - started < options['interval']:
+                time.sleep(0.5)
+
+        self.stdout.write(self.style.SUCCESS("Price refresh daemon stopped."))
@@ -1,21 +1,16 @@
-import requests
 from django.core.management.base import BaseCommand
 from portfolio.models import Asset
+from core.providers.routing import get_price_provider
 
 class Command(BaseCommand):
     help = 'Seeds the database with Indian Mutual Funds from MFAPI.in'
 
     def handle(self, *args, **kwargs):
-        url = "https://api.mfapi.in/mf"
-        self.stdout.write(f"Fetching Master List from {url}...")
+        provider = get_price_provider()
+        self.stdout.write("Fetching Mutual Fund master list...")
         
         try:
-            response = requests.get(url)
-            if response.status_code != 200:
-                self.stdout.write(self.style.ERROR(f"Failed to fetch data: {response.status_code}"))
-                return
-            
-            data = response.json()
+            data = provider.list_schemes()
             total_schemes = len(data)
             self.stdout.write(f"Found {total_schemes} schemes. Preparing to seed...")
 
@@ -0,0 +1,139 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from django.db.models import Max
+from analytics.models import AssetPriceHistory
+from analytics.services.price_history import store_bars
+from analytics.services.result_cache import invalidate_asset_holders
+from core.providers.http_client import get_http_client
+from core.utils import IST, market_close
+from portfolio.models import Asset
+
+logger = logging.getLogger(__name__)
+
+# A fund whose stored history stops further back than this is left to `sync_price_history`:
+# appending today's bar would move its "last bar" past a hole that would then never get fetched.
+# 4 days covers a weekend plus one market holiday.
+MAX_APPEND_GAP_DAYS = 4
+
+
+def parse_nav_lines(lines):
+    """
+    Parses AMFI's NAVAll.txt, line by line.
+
+    Data lines look like
+    `Scheme Code;ISIN Div Payout/ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date`
+    (e.g. `119551;INF209KA12Z1;-;Aditya Birla ... - IDCW;105.0524;17-Oct-2025`).
+    The header, blank lines, category/AMC headings and "N.A." NAVs are skipped.
+
+    Yields:
+        tuple[str, Decimal, date]: (scheme_code, nav, nav_date)
+    """
+    for line in lines:
+        parts = line.strip().split(';')
+        if len(parts) < 6 or not parts[0].strip().isdigit():
+            continue
+        try:
+            nav = Decimal(parts[4].strip())
+            nav_date = datetime.strptime(parts[5].strip(), '%d-%b-%Y').date()
+        except (InvalidOperation, ValueError):
+            continue
+        if nav > 0:
+            yield parts[0].strip(), nav, nav_date
+
+
+@contextmanager
+def open_nav_source(source):
+    """Opens a local path or an http(s) URL (streamed through the shared client) as an iterator of text lines."""
+    if source.startswith(('http://', 'https://')):
+        response = get_http_client().get(source, timeout=60, stream=True)
+        try:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            yield response.iter_lines(decode_unicode=True)
+        finally:
+            response.close()
+    else:
+        with open(source, encoding='utf-8', errors='replace') as f:
+            yield f
+
+
+def ingest_nav_lines(lines, batch_size=2000):
+    """
+    Bulk NAV update for every seeded Mutual Fund from one pass over the NAVAll file.
+
+    Strategy:
+    1. Load the scheme code -> asset id map for MF assets once.
+    2. Stream the file, collecting parsed rows into batches of `batch_size`.
+    3. Per batch: rows older than what the fund already has (a newer stored bar, or a quote
+       taken on a later day) are dropped, so an old or re-run file never rolls a price back.
+    4. One `bulk_update` of `last_price`/`updated_at` for the rest, and the day's bar appended
+       to the price history (skipped for funds whose history has a gap, see MAX_APPEND_GAP_DAYS).
+       `updated_at` is the NAV date's market close, not the ingest time: the price is as of that
+       close, and staleness checks must see a file published days late as old.
+
+    Returns:
+        dict: counts of parsed rows, updated assets, appended bars, rows skipped as outdated
+        and unknown scheme codes.
+    """
+    asset_ids = dict(Asset.objects.filter(asset_type='MF').values_list('symbol', 'id'))
+    stats = {'parsed': 0, 'updated': 0, 'bars': 0, 'skipped': 0, 'unknown': 0}
+
+    batch = []
+    for code, nav, nav_date in parse_nav_lines(lines):
+        stats['parsed'] += 1
+        asset_id = asset_ids.get(code)
+        if asset_id is None:
+            stats['unknown'] += 1
+            continue
+        batch.append((asset_id, nav, nav_date))
+        if len(batch) >= batch_size:
+            _save_batch(batch, stats)
+            batch = []
+    if batch:
+        _save_batch(batch, stats)
+
+    logger.info(f"📥 AMFI NAV ingest: {stats['updated']} funds updated, {stats['bars']} bars appended "
+                f"({stats['skipped']} outdated rows, {stats['unknown']} unknown schemes)")
+    return stats
+
+
+def _save_batch(batch, stats):
+    ids = [row[0] for row in batch]
+    last_stored = dict(
+        AssetPriceHistory.objects.filter(asset_id__in=ids)
+        .values('asset_id').annotate(last=Max('date')).values_list('asset_id', 'last')
+    )
+    # Newest date each fund already has a price for: its last stored bar or its current quote
+    # (an unpriced fund's updated_at is just its creation time)
+    newest = dict(last_stored)
+    for asset_id, updated_at in Asset.objects.filter(id__in=ids, last_price__gt=0).values_list('id', 'updated_at'):
+        quoted_on = updated_at.astimezone(IST).date()
+        newest[asset_id] = max(newest.get(asset_id, quoted_on), quoted_on)
+
+    batch = [row for row in batch if row[0] not in newest or row[2] >= newest[row[0]]]
+    stats['skipped'] += len(ids) - len(batch)
+    if not batch:
+        return
+
+    Asset.objects.bulk_update(
+        [Asset(id=asset_id, last_price=round(nav, 2), updated_at=market_close(nav_date)) for asset_id, nav, nav_date in batch],
+        ['last_price', 'updated_at'],
+    )
+    stats['updated'] += len(batch)
+    invalidate_asset_holders([row[0] for row in batch])
+
+    bars = []
+    for asset_id, nav, nav_date in batch:
+        last = last_stored.get(asset_id)
+        # No history yet is fine: the next sync sees it doesn't reach `start_date` and fetches the range
+        if last is None or last >= nav_date - timedelta(days=MAX_APPEND_GAP_DAYS):
+            bars.append((asset_id, nav_date, nav))
+    stats['bars'] += store_bars(bars)
+
+
+def ingest_amfi_nav(source, batch_size=2000):
+    """Ingests the NAVAll file at `source` (path or URL). See `ingest_nav_lines`."""
+    with open_nav_source(source) as lines:
+        return ingest_nav_lines(lines, batch_size=batch_size)
@@ -0,0 +1,95 @@
+import logging
+from datetime import timedelta
+from django.utils import timezone
+from core.providers.routing import get_price_provider, is_mf_symbol
+from core.singleflight import SingleFlight
+from core.utils import get_logical_day_start
+from analytics.services.result_cache import invalidate_asset_holders
+from portfolio.models import Asset
+
+logger = logging.getLogger(__name__)
+
+# Stocks/crypto move all day: refresh every 5 minutes. MF NAVs publish once per day.
+STOCK_REFRESH_INTERVAL = timedelta(minutes=5)
+
+# Ten users opening the app at once must not fire ten fetches for the same symbols
+price_refresh = SingleFlight('live_prices', lock_ttl=60, wait_timeout=30)
+
+
+def is_stale(asset, now=None):
+    """
+    Whether `asset.last_price` needs a refresh.
+
+    - Missing price (0): always.
+    - Mutual Funds: last update happened before the current IST trading day began (4am IST).
+      Comparing against the day boundary (not "21 hours ago") means a NAV fetched at 23:10
+      doesn't block the next morning's NAV.
+    - Stocks/Crypto: older than `STOCK_REFRESH_INTERVAL`.
+    """
+    now = now or timezone.now()
+    if asset.last_price == 0:
+        return True
+    if is_mf_symbol(asset.symbol):
+        return asset.updated_at < get_logical_day_start(now)
+    return asset.updated_at < now - STOCK_REFRESH_INTERVAL
+
+
+def refresh_prices(assets, now=None):
+    """
+    Update asset prices using a hybrid strategy (via the price provider):
+    - Yahoo Finance (Batch) for Stocks/Crypto
+    - MFAPI.in (Parallel Threads) for Mutual Funds
+
+    Only stale assets are fetched. Symbols already being refreshed by someone else
+    (this process or another worker) are not fetched again: we attach to that refresh,
+    and only its leader writes the prices.
+
+    Returns:
+        dict: {symbol: price} for every stale asset that got a fresh price.
+    """
+    stale = {a.symbol: a for a in assets if is_stale(a, now)}
+    if not stale:
+        logger.info("All assets are fresh. Skipping update.")
+        return {}
+
+    n_mf = sum(is_mf_symbol(s) for s in stale)
+    logger.info(f"Updating: {len(stale) - n_mf} via Yahoo, {n_mf} via MFAPI parallel...")
+
+    def fetch_and_save(symbols):
+        # Yahoo batch for stocks/crypto, a small thread pool for MFAPI (see core/providers)
+        quotes = get_price_provider().get_quotes(symbols)
+
+        updated_assets = []
+        for symbol in symbols:
+            price = quotes.get(symbol)
+            if price:
+                asset = stale[symbol]
+                asset.last_price = price
+                asset.updated_at = timezone.now()
+                updated_assets.append(asset)
+
+        # Bulk Save (only the leader of a symbol writes it, so concurrent refreshes don't race here)
+        if updated_assets:
+            Asset.objects.bulk_update(updated_assets, ['last_price', 'updated_at'])
+            invalidate_asset_holders([a.id for a in updated_assets])
+            logger.info(f"Saved {len(updated_assets)} prices to DB.")
+        return quotes
+
+    return price_refresh.do(list(stale), fetch_and_save)
+
+
+def refresh_held_assets(batch_size=100, now=None):
+    """
+    One tick of the `refresh_prices` daemon: refreshes every stale asset held by any user.
+
+    Returns:
+        tuple[int, int]: (stale assets found, prices updated)
+    """
+    now = now or timezone.now()
+    held = Asset.objects.filter(holding__isnull=False).distinct().order_by('id')
+    stale = [a for a in held.only('id', 'symbol', 'last_price', 'updated_at') if is_stale(a, now)]
+
+    updated = 0
+    for i in range(0, len(stale), batch_size):
+        updated += len(refresh_prices(stale[i:i + batch_size], now=now))
+    return len(stale), updated
@@ -0,0 +1,85 @@
+from django.db.models import DecimalField, F, Sum
+from portfolio.models import Asset, Holding
+
+# Wide enough for quantity (4 dp) * price (2 dp) on any realistic portfolio
+_MONEY = DecimalField(max_digits=30, decimal_places=6)
+
+_ASSET_FIELDS = {
+    'asset_id': 'asset_id',
+    'symbol': 'asset__symbol',
+    'name': 'asset__name',
+    'asset_type': 'asset__asset_type',
+    'sector': 'asset__sector',
+    'market_cap_category': 'asset__market_cap_category',
+    'last_price': 'asset__last_price',
+    'updated_at': 'asset__updated_at',
+}
+
+
+def sector_label(sector, asset_type):
+    """Sector for allocation charts: assets like Gold/ETFs without a real sector fall back to their type."""
+    if not sector or sector.strip().lower() in ["other", "unknown"]:
+        return asset_type
+    return sector
+
+
+class PortfolioValuation:
+    """
+    A user's holdings valued at current prices, from one grouped query.
+
+    Compute it once per request and hand it to every consumer (XIRR, sector split, health
+    score, holdings list), so the number of queries doesn't grow with the number of holdings.
+
+    Attributes:
+        holdings (list[dict]): One row per asset: asset fields plus `quantity`, `invested`
+            and `value` (floats, value = quantity * last_price computed in SQL).
+        total_value (float): Sum of `value`.
+        total_invested (float): Sum of `invested`.
+    """
+    def __init__(self, holdings):
+        self.holdings = holdings
+        self.total_value = sum(h['value'] for h in holdings)
+        self.total_invested = sum(h['invested'] for h in holdings)
+
+    def __bool__(self):
+        return bool(self.holdings)
+
+    def by_sector(self):
+        """{sector label: value}, in first-seen order."""
+        sectors = {}
+        for h in self.holdings:
+            label = sector_label(h['sector'], h['asset_type'])
+            sectors[label] = sectors.get(label, 0) + h['value']
+        return sectors
+
+    def assets(self):
+        """Unsaved `Asset` instances carrying the fetched fields (for staleness checks / price refreshes)."""
+        return [Asset(id=h['asset_id'], symbol=h['symbol'], name=h['name'], asset_type=h['asset_type'],
+                      last_price=h['last_price'], updated_at=h['updated_at']) for h in self.holdings]
+
+
+def value_portfolio(user):
+    """
+    Values `user`'s portfolio in a single query: `quantity * asset__last_price` (and the invested
+    amount) summed per asset, carrying each asset's sector and type for the groupings.
+
+    Returns:
+        PortfolioValuation
+    """
+    rows = (
+        Holding.objects.filter(user=user)
+        .values(*_ASSET_FIELDS.values())
+        .annotate(
+            total_quantity=Sum('quantity'),
+            invested=Sum(F('quantity') * F('avg_buy_price'), output_field=_MONEY),
+            value=Sum(F('quantity') * F('asset__last_price'), output_field=_MONEY),
+        )
+        .order_by('asset_id')
+    )
+
+    holdings = []
+    for row in rows:
+        holding = {key: row[lookup] for key, lookup in _ASSET_FIELDS.items()}
+        holding.update(quantity=float(row['total_quantity']), invested=float(row['invested']), value=float(row['value']))
+        holdings.append(holding)
+    return PortfolioValuation(holdings)
@@ -1,3 +1,226 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from analytics.models import AssetPriceHistory
+from analytics.services.calculators import get_sector_split
+from analytics.services.metrics import calculate_health_score, fetch_benchmark_data
+from analytics.services.xirr_engine import compute_xirr
+from core.services import get_usd_inr_rate
+from core.utils import IST
+from .models import Asset, Holding
+from .services.amfi_nav import ingest_amfi_nav
+from .services.live_prices import is_stale, refresh_held_assets
+from .services.valuation import value_portfolio
 
-# Create your tests here.
+
+class LivePriceRefreshTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tcs = Asset.objects.create(symbol='TCS.NS', name='TCS', last_price=3500)
+        self.fund = Asset.objects.create(symbol='120503', name='Axis Bluechip', asset_type='MF', last_price=50)
+        self.unheld = Asset.objects.create(symbol='INFY.NS', name='Infosys', last_price=0)
+        for name in ('alice', 'bob'):
+            user = get_user_model().objects.create_user(username=name, password='password123')
+            Holding.objects.create(user=user, asset=self.tcs)
+        Holding.objects.create(user=user, asset=self.fund)
+
+    def test_staleness_rules(self):
+        """Test the 5-minute stock cadence and the once-per-IST-trading-day MF rule."""
+        now = datetime(2024, 6, 10, 3, 0, tzinfo=IST) # before the 4am rollover: still the 9th's trading day
+        self.fund.updated_at = datetime(2024, 6, 9, 23, 10, tzinfo=IST)
+        self.assertFalse(is_stale(self.fund, now))
+        self.assertTrue(is_stale(self.fund, now + timedelta(hours=2)))
+
+        self.tcs.updated_at = now - timedelta(minutes=4)
+        self.assertFalse(is_stale(self.tcs, now))
+        self.assertTrue(is_stale(self.tcs, now + timedelta(minutes=2)))
+        self.assertTrue(is_stale(self.unheld, now)) # no price yet
+
+    @mock.patch('portfolio.management.commands.refresh_prices.refresh_usd_inr_rate')
+    @mock.patch('portfolio.management.commands.refresh_prices.refresh_benchmark_data')
+    @mock.patch('portfolio.services.live_prices.get_price_provider')
+    def test_daemon_refreshes_distinct_held_assets(self, get_provider, _benchmark, _usd_inr):
+        """Test that one tick fetches each held stale asset once, and the read endpoint stays offline."""
+        Asset.objects.filter(id=self.tcs.id).update(updated_at=timezone.now() - timedelta(minutes=10))
+        get_provider.return_value.get_quotes.return_value = {'TCS.NS': 3600.0}
+
+        call_command('refresh_prices', once=True, market_interval=0, stdout=mock.Mock())
+
+        get_provider.return_value.get_quotes.assert_called_once_with(['TCS.NS']) # fund is fresh, INFY unheld
+        self.tcs.refresh_from_db()
+        self.assertEqual(float(self.tcs.last_price), 3600.0)
+        self.assertEqual(refresh_held_assets(), (0, 0))
+
+        self.client.force_login(get_user_model().objects.get(username='bob'))
+        self.assertEqual(self.client.get('/api/portfolio/holdings/').status_code, 200)
+        self.assertEqual(get_provider.return_value.get_quotes.call_count, 1)
+
+    @mock.patch('core.services.get_price_provider')
+    @mock.patch('analytics.services.metrics.get_price_provider')
+    def test_daemon_warms_reference_data_for_cache_only_reads(self, benchmark_provider, fx_provider):
+        """Test that benchmark/USD-INR reads never call providers, and the daemon fills their cache once per cadence."""
+        Asset.objects.create(symbol='INR=X', name='USD/INR', last_price=83.1)
+        benchmark_provider.return_value.get_history.return_value = pd.DataFrame(
+            {'^NSEI': [100.0, 101.0, 99.99]}, index=pd.date_range('2025-01-01', periods=3))
+        fx_provider.return_value.get_quotes.return_value = {'INR=X': 88.456}
+
+        # Cold cache: degrade (no beta series, last known rate) instead of fetching in the request
+        self.assertTrue(fetch_benchmark_data().empty)
+        self.assertEqual(get_usd_inr_rate(), 83.1)
+        benchmark_provider.return_value.get_history.assert_not_called()
+        fx_provider.return_value.get_quotes.assert_not_called()
+
+        for _ in range(2): # the second tick finds both still fresh
+            call_command('refresh_prices', once=True, market_interval=0, stdout=mock.Mock())
+        self.assertEqual(benchmark_provider.return_value.get_history.call_count, 1)
+        self.assertEqual(fx_provider.return_value.get_quotes.call_count, 1)
+
+        np.testing.assert_allclose(fetch_benchmark_data().to_numpy(), [0.01, -0.01])
+        self.assertEqual(get_usd_inr_rate(), 88.46)
+        self.assertEqual(float(Asset.objects.get(symbol='INR=X').last_price), 88.46) # DB fallback kept current
+
+
+NAV_ALL = """Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date
+
+Open Ended Schemes(Equity Scheme - Large Cap Fund)
+
+Axis Mutual Fund
+
+120503;INF846K01DP8;-;Axis Bluechip Fund - Direct Plan - Growth;61.2345;17-Oct-2025
+120504;INF846K01DQ6;-;Axis Bluechip Fund - Direct Plan - IDCW;N.A.;17-Oct-2025
+120505;INF846K01DR4;-;Axis Midcap Fund - Direct Plan - Growth;110.5;17-Oct-2025
+999999;INF000000000;-;Not Seeded Fund;12.34;17-Oct-2025
+"""
+
+
+class AmfiNavIngestTest(TestCase):
+    def setUp(self):
+        self.bluechip = Asset.objects.create(symbol='120503', name='Axis Bluechip', asset_type='MF', last_price=0)
+        self.idcw = Asset.objects.create(symbol='120504', name='Axis Bluechip IDCW', asset_type='MF', last_price=10)
+        self.midcap = Asset.objects.create(symbol='120505', name='Axis Midcap', asset_type='MF', last_price=0)
+        AssetPriceHistory.objects.create(asset=self.bluechip, date=date(2025, 10, 16), close=61)
+        AssetPriceHistory.objects.create(asset=self.midcap, date=date(2025, 9, 1), close=100) # history lags
+        # Priced funds were last quoted with the previous day's NAV
+        Asset.objects.filter(last_price__gt=0).update(updated_at=datetime(2025, 10, 16, 15, 30, tzinfo=IST))
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write(NAV_ALL)
+        self.addCleanup(os.remove, self.path)
+
+    def test_one_file_updates_all_funds(self):
+        """Test that the NAV file updates prices in bulk and appends bars without hiding history gaps."""
+        call_command('ingest_amfi_nav', self.path, stdout=mock.Mock())
+
+        self.bluechip.refresh_from_db()
+        self.midcap.refresh_from_db()
+        self.idcw.refresh_from_db()
+        self.assertEqual(float(self.bluechip.last_price), 61.23)
+        self.assertEqual(float(self.midcap.last_price), 110.5)
+        self.assertEqual(float(self.idcw.last_price), 10) # N.A. NAV left alone
+        # Stamped with the NAV's market close, not the ingest time
+        self.assertEqual(self.bluechip.updated_at, datetime(2025, 10, 17, 15, 30, tzinfo=IST))
+        self.assertFalse(is_stale(self.bluechip, now=datetime(2025, 10, 17, 23, 30, tzinfo=IST)))
+        self.assertTrue(is_stale(self.bluechip, now=datetime(2025, 10, 18, 9, 0, tzinfo=IST)))
+
+        bar = AssetPriceHistory.objects.get(asset=self.bluechip, date=date(2025, 10, 17))
+        self.assertEqual(float(bar.close), 61.2345)
+        # Midcap's history stops in September: the tail sync fills that gap, so no bar jumps ahead of it
+        self.assertFalse(AssetPriceHistory.objects.filter(asset=self.midcap, date=date(2025, 10, 17)).exists())
+
+    def test_outdated_navs_do_not_roll_prices_back(self):
+        """Test that a file older than a fund's stored bar or current quote leaves that fund alone."""
+        quoted_at = datetime(2025, 10, 20, 10, 0, tzinfo=IST) # live refresh after the file's date
+        Asset.objects.filter(id=self.bluechip.id).update(last_price=63, updated_at=quoted_at)
+        AssetPriceHistory.objects.create(asset=self.midcap, date=date(2025, 10, 20), close=115)
+
+        stats = ingest_amfi_nav(self.path)
+
+        self.bluechip.refresh_from_db()
+        self.midcap.refresh_from_db()
+        self.assertEqual((float(self.bluechip.last_price), self.bluechip.updated_at), (63, quoted_at))
+        self.assertEqual(float(self.midcap.last_price), 0)
+        self.assertEqual((stats['updated'], stats['skipped'], stats['bars']), (0, 2, 0))
+
+
+@mock.patch('portfolio.services.live_prices.get_price_provider')
+class DeadlineRefreshTest(TransactionTestCase):
+    # Real commits: the refresh runs on its own thread/connection
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='carol', password='password123')
+        self.asset = Asset.objects.create(symbol='TCS.NS', name='TCS', last_price=3500)
+        Holding.objects.create(user=self.user, asset=self.asset, quantity=1)
+        Asset.objects.filter(id=self.asset.id).update(updated_at=timezone.now() - timedelta(minutes=10))
+        self.client.force_login(self.user)
+
+    def _holding(self, wait_ms):
+        return self.client.get(f'/api/portfolio/holdings/?wait_ms={wait_ms}').json()['holdings'][0]
+
+    def test_fresh_price_within_deadline_is_served(self, get_provider):
+        """Test that a refresh finishing before the deadline shows up in the same response."""
+        get_provider.return_value.get_quotes.return_value = {'TCS.NS': 3600.0}
+        holding = self._holding(1000)
+        self.assertEqual((holding['current_price'], holding['stale']), (3600.0, False))
+        self.assertLess(holding['price_age_seconds'], 5)
+
+    def test_slow_refresh_is_cut_off_at_the_deadline(self, get_provider):
+        """Test that a slow provider costs at most the deadline and the old price is flagged stale."""
+        get_provider.return_value.get_quotes.side_effect = lambda symbols: time.sleep(0.5) or {'TCS.NS': 3600.0}
+        started = time.perf_counter()
+        holding = self._holding(100)
+        self.assertLess(time.perf_counter() - started, 0.45)
+        self.assertEqual((holding['current_price'], holding['stale']), (3500.0, True))
+        self.assertGreaterEqual(holding['price_age_seconds'], 600)
+        time.sleep(0.6) # let the background refresh finish before the tables are flushed
+
+
+class PortfolioValuationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='dave', password='password123')
+        self.client.force_login(self.user)
+
+    def _add(self, symbol, qty, price, sector=None, asset_type='STOCK'):
+        asset = Asset.objects.create(symbol=symbol, name=symbol, sector=sector, asset_type=asset_type, last_price=price)
+        return Holding.objects.create(user=self.user, asset=asset, quantity=qty, avg_buy_price=price / 2)
+
+    def _portfolio_queries(self):
+        self.client.get('/api/portfolio/holdings/') # warm: the first call also enqueues the day's backfill
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/portfolio/holdings/').status_code, 200)
+        return len(queries)
+
+    def test_one_query_shared_by_all_consumers(self):
+        """Test that valuation is one grouped query and the analytics consumers reuse it."""
+        self._add('TCS.NS', 2, 3500, sector='IT')
+        self._add('GOLDBEES.NS', 10, 60, sector='Other', asset_type='ETF')
+
+        with self.assertNumQueries(1):
+            valuation = value_portfolio(self.user)
+        self.assertEqual((valuation.total_value, valuation.total_invested), (7600.0, 3800.0))
+
+        with self.assertNumQueries(0):
+            sectors = get_sector_split(self.user, valuation)
+            self.assertEqual(calculate_health_score(self.user, valuation), 65) # TCS > 40%, < 3 sectors
+        self.assertEqual([s['name'] for s in sectors], ['IT', 'ETF'])
+        with self.assertNumQueries(1): # just the transactions (no position predates the 1Y/3Y cutoffs)
+            compute_xirr(self.user, valuation)
+
+    def test_holdings_endpoint_query_count_is_fixed(self):
+        """Test that listing 10 holdings costs the same queries as listing 1 (no N+1)."""
+        self._add('TCS.NS', 1, 3500)
+        one = self._portfolio_queries()
+        for i in range(9):
+            self._add(f"S{i}.NS", 1, 100)
+        self.assertEqual(self._portfolio_queries(), one)
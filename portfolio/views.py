@@ -1,17 +1,20 @@
 import logging
 import json
 import  threading
-import requests , zoneinfo
-from datetime import date, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
 from analytics.services.backfill import get_last_snapshot_date
+from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.core.management import call_command
 from django.core.cache import cache
 from django.utils import timezone
-import yfinance as yf
-from analytics.signals import executor, run_backfill_in_background
+from analytics.services.jobs import enqueue_backfill
+from analytics.services.xirr_engine import get_xirr
+from core.utils import get_logical_date
+from core.providers.routing import get_price_provider
 from .models import Asset, Holding, Transaction
+from .services.live_prices import is_stale, refresh_prices
+from .services.valuation import value_portfolio
 
 
 logger = logging.getLogger(__name__)
@@ -69,24 +72,17 @@ def search_asset(request):
     if len(results) < 3 and len(query) > 2:
         try:
             yahoo_symbol = f"{query}.NS" if not ("-" in query or "." in query) else query
-            ticker = yf.Ticker(yahoo_symbol)
-            
-            try:
-                full_info = ticker.info
-                price = full_info.get('currentPrice') or full_info.get('regularMarketPreviousClose')
-                name = full_info.get('longName', query)
-                sector = full_info.get('sector', 'Other')
-                mcap = full_info.get('marketCap', 0)
-                mcap_cat = 'LARGE' if mcap > 200000000000 else 'MID' if mcap > 50000000000 else 'SMALL'
-            except:
-                full_info = {}
-                price = ticker.fast_info.last_price
-                name = query
-                sector = 'Other'
-                mcap_cat = 'MID'
-
-            if price and price > 0:
-                detected_type = detect_asset_type(full_info, str(yahoo_symbol), name)
+            info = get_price_provider().get_info(yahoo_symbol)
+
+            if info:
+                price, name, sector = info['price'], info['name'], info['sector']
+                mcap = info.get('market_cap')
+                if mcap is None:
+                    mcap_cat = 'MID'
+                else:
+                    mcap_cat = 'LARGE' if mcap > 200000000000 else 'MID' if mcap > 50000000000 else 'SMALL'
+
+                detected_type = detect_asset_type(info, str(yahoo_symbol), name)
                 new_asset = Asset.objects.create(
                     symbol=yahoo_symbol, name=name, last_price=price,
                     asset_type=detected_type, sector=sector, market_cap_category=mcap_cat
@@ -98,141 +94,53 @@ def search_asset(request):
     return JsonResponse(results, safe=False)
 
 
-# Threading Helper
-def fetch_mf_price(asset):
-    """
-    Fetch a single Mutual Fund price from MFAPI.in.
-    Designed to run in a thread pool.
-    """
+def _refresh_wait_ms(request):
+    """Deadline for the synchronous refresh: `?wait_ms=` (capped) or PRICE_REFRESH_WAIT_MS, 0 = don't wait."""
     try:
-        # 5 second timeout to prevent blocking
-        response = requests.get(f"https://api.mfapi.in/mf/{asset.symbol}", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('data'):
-                latest_nav = float(data['data'][0]['nav']) # 0 is latest date
-                return asset, latest_nav
-    except Exception as e:
-        logger.error(f"MFAPI Failed {asset.symbol}: {e}")
-    return asset, None
+        wait_ms = int(request.GET.get('wait_ms', settings.PRICE_REFRESH_WAIT_MS))
+    except ValueError:
+        wait_ms = settings.PRICE_REFRESH_WAIT_MS
+    return min(max(wait_ms, 0), settings.PRICE_REFRESH_MAX_WAIT_MS)
 
 
-# Price Update Engine
-def update_live_prices(holdings):
-    """
-    Update asset prices using a hybrid strategy:
-    - Yahoo Finance (Batch) for Stocks/Crypto
-    - MFAPI.in (Parallel Threads) for Mutual Funds
-    """
-    ist = zoneinfo.ZoneInfo('Asia/Kolkata')  #to get the timezone stamp of india
-
-    now_utc = timezone.now() #the system timezone in UTC
-    stock_cooldown_time = now_utc - timedelta(minutes=5)
-    # mf_cooldown_time = now - timedelta(hours=21) ( not need removed)
-    
-    # if we set a direct delta then a bug may apear becuase if suppose a user updated the price of mf at 23:10 pm and a
-    # timer for 21 is set from that time then the next day the price wont get updated for the whole day to fix this we
-    # need to make sure we check the date only like if date is greater than date then we run the mf update price
-
-    yahoo_assets = []
-    yahoo_symbols = []
-    mf_assets = []
-
-    # Filter Assets requiring update
-    for h in holdings:
-        asset = h.asset
-        is_pricing_missing = asset.last_price == 0
-
-        if asset.symbol.isdigit():  # MF request
-             # Define "start of today" in IST
-            midnight_ist = now_utc.astimezone(ist).replace(
-                hour=4, minute=0, second=0, microsecond=0
-            )
-
-            # Refresh needed if:
-            # - price missing
-            # - last update happened before today's midnight IST
-            last_update_ist = asset.updated_at.astimezone(ist)
-
-            # Compare "Indian Days" in ist not UTC 
-            if is_pricing_missing or last_update_ist<midnight_ist:
-                mf_assets.append(asset)
-        else:
-            # Stock/Crypto request
-            if is_pricing_missing or asset.updated_at < stock_cooldown_time:
-                yahoo_assets.append(asset)
-                yahoo_symbols.append(asset.symbol)
-        
-    if not yahoo_assets and not mf_assets:
-        logger.info("All assets are fresh. Skipping update.")
-        return
-
-    logger.info(f"Updating: {len(yahoo_assets)} via Yahoo, {len(mf_assets)} via MFAPI parallel...")
-    updated_assets = []
-
-    # 1. Yahoo Finance (Batch Fetch)
-    if yahoo_assets:
-        try:
-            tickers = yf.Tickers(" ".join(yahoo_symbols))
-            for asset in yahoo_assets:
-                try:
-                    latest_price = tickers.tickers[asset.symbol].fast_info.last_price
-                    if latest_price and latest_price > 0:
-                        asset.last_price = latest_price
-                        asset.updated_at = timezone.now()
-                        updated_assets.append(asset)
-                except Exception:
-                   logger.warning(f"Failed to fetch {asset.symbol}")
-        except Exception as e:
-            logger.error(f"Yahoo Batch Failed: {e}")
-
-    # 2. MFAPI.IN (Parallel Threads)
-    if mf_assets:
-        with ThreadPoolExecutor(max_workers=10) as mf_executor:
-            future_to_asset = {mf_executor.submit(fetch_mf_price, asset): asset for asset in mf_assets}
-            
-            for future in as_completed(future_to_asset):
-                asset, price = future.result()
-                if price:
-                    asset.last_price = price
-                    asset.updated_at = timezone.now()
-                    updated_assets.append(asset)
-                    logger.info(f"MFAPI Updated {asset.symbol}: {price}")
-
-    # Bulk Save
-    if updated_assets:
-        Asset.objects.bulk_update(updated_assets, ['last_price', 'updated_at'])
-        logger.info(f"Saved {len(updated_assets)} prices to DB.")
-
 # Get Portfolio API
 def get_portfolio(request):
     """
     Retrieve the user's portfolio with live calculations.
-    Triggers a price update if data is stale.
+
+    Prices are kept fresh by the `refresh_prices` daemon, so by default this endpoint does no provider I/O.
+    - PRICE_REFRESH_ON_READ: also kicks off a background refresh of stale prices (old behaviour).
+    - Deadline mode (`?wait_ms=300` or PRICE_REFRESH_WAIT_MS): refreshes stale prices and waits up to
+      that long for them (attaching to refreshes already in flight). Whatever is fresh by the deadline is
+      served, the rest keeps updating in the background.
+    Every holding reports `price_age_seconds` and `stale` so the UI can tell which is which.
     """
     if not request.user.is_authenticated:
         return JsonResponse({"error": "Authentication required"}, status=401)
 
-    # Get User's Holdings
-    holdings = Holding.objects.filter(user=request.user).select_related('asset')
+    # Get User's Holdings, valued in one query
+    valuation = value_portfolio(request.user)
+    wait_ms = _refresh_wait_ms(request)
     
     # Update prices if needed
-    if holdings:
-        thread = threading.Thread(
-            target=update_live_prices,
-            args=(holdings,),
-            daemon=True
-        )
-        thread.start()
-
-        # Refresh from DB
-        holdings = Holding.objects.filter(user=request.user).select_related('asset')
+    if valuation:
+        stale_assets = [a for a in valuation.assets() if is_stale(a)]
+        if stale_assets and (settings.PRICE_REFRESH_ON_READ or wait_ms):
+            thread = threading.Thread(
+                target=refresh_prices,
+                args=(stale_assets,),
+                daemon=True
+            )
+            thread.start()
+            if wait_ms:
+                thread.join(timeout=wait_ms / 1000)
+                # Revalue: whatever the refresh saved before the deadline is served now
+                valuation = value_portfolio(request.user)
 
         # backfill trigger logic for daily update
-        ist = zoneinfo.ZoneInfo('Asia/Kolkata')
-        now_ist = timezone.now().astimezone(ist)
         # we only update the snapshots when its <4am of the current day !!
-        logical_date = now_ist.date() if now_ist.hour>=4 else(now_ist-timedelta(days=1)).date()
+        # (normally the nightly `snapshot_daily` command has already appended the day)
+        logical_date = get_logical_date()
         # asking analyti
         last_snapshot_date = get_last_snapshot_date(request.user)
         needs_update = True
@@ -240,34 +148,40 @@ def get_portfolio(request):
             needs_update = False
         execution_lock_key = f"backfill_exec_lock_{request.user.id}"
 
-        if needs_update and not cache.get(execution_lock_key):
-            cache.set(execution_lock_key,"true", timeout=60)
-            executor.submit(run_backfill_in_background,request.user)
+        if needs_update and cache.add(execution_lock_key, "true", timeout=60):
+            # Only the days since the last snapshot need computing (incremental append)
+            enqueue_backfill(request.user, last_snapshot_date)
 
     data = []
     total_value = 0
     total_invested = 0
+    now = timezone.now()
+    # Per-holding and per-period XIRR in one batch, cached until the data changes
+    xirr_report = get_xirr(request.user, valuation) if valuation else {'portfolio': {}, 'holdings': {}}
     
-    for h in holdings:
-        current_val = h.current_value()
-        invested_val = float(h.quantity * h.avg_buy_price)
+    for h, asset in zip(valuation.holdings, valuation.assets()):
+        current_val = round(h['value'], 2)
+        invested_val = h['invested']
         profit = current_val - invested_val
         profit_pct = (profit / invested_val * 100) if invested_val > 0 else 0
             
         data.append({
-            "id": h.asset.id,
-            "symbol": h.asset.symbol,
-            "name": h.asset.name,
-            "type": h.asset.asset_type,
-            "sector": h.asset.sector,
-            "market_cap_category": h.asset.market_cap_category,
-            "qty": float(h.quantity),
-            "avg_price": float(h.avg_buy_price),
-            "current_price": float(h.asset.last_price),
+            "id": h['asset_id'],
+            "symbol": h['symbol'],
+            "name": h['name'],
+            "type": h['asset_type'],
+            "sector": h['sector'],
+            "market_cap_category": h['market_cap_category'],
+            "qty": h['quantity'],
+            "avg_price": round(invested_val / h['quantity'], 2) if h['quantity'] else 0.0,
+            "current_price": float(h['last_price']),
+            "price_age_seconds": max(int((now - h['updated_at']).total_seconds()), 0),
+            "stale": is_stale(asset, now),
             "current_value": current_val,
             "invested_value": round(invested_val, 2),
             "profit": round(profit, 2),
-            "profit_pct": round(profit_pct, 2)
+            "profit_pct": round(profit_pct, 2),
+            "xirr": xirr_report['holdings'].get(h['asset_id'], {}),
         })
         
         total_value += current_val
@@ -283,7 +197,8 @@ def get_portfolio(request):
             "total_value": round(total_value, 2),
             "total_invested": round(total_invested, 2),
             "total_profit": round(total_profit, 2),
-            "total_profit_pct": round(total_profit_pct, 2)
+            "total_profit_pct": round(total_profit_pct, 2),
+            "xirr": xirr_report['portfolio'],
         }
     })
 